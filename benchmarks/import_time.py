@@ -0,0 +1,47 @@
+"""
+Measures the start up time of honcore: how long `import honcore.client` takes
+in a fresh interpreter.
+
+Usage:
+    python benchmarks/import_time.py [runs]
+
+The first run is not counted, it only writes the .pyc files the other runs load.
+The modules listed are the slow to import ones which honcore should not load.
+"""
+
+import os, sys, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = r"""
+import sys, time
+start = time.time()
+import honcore.client
+elapsed = time.time() - start
+heavy = ['pdb', 'inspect', 'construct.formats', 'construct.protocols', 'construct.text']
+loaded = [name for name in heavy if name in sys.modules or 'honcore.lib.' + name in sys.modules]
+print elapsed * 1000, ' '.join(loaded)
+"""
+
+def run():
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=ROOT, env=env)
+    fields = output.split()
+    return float(fields[0]), fields[1:]
+
+def main(runs=20):
+    run()
+    timings = []
+    for i in xrange(runs):
+        elapsed, loaded = run()
+        timings.append(elapsed)
+    timings.sort()
+    print "import honcore.client, %d runs" % runs
+    print "  min:    %.2f ms" % timings[0]
+    print "  median: %.2f ms" % timings[len(timings) // 2]
+    print "  max:    %.2f ms" % timings[-1]
+    print "  slow modules loaded: %s" % (', '.join(loaded) or 'none')
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -3,50 +3,85 @@ HoNCore. Python library providing connectivity and functionality
 with HoN's chat server.
 """
 
-import sys, struct, socket, time
+import sys, struct, socket, time, threading, asyncore, collections
 import deserialise, common
 from requester import Requester
-from networking import ChatSocket
+from networking import ChatSocket, AsyncChatSocket, LazyList
+from scheduler import MessageScheduler
+from executor import HandlerPool, PendingRequests, Future
+from encoders import *
 from constants import *
 from exceptions import *
 
-__all__ = ['HoNClient']
+__all__ = ['HoNClient', 'AsyncHoNClient']
 
 _config_defaults = {
     "chatport" : 11031, 
     "protocol" : 21, 
     "invis" : False,
+    "dispatcher" : "thread",
+    "dispatch_workers" : 4,
+    "dispatch_queue_size" : 1000,
+    "dispatch_key" : "channel",
+    "multiplexer" : None,
+    "send_queue" : False,
+    "throttle" : False,
+    "throttle_rate" : 1.0,
+    "throttle_burst" : 3,
+    "throttle_global_rate" : 5.0,
+    "throttle_global_burst" : 10,
+    "throttle_merge" : False,
+    "lazy_payloads" : False,
+    "fast_decoders" : True,
+    "handler_workers" : 4,
+    "request_timeout" : 10.0,
+    "whisper_timeout" : 2.0,
 }
 
 class HoNClient(object):    
     def __init__(self):
-        self.config = _config_defaults
+        self.config = dict(_config_defaults)
+        self.__handler_pool = HandlerPool(self.config['handler_workers'])
         self.__events = {}
         self.__create_events()
         self.__setup_events()
-        self.__chat_socket = ChatSocket(self.__events)
+        self.__chat_socket = self._create_chat_socket(self.__events)
         self.__listener = None
         self.__requester = Requester()
+        self.__scheduler = None
+        self.__requests = PendingRequests()   # Requests waiting for a reply from the chat server.
         self.account = None
         self.__channels = {}
         self.__users = {}
+        self.__rosters = {}     # The latest channel roster not yet decoded by channel ID, see __merge_rosters.
+
+    def _create_chat_socket(self, events):
+        """ Creates the chat socket used by the client. """
+        return ChatSocket(events, self.config)
 
     def __create_events(self):
         """ Create each event that can be triggered by the client.
             As more packets are reverse engineered they should be added here so that 
             the client can handle them.
         """
-        self.__events[HON_SC_AUTH_ACCEPTED] = Event("Auth Accepted", HON_SC_AUTH_ACCEPTED)
-        self.__events[HON_SC_PING] = Event("Ping", HON_SC_PING)
-        self.__events[HON_SC_CHANNEL_MSG] = Event("Channel Message", HON_SC_CHANNEL_MSG)
-        self.__events[HON_SC_JOINED_CHANNEL] = Event("Join Channel", HON_SC_JOINED_CHANNEL)
-        self.__events[HON_SC_ENTERED_CHANNEL] = Event("Entered Channel", HON_SC_ENTERED_CHANNEL)
-        self.__events[HON_SC_LEFT_CHANNEL] = Event("Left Channel", HON_SC_LEFT_CHANNEL)
-        self.__events[HON_SC_WHISPER] = Event("Whisper", HON_SC_WHISPER)
-        self.__events[HON_SC_PM] = Event("Private Message", HON_SC_PM)
-        self.__events[HON_SC_MESSAGE_ALL] = Event("Server Message", HON_SC_MESSAGE_ALL)
-        self.__events[HON_SC_TOTAL_ONLINE] = Event("Total Online", HON_SC_TOTAL_ONLINE)
-        self.__events[HON_SC_PACKET_RECV] = Event("Packet Received", HON_SC_PACKET_RECV)
+        self.__events[HON_SC_AUTH_ACCEPTED] = Event("Auth Accepted", HON_SC_AUTH_ACCEPTED, pool=self.__handler_pool)
+        self.__events[HON_SC_PING] = Event("Ping", HON_SC_PING, pool=self.__handler_pool)
+        self.__events[HON_SC_CHANNEL_MSG] = Event("Channel Message", HON_SC_CHANNEL_MSG, key='channel_id', pool=self.__handler_pool)
+        self.__events[HON_SC_JOINED_CHANNEL] = Event("Join Channel", HON_SC_JOINED_CHANNEL, key='channel_id', pool=self.__handler_pool)
+        self.__events[HON_SC_ENTERED_CHANNEL] = Event("Entered Channel", HON_SC_ENTERED_CHANNEL, key='channel_id', pool=self.__handler_pool)
+        self.__events[HON_SC_LEFT_CHANNEL] = Event("Left Channel", HON_SC_LEFT_CHANNEL, key='channel_id', pool=self.__handler_pool)
+        self.__events[HON_SC_WHISPER] = Event("Whisper", HON_SC_WHISPER, key='player', pool=self.__handler_pool)
+        self.__events[HON_SC_WHISPER_FAILED] = Event("Whisper Failed", HON_SC_WHISPER_FAILED, pool=self.__handler_pool)
+        self.__events[HON_SC_USER_INFO_NO_EXIST] = Event("User Info No Exist", HON_SC_USER_INFO_NO_EXIST, pool=self.__handler_pool)
+        self.__events[HON_SC_USER_INFO_OFFLINE] = Event("User Info Offline", HON_SC_USER_INFO_OFFLINE, pool=self.__handler_pool)
+        self.__events[HON_SC_USER_INFO_ONLINE] = Event("User Info Online", HON_SC_USER_INFO_ONLINE, pool=self.__handler_pool)
+        self.__events[HON_SC_USER_INFO_IN_GAME] = Event("User Info In Game", HON_SC_USER_INFO_IN_GAME, pool=self.__handler_pool)
+        self.__events[HON_SC_CHANNEL_BANNED] = Event("Channel Banned", HON_SC_CHANNEL_BANNED, pool=self.__handler_pool)
+        self.__events[HON_SC_JOIN_CHANNEL_PASSWORD] = Event("Join Channel Password", HON_SC_JOIN_CHANNEL_PASSWORD, pool=self.__handler_pool)
+        self.__events[HON_SC_PM] = Event("Private Message", HON_SC_PM, key='player', pool=self.__handler_pool)
+        self.__events[HON_SC_MESSAGE_ALL] = Event("Server Message", HON_SC_MESSAGE_ALL, pool=self.__handler_pool)
+        self.__events[HON_SC_TOTAL_ONLINE] = Event("Total Online", HON_SC_TOTAL_ONLINE, pool=self.__handler_pool)
+        self.__events[HON_SC_PACKET_RECV] = Event("Packet Received", HON_SC_PACKET_RECV, pool=self.__handler_pool)
 
     def __setup_events(self):
         """ Transparent handling of some data is needed so that the client
@@ -54,9 +89,17 @@ class HoNClient(object):
         """
         self.connect_event(HON_SC_JOINED_CHANNEL, self.__on_joined_channel, priority=1)
         self.connect_event(HON_SC_ENTERED_CHANNEL, self.__on_entered_channel, priority=1)
+        self.connect_event(HON_SC_CHANNEL_BANNED, self.__on_channel_banned, priority=1)
+        self.connect_event(HON_SC_JOIN_CHANNEL_PASSWORD, self.__on_join_channel_password, priority=1)
+        self.connect_event(HON_SC_WHISPER_FAILED, self.__on_whisper_failed, priority=1)
+        self.connect_event(HON_SC_USER_INFO_NO_EXIST, self.__on_user_info_no_exist, priority=1)
+        self.connect_event(HON_SC_USER_INFO_OFFLINE, self.__on_user_info_offline, priority=1)
+        self.connect_event(HON_SC_USER_INFO_ONLINE, self.__on_user_info_online, priority=1)
+        self.connect_event(HON_SC_USER_INFO_IN_GAME, self.__on_user_info_in_game, priority=1)
 
     def __on_initial_statuses(self, users):
         """ Sets the status and flags for each user. """
+        self.__merge_rosters()
         for account_id in users:
             if account_id in self.__users:
                 user = self.__users[account_id]
@@ -68,10 +111,52 @@ class HoNClient(object):
             contained in a hash table/dict so they can be looked up later when needed.
         """
         self.__channels[channel_id] = channel
+        self.__requests.set_result((HON_CS_JOIN_CHANNEL, channel.lower()), channel_id)
+        if isinstance(users, LazyList) and not users.is_decoded:
+            # Leave decoding the roster until a user is looked up. It replaces any earlier
+            # roster of the channel, which is out of date, so only one per channel is kept.
+            self.__rosters[channel_id] = users
+            return
+        self.__add_users(users)
+
+    def __on_channel_banned(self, channel):
+        self.__requests.set_exception((HON_CS_JOIN_CHANNEL, channel.lower()), ChatServerError(211))
+
+    def __on_join_channel_password(self, channel):
+        self.__requests.set_exception((HON_CS_JOIN_CHANNEL, channel.lower()), ChatServerError(212))
+
+    def __on_whisper_failed(self):
+        # The packet does not name the player, so the failure is put down to the oldest whisper still waiting.
+        self.__requests.set_exception((HON_CS_WHISPER,), ChatServerError(213))
+
+    def __on_user_info_no_exist(self, nickname):
+        self.__requests.set_exception((HON_CS_USER_INFO, nickname.lower()), ChatServerError(214))
+
+    def __on_user_info_offline(self, nickname):
+        self.__requests.set_result((HON_CS_USER_INFO, nickname.lower()), HON_STATUS_OFFLINE)
+
+    def __on_user_info_online(self, nickname):
+        self.__requests.set_result((HON_CS_USER_INFO, nickname.lower()), HON_STATUS_ONLINE)
+
+    def __on_user_info_in_game(self, nickname):
+        self.__requests.set_result((HON_CS_USER_INFO, nickname.lower()), HON_STATUS_INGAME)
+
+    def __add_users(self, users):
         for user in users:
             if user.account_id not in self.__users:
                 self.__users[user.account_id] = user
 
+    def __merge_rosters(self):
+        """ Adds the users from the channel rosters which were left to be decoded.
+            As with every roster, a user who is already known keeps their User.
+        """
+        while self.__rosters:
+            try:
+                channel_id, users = self.__rosters.popitem()
+            except KeyError:
+                break
+            self.__add_users(users)
+
     def __on_entered_channel(self, channel_id, user):
         """ Transparently add the id and nick of the user who entered the channel to
             the users dictionary.
@@ -83,11 +168,65 @@ class HoNClient(object):
         """ Set up some configuration for the client and the requester. 
             The requester configuration is not really needed, but just incase
             it does change in the future.
+
+            The dispatch settings control how received packets are handled and take 
+            effect on the next chat server connection, which raises HoNConfigError 15 if 
+            any of them is invalid.
+                `dispatcher`            "thread" to handle each packet in a new thread, or
+                                        "pool" to use a fixed pool of worker threads.
+                `dispatch_workers`      The number of worker threads in the pool.
+                `dispatch_queue_size`   The number of packets each worker can have waiting.
+                `dispatch_key`          "channel" or "account", packets with the same channel
+                                        or account ID are handled in the order received.
+                `multiplexer`           A SessionMultiplexer to read the chat socket, instead of
+                                        a SocketListener thread.
+                `send_queue`            If True packets are queued and sent by a PacketWriter
+                                        thread, with pongs and authentication sent first.
+
+            The throttle settings limit the rate of channel messages, whispers and private 
+            messages, see MessageScheduler. New rates also apply to the messages already queued.
+                `throttle`              If True messages are queued and sent within the rates below.
+                `throttle_rate`         Messages per second to each channel or player.
+                `throttle_burst`        Messages which can be sent at once to each channel or player.
+                `throttle_global_rate`  Messages per second in total.
+                `throttle_global_burst` Messages which can be sent at once in total.
+                `throttle_merge`        If True messages queued for the same channel or player
+                                        are merged into one.
+
+            `lazy_payloads` If True, the users and operators of joined channels and the users of 
+                            initial statuses are passed to handlers as LazyLists, which are only 
+                            decoded when they are first used.
+            `fast_decoders` Which packets are read by the fast decoders rather than construct,
+                            True for all of those with a fast decoder, or a list of packet IDs.
+            `handler_workers` The number of worker threads running the handlers connected with 
+                            `executor='pool'`, see HandlerPool. Takes effect when the pool is 
+                            next started.
+            `request_timeout` The seconds to wait for the reply to a channel join or user info 
+                            request before its future fails.
+            `whisper_timeout` The seconds after which a whisper which has not failed is taken
+                            to have been delivered, as the server only replies to failed whispers.
         """
         config_map = {
             "chatport" : self.config,
             "protocol" : self.config,
             "invis" : self.config,
+            "dispatcher" : self.config,
+            "dispatch_workers" : self.config,
+            "dispatch_queue_size" : self.config,
+            "dispatch_key" : self.config,
+            "multiplexer" : self.config,
+            "send_queue" : self.config,
+            "throttle" : self.config,
+            "throttle_rate" : self.config,
+            "throttle_burst" : self.config,
+            "throttle_global_rate" : self.config,
+            "throttle_global_burst" : self.config,
+            "throttle_merge" : self.config,
+            "lazy_payloads" : self.config,
+            "fast_decoders" : self.config,
+            "handler_workers" : self.config,
+            "request_timeout" : self.config,
+            "whisper_timeout" : self.config,
             "masterserver" : self.__requester.config,
             "basicserver" : self.__requester.config,
             "honver" : self.__requester.config
@@ -97,6 +236,13 @@ class HoNClient(object):
             if kwarg in config_map:
                 config_map[kwarg][kwarg] = kwargs[kwarg]
 
+        # The running scheduler takes the new rates in place, keeping the messages it has queued.
+        if self.__scheduler is not None and any(kwarg.startswith("throttle") for kwarg in kwargs):
+            self.__scheduler.configure(self.config['throttle_rate'], self.config['throttle_burst'],
+                                       self.config['throttle_global_rate'], self.config['throttle_global_burst'],
+                                       self.config['throttle_merge'])
+        self.__handler_pool.size = self.config['handler_workers']
+
     """ Master server related functions. """
     def _login(self, username, password):
         """ HTTP login request to the master server.
@@ -176,11 +322,29 @@ class HoNClient(object):
             Connects that chat socket to the correct address and port. Any exceptions are raised to the top method.
             Finally sends a valid authentication packet. Any exceptions are raised to the top method.
         """
+        self._chat_open()
+        
+        # The idea is to give 10 seconds for the chat server to respond to the authentication request.
+        # If it is accepted, then the `is_authenticated` flag will be set to true.
+        # NOTE: Lag will make this sort of iffy....
+        attempts = 1
+        while attempts is not 10:
+            if self.__chat_socket.is_authenticated:
+                return True
+            else:
+                time.sleep(1)
+                attempts += 1
+        raise ChatServerError(200) # Server did not respond to the authentication request 
+
+    def _chat_open(self):
+        """ Connects the chat socket and sends the authentication request, without waiting for
+            the chat server to accept it.
+        """
         if self.account == None or self.account.cookie == None or self.account.auth_hash == None:
             raise ChatServerError(205)
        
         if self.__chat_socket is None:
-            self.__chat_socket = ChatSocket(self.events)
+            self.__chat_socket = self._create_chat_socket(self.__events)
         try:
             self.__chat_socket.connect(self.account.chat_url, self.config['chatport']) # Basic connection to the socket
         except HoNCoreError as e:
@@ -196,27 +360,35 @@ class HoNClient(object):
         except ChatServerError:
             raise # Re-raise the exception.
         
-        # The idea is to give 10 seconds for the chat server to respond to the authentication request.
-        # If it is accepted, then the `is_authenticated` flag will be set to true.
-        # NOTE: Lag will make this sort of iffy....
-        attempts = 1
-        while attempts is not 10:
-            if self.__chat_socket.is_authenticated:
-                return True
-            else:
-                time.sleep(1)
-                attempts += 1
-        raise ChatServerError(200) # Server did not respond to the authentication request 
-        
     def _chat_disconnect(self):
         """ Disconnect gracefully from the chat server and close & remove the socket."""
-        if self.__chat_socket is not None:
-            self.__chat_socket.connected = False # Safer to stop the thread with this first.
-            try:
-                self.__chat_socket.socket.shutdown(socket.SHUT_RDWR)
-                self.__chat_socket.socket.close()
-            except socket.error:
-                raise ChatServerError(209)
+        if self.__scheduler is not None:
+            self.__scheduler.stop()
+            if self.__scheduler is not threading.current_thread():
+                self.__scheduler.join()
+            self.__scheduler = None
+        self.__handler_pool.stop()
+        try:
+            if self.__chat_socket is not None:
+                try:
+                    self.__chat_socket.disconnect()
+                except HoNCoreError:
+                    raise ChatServerError(209)
+        finally:
+            # Failed once the socket is closed, so their callbacks can not send any more requests.
+            self.__requests.fail_all(ChatServerError(215)) # Connection was closed before the reply arrived.
+
+    @property
+    def packets_received(self):
+        """ The number of packets received by the chat socket. """
+        return self.__chat_socket.packets_received
+
+    @property
+    def packet_counts(self):
+        """ The number of packets received from the chat server by packet ID, including 
+            the packets which were not decoded as nothing was connected to their event.
+        """
+        return self.__chat_socket.packet_counts
 
     @property
     def is_logged_in(self):
@@ -299,14 +471,55 @@ class HoNClient(object):
         return motd
 
     """ The core client functions."""
+    def __get_scheduler(self):
+        """ Returns the message scheduler, creating and starting it if needed, or None
+            if throttling is disabled.
+        """
+        if not self.config['throttle']:
+            return None
+        if self.__scheduler is None:
+            self.__scheduler = MessageScheduler(self.__chat_socket.send, self.config['throttle_rate'], 
+                                                self.config['throttle_burst'], self.config['throttle_global_rate'],
+                                                self.config['throttle_global_burst'], self.config['throttle_merge'])
+            self.__scheduler.start()
+        return self.__scheduler
+
     def send_channel_message(self, message, channel_id):
         """ Sends a message to a specified channel.
             Takes 2 parameters.
                 `message`   The message to be send.
                 `channel_id`   The id of the channel to send it to.
         """
-        # TODO: Implement throttling for messages.
-        self.__chat_socket.send_channel_message(message, channel_id)
+        scheduler = self.__get_scheduler()
+        if scheduler is not None:
+            scheduler.submit((HON_CS_CHANNEL_MSG, channel_id), message, 
+                             lambda message: encode_channel_message(message, channel_id))
+        else:
+            self.__chat_socket.send_channel_message(message, channel_id)
+
+    def __request(self, key, send, timeout, **kwargs):
+        """ Returns the future for a request, which is sent by calling `send`. """
+        future = self.__requests.add(key, timeout, **kwargs)
+        try:
+            send()
+        except:
+            self.__requests.remove(key, future)
+            raise
+        return future
+
+    def __scheduled_request(self, key, submit, timeout, **kwargs):
+        """ Returns the future for a request which is queued by calling `submit` with its `sent` 
+            callback. The future only waits for a reply, and its timeout only starts, once the 
+            scheduler sends the request, so a reply can not be taken for one still queued.
+        """
+        future = Future(**kwargs)
+        def sent(error):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                self.__requests.add_future(key, future, timeout)
+        submit(sent)
+        return future
 
     def join_channel(self, channel, password=None):
         """ Sends a request to join a channel.
@@ -314,19 +527,130 @@ class HoNClient(object):
             Takes 2 paramters.
                 `channel`   A string containing the channel name.
                 `password`  The optional password required to join the channel.
+
+            Returns a Future of the channel's ID, which fails with ChatServerError 211 if the 
+            user is banned from the channel, or 212 if the channel needs a password.
+            When throttling is enabled the request is sent within the global message rate.
         """
+        scheduler = self.__get_scheduler()
+        if scheduler is not None:
+            if password:
+                packet = encode_join_channel_password(channel, password)
+            else:
+                packet = encode_join_channel(channel)
+            send = lambda sent: scheduler.submit_packet((HON_CS_JOIN_CHANNEL, channel), packet, sent)
+            return self.__scheduled_request((HON_CS_JOIN_CHANNEL, channel.lower()), send, self.config['request_timeout'])
         if password:
-            self.__chat_socket.send_join_channel_password(channel, password)
-        elif not password:
-            self.__chat_socket.send_join_channel(channel)
+            send = lambda: self.__chat_socket.send_join_channel_password(channel, password)
+        else:
+            send = lambda: self.__chat_socket.send_join_channel(channel)
+        return self.__request((HON_CS_JOIN_CHANNEL, channel.lower()), send, self.config['request_timeout'])
+
+    def join_channels(self, channels, passwords=None, max_in_flight=10):
+        """ Joins many channels at once, such as after connecting, without waiting for each
+            channel to be joined before requesting the next.
+
+            Takes 3 parameters.
+                `channels`      A list of the channel names.
+                `passwords`     An optional dict of the passwords of the channels which need one.
+                `max_in_flight` The most join requests waiting for their reply at any time. 
+                                Another request is sent as each reply arrives.
+
+            Returns a Future which resolves once every channel has been joined or has failed to be,
+            with a dict of the following:
+                `joined`    A dict of the IDs of the channels joined, by name.
+                `failed`    A dict of the exceptions the other channels failed with, by name.
+                `elapsed`   The seconds taken from the first request to the last reply.
+        """
+        passwords = passwords or {}
+        waiting = collections.deque(channels)
+        results = {'joined': {}, 'failed': {}, 'elapsed': None}
+        remaining = [len(waiting)]
+        lock = threading.Lock()
+        done = Future()
+        start = time.time()
+
+        def finished(channel, future):
+            exception = future.exception()
+            with lock:
+                if exception is None:
+                    results['joined'][channel] = future.result()
+                else:
+                    results['failed'][channel] = exception
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            results['elapsed'] = time.time() - start
+            done.set_result(results)
+
+        def reply(channel, future):
+            finished(channel, future)
+            join_next()
+
+        def join_next():
+            while True:
+                with lock:
+                    if not waiting:
+                        return
+                    if self.__chat_socket is None or not self.__chat_socket.is_connected:
+                        # The connection is gone, so are the channels which were not requested yet.
+                        given_up = list(waiting)
+                        waiting.clear()
+                    else:
+                        given_up = None
+                        channel = waiting.popleft()
+                if given_up is not None:
+                    for channel in given_up:
+                        future = Future()
+                        future.set_exception(ChatServerError(215)) # Connection was closed before the reply arrived.
+                        finished(channel, future)
+                    return
+                try:
+                    future = self.join_channel(channel, passwords.get(channel))
+                except Exception, e:
+                    # Could not be sent, the channel is given up on and the next one tried.
+                    future = Future()
+                    future.set_exception(e)
+                    finished(channel, future)
+                    continue
+                future.add_done_callback(lambda future, channel=channel: reply(channel, future))
+                return
+
+        if not waiting:
+            results['elapsed'] = 0.0
+            done.set_result(results)
+        for i in range(min(max_in_flight, len(waiting))):
+            join_next()
+        return done
 
     def send_whisper(self, player, message):
         """ Sends the message to the player.
             Takes 2 parameters.
                 `player`    A string containing the player's name.
                 `message`   A string containing the message.
+
+            Returns a Future which fails with ChatServerError 213 if the player is not online. 
+            The server does not reply to whispers which are delivered, so the future resolves 
+            with True once `whisper_timeout` seconds pass without a failure.
+        """
+        scheduler = self.__get_scheduler()
+        if scheduler is not None:
+            send = lambda sent: scheduler.submit((HON_CS_WHISPER, player), message, 
+                                                 lambda message: encode_whisper(player, message), sent)
+            return self.__scheduled_request((HON_CS_WHISPER,), send, self.config['whisper_timeout'], expired_result=True)
+        return self.__request((HON_CS_WHISPER,), lambda: self.__chat_socket.send_whisper(player, message), 
+                              self.config['whisper_timeout'], expired_result=True)
+
+    def send_user_info(self, player):
+        """ Requests the status of the player.
+            Takes 1 parameter.
+                `player`    A string containing the player's name.
+
+            Returns a Future of the player's status, either HON_STATUS_OFFLINE, HON_STATUS_ONLINE or 
+            HON_STATUS_INGAME, which fails with ChatServerError 214 if the player does not exist.
         """
-        self.__chat_socket.send_whisper(player, message)
+        return self.__request((HON_CS_USER_INFO, player.lower()), lambda: self.__chat_socket.send_user_info(player),
+                              self.config['request_timeout'])
 
     def send_private_message(self, player, message):
         """ Sends the message to the player.
@@ -334,22 +658,60 @@ class HoNClient(object):
                 `player`    A string containing the player's name.
                 `message`   A string containing the message.
         """
-        self.__chat_socket.send_private_message(player, message)
+        scheduler = self.__get_scheduler()
+        if scheduler is not None:
+            scheduler.submit((HON_CS_PM, player), message, lambda message: encode_private_message(player, message))
+        else:
+            self.__chat_socket.send_private_message(player, message)
+
+    def broadcast_channels(self, message, channel_ids):
+        """ Sends the same message to each of the channels.
+            Takes 2 parameters.
+                `message`       The message to be sent.
+                `channel_ids`   A list of the ids of the channels to send it to.
+            The message is encoded once and the packets are sent together in one write,
+            or queued if throttling is enabled.
+        """
+        self.__broadcast(HON_CS_CHANNEL_MSG, channel_ids, encode_channel_broadcast(message, channel_ids))
+
+    def broadcast_whisper(self, message, players):
+        """ Whispers the same message to each of the players.
+            Takes 2 parameters.
+                `message`   The message to be sent.
+                `players`   A list of the nicknames of the players to whisper.
+            The message is encoded once and the packets are sent together in one write,
+            or queued if throttling is enabled.
+        """
+        self.__broadcast(HON_CS_WHISPER, players, encode_whisper_broadcast(message, players))
+
+    def __broadcast(self, packet_id, destinations, packets):
+        scheduler = self.__get_scheduler()
+        if scheduler is not None:
+            for destination, packet in zip(destinations, packets):
+                scheduler.submit_packet((packet_id, destination), packet)
+        elif packets:
+            self.__chat_socket.send(''.join(packets))
 
     """ Utility functions """
-    def connect_event(self, event_id, method, priority=5):
-        """ Wrapper method for connecting events. """
+    def connect_event(self, event_id, method, priority=5, key=None, executor=None):
+        """ Wrapper method for connecting events. 
+            When a key is given, such as a channel ID, the method is only triggered for the
+            events with that key, see `Event`.
+            Slow methods can be connected with `executor='pool'` to be run by the worker threads
+            of the client's HandlerPool, rather than holding up the other handlers.
+        """
         try:
-            self.__events[event_id].connect(method, priority)
+            event = self.__events[event_id]
         except KeyError:
             raise HoNCoreError(13) # Unknown event ID 
+        event.connect(method, priority, key, executor)
     
-    def disconnect_event(self, event_id, method):
+    def disconnect_event(self, event_id, method, key=None):
         """ Wrapper method for disconnecting events. """
         try:
-            self.__events[event_id].disconnect(method)
+            self.__events[event_id].disconnect(method, key)
         except HoNCoreError, e:
-            if e.id == 14: # Method is not connected to this event.
+            if e.code == 14: # Method is not connected to this event.
                 raise
         except KeyError:
             raise HoNCoreError(13) # Unknown event ID
@@ -367,6 +729,7 @@ class HoNClient(object):
         """ Wrapper function to return the nickname for the user associated with that account ID.
             If no nickname was found then return None
         """
+        self.__merge_rosters()
         try:
             return self.__users[account_id].nickname
         except KeyError:
@@ -376,12 +739,14 @@ class HoNClient(object):
         """ Wrapper function to return the user object for the user associated with that account ID.
             If no user was found then return None
         """
+        self.__merge_rosters()
         try:
             return self.__users[account_id]
         except KeyError:
             return None
 
     def get_buddies(self):
+        self.__merge_rosters()
         buddies = []
         for buddy_id in self.account.buddy_list:
             buddies.append(self.__users[buddy_id])
@@ -389,9 +754,43 @@ class HoNClient(object):
 
     """ Debugging functions """
     def list_users(self):
+        self.__merge_rosters()
         for aid in self.__users:
             print self.__users[aid]
 
+class AsyncHoNClient(HoNClient):
+    """ A HoNClient whose chat connection is an AsyncChatSocket, driven by an asyncore loop.
+
+        Clients sharing a socket map are all run by a single loop, for example:
+
+            socket_map = {}
+            clients = [AsyncHoNClient(socket_map) for i in range(100)]
+            ...
+            asyncore.loop(timeout=1, use_poll=True, map=socket_map)
+
+        Event handlers are called on the loop's thread.
+    """
+    def __init__(self, socket_map=None):
+        self.socket_map = socket_map if socket_map is not None else asyncore.socket_map
+        HoNClient.__init__(self)
+
+    def _create_chat_socket(self, events):
+        return AsyncChatSocket(events, self.config, self.socket_map)
+
+    def _chat_connect(self):
+        """ Connects to the chat server and sends the authentication request, then returns
+            straight away, as the reply can only arrive once the loop runs.
+            Connect to `HON_SC_AUTH_ACCEPTED` to find out when the connection is ready.
+        """
+        self._chat_open()
+        return True
+
+    def _chat_disconnect(self):
+        """ Disconnects like a HoNClient. The AsyncChatSocket removes its channel from the
+            socket map as it closes, so the loop goes on running the other clients.
+        """
+        HoNClient._chat_disconnect(self)
+
 class Event:
     """ Event objects represent network level events which can have functions connected to them, which
         are then triggered when the event occurs.
@@ -403,13 +802,21 @@ class Event:
         event is passed, along with an optional priority.
 
         The functions are stored in a list called handlers, each function is executed in order of priority, from lowest to highest,
-        when the event is triggered.
+        when the event is triggered. Functions of the same priority are executed in the order they were connected.
         Imported events would have a priority of 1, as they would be handled first.
         Less important events could have a priority of 5, while normal events hover around 3 or 4.
         
         This is useful as it allows for core/client events to be processed first to ensure that data is available to the client's 
         internal data before it is used elsewhere in the program, such as in the User Interface.
 
+        Some events have a key, the name of a field in their data such as `channel_id`. Functions can be connected with a
+        value for the key, and are then only triggered for the events with that value, e.g. the messages sent to one channel.
+        Functions connected without a key are triggered for every event, along with the keyed ones in order of priority.
+
+        Functions connected with `executor='pool'` are not called by the trigger, but queued on the event's HandlerPool 
+        to be run by its worker threads. They are queued by the value of the event's key, so the calls for one channel 
+        or player are still run one at a time in the order the events were triggered.
+
         On the networking side, the events are triggered after the packet data has been parsed and constructed into useful data.
         The process would be as follows:
         
@@ -420,45 +827,83 @@ class Event:
     """
 
     class ConnectedMethod:
-        def __init__(self, method, priority):
+        def __init__(self, method, priority, key=None, executor=None):
             self.method = method
             self.priority = priority
+            self.key = key
+            self.executor = executor
         
         def __repr__(self):
-            return "[%s %s]" % (self.method, self.priority)
+            if self.key is None:
+                return "[%s %s]" % (self.method, self.priority)
+            return "[%s %s %r]" % (self.method, self.priority, self.key)
 
-    def __init__(self, name, packet_id):
+    def __init__(self, name, packet_id, key=None, pool=None):
         self.name = name            # An english, human name for the event. Maybe it can be used for a lookup later. Not sure of a use for it right now.
         self.packet_id = packet_id  # A packet identifier, either a constant or a hex value of a packet. i.e HON_SC_TOTAL_ONLINE or 0x68.
+        self.key = key              # The field of the event's data which handlers can be connected by, such as 'channel_id'.
+        self.pool = pool            # The HandlerPool running the handlers connected with executor='pool'.
         self.handlers = []          # List of connected methods.
+        self.dispatch_list = ()     # The functions to call when triggered, sorted by priority, each with whether it takes the data
+                                    # and whether it is run by the pool.
+        self.keyed_dispatch_lists = {} # The dispatch lists for the values of the key which have handlers connected.
     
     def __repr__(self):
         return "<%s: %s>" % (self.packet_id, self.name)
     
-    def connect(self, function, priority=5):
+    def connect(self, function, priority=5, key=None, executor=None):
         """ Connects a function to a specific event.
             The event is given as a constant, that is defined the packet definition file.
+            When a key is given, the function is only triggered when the event's data has that key.
+            When the executor is 'pool', the function is run by the event's HandlerPool.
         """
-        self.handlers.append(self.ConnectedMethod(function, priority))
-
-    def disonnect(self, method):
-        """ Hopefully it can be used to remove event handlers from this event
-            object so they are no longer triggered. Useful if say, an event only 
-            needs to be triggered once, for a reminder or such.
+        if key is not None and self.key is None:
+            raise HoNCoreError(18) # Event handlers can not be connected by key for this event ID.
+        if executor not in (None, 'pool') or (executor == 'pool' and self.pool is None):
+            raise HoNCoreError(19) # Unknown executor for this event ID.
+        self.handlers.append(self.ConnectedMethod(function, priority, key, executor))
+        self.__update_dispatch_lists()
+
+    def disconnect(self, method, key=None):
+        """ Removes event handlers from this event object so they are no longer triggered.
+            Useful if say, an event only needs to be triggered once, for a reminder or such.
         """
         for cm in self.handlers:
-            if cm.method == method:
+            if cm.method == method and cm.key == key:
                 self.handlers.remove(cm)
-            else:
-                raise HoNCoreError(14) # Method is not connected to this event_id
-        pass
-    
+                break
+        else:
+            raise HoNCoreError(14) # Method is not connected to this event_id
+        self.__update_dispatch_lists()
+
+    def __update_dispatch_lists(self):
+        """ Sorts the handlers by priority and works out which of them take the data, once, rather
+            than on every trigger. Each value of the key gets its own list, holding its handlers 
+            along with the unkeyed ones.
+            The new lists replace the old ones in a single assignment each, so triggers already 
+            running carry on with the handlers they started with.
+        """
+        handlers = sorted(self.handlers, key=lambda c: c.priority)
+        keyed_dispatch_lists = {}
+        for key in set(cm.key for cm in handlers if cm.key is not None):
+            keyed_dispatch_lists[key] = tuple((cm.method, cm.method.func_code.co_argcount > 0, cm.executor == 'pool')
+                                              for cm in handlers if cm.key is None or cm.key == key)
+        self.keyed_dispatch_lists = keyed_dispatch_lists
+        self.dispatch_list = tuple((cm.method, cm.method.func_code.co_argcount > 0, cm.executor == 'pool')
+                                   for cm in handlers if cm.key is None)
+
     def trigger(self, **data):
-        """ Sorts the connected handlers based on their priority and calls each one in turn,
-            passing the dictionary of keyword arguments, or alternatively with no arguments.
+        """ Calls each connected handler in turn, in order of priority, passing the 
+            dictionary of keyword arguments, or alternatively with no arguments.
+            Only the handlers connected without a key or with the key of the data are called.
         """
-        for cm in sorted(self.handlers, key=lambda c: c.priority):
-            f = cm.method
-            num_args = f.func_code.co_argcount
-            f(**data) if num_args > 0 else f()
+        dispatch_list = self.dispatch_list
+        if self.key is not None and self.keyed_dispatch_lists:
+            dispatch_list = self.keyed_dispatch_lists.get(data.get(self.key), dispatch_list)
+        for f, takes_data, pooled in dispatch_list:
+            if pooled:
+                self.pool.submit(data.get(self.key) if self.key is not None else None, 
+                                 f, data if takes_data else None)
+            else:
+                f(**data) if takes_data else f()
 
@@ -0,0 +1,29 @@
+"""
+HoNCore. Python library providing connectivity and functionality
+with HoN's chat server.
+
+decoders.py
+
+Fast decoders for the packets received from the chat server.
+
+Each decoder is the one compiled from the packet's layout in schema.py, which reads 
+the packet with precompiled structs and finds the end of each string with a single 
+find, rather than parsing a construct Struct byte by byte. They return the same data 
+as the matching PacketParser methods, which remain as a separate reference for the 
+packet layouts and are checked against the decoders by the tests.
+
+The decoders take the packet data without its length and ID, and an optional
+offset to start from. They are kept in the `decoders` table by packet ID.
+"""
+
+from constants import *
+from schema import server_packets
+
+decoders = dict((packet_id, layout.decode) for packet_id, layout in server_packets.iteritems())
+
+decode_channel_message = decoders[HON_SC_CHANNEL_MSG]
+decode_entered_channel = decoders[HON_SC_ENTERED_CHANNEL]
+decode_whisper = decoders[HON_SC_WHISPER]
+decode_initial_status = decoders[HON_SC_INITIAL_STATUS]
+decode_private_message = decoders[HON_SC_PM]
+decode_total_online = decoders[HON_SC_TOTAL_ONLINE]
@@ -0,0 +1,55 @@
+"""
+HoNCore. Python library providing connectivity and functionality
+with HoN's chat server.
+
+encoders.py
+
+Encoders for the packets sent to the chat server.
+
+Each encoder is the one compiled from the packet's layout in schema.py, which writes
+the packet with precompiled structs and joins of already encoded strings, rather than 
+building a construct Struct for every packet. Strings are sent as null terminated UTF-8, 
+unicode objects are encoded and byte strings are sent as-is.
+
+The encoders are kept in the `encoders` table by packet ID. Only packets with a known
+layout have an encoder, the remaining HON_CS_* IDs will be added as they are reverse
+engineered.
+"""
+
+import struct
+from constants import *
+from schema import client_packets, encode_string, encode_string_into
+
+_channel_id = struct.Struct('<L')
+
+encoders = dict((packet_id, layout.encode) for packet_id, layout in client_packets.iteritems())
+
+encode_pong = encoders[HON_CS_PONG]
+encode_channel_message = encoders[HON_CS_CHANNEL_MSG]
+encode_whisper = encoders[HON_CS_WHISPER]
+encode_private_message = encoders[HON_CS_PM]
+encode_join_channel = encoders[HON_CS_JOIN_CHANNEL]
+encode_leave_channel = encoders[HON_CS_LEAVE_CHANNEL]
+encode_user_info = encoders[HON_CS_USER_INFO]
+encode_join_channel_password = encoders[HON_CS_JOIN_CHANNEL_PASSWORD]
+
+def encode_auth_info(account_id, cookie, ip, auth_hash, protocol, invis):
+    """ Packet ID: 0x0C00 """
+    return encoders[HON_CS_AUTH_INFO](account_id, cookie, ip, auth_hash, protocol, 
+                                      HON_MODE_INVISIBLE if invis else HON_MODE_NORMAL)
+
+def encode_channel_broadcast(message, channel_ids):
+    """ Returns a channel message packet for each channel in `channel_ids`.
+        The packet is encoded once, and only the channel ID, its last field, differs between packets.
+    """
+    body = encode_channel_message(message, 0)[:-_channel_id.size]
+    pack = _channel_id.pack
+    return [body + pack(channel_id) for channel_id in channel_ids]
+
+def encode_whisper_broadcast(message, players):
+    """ Returns a whisper packet for each player in `players`.
+        The message is encoded to UTF-8 once, rather than for every packet.
+    """
+    if isinstance(message, unicode):
+        message = message.encode('utf8')
+    return [encode_whisper(player, message) for player in players]
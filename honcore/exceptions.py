@@ -51,6 +51,11 @@ _errormap = {
     12  : 'Unknown packet received',
     13  : 'Unknown event ID',
     14  : 'Method is not connected to this event ID.',
+    15  : 'Invalid configuration value.',
+    16  : 'Malformed packet received.',
+    17  : 'Packet layout is not known.',
+    18  : 'Event handlers can not be connected by key for this event ID.',
+    19  : 'Unknown executor for this event ID.',
     100 : 'Could not connect to the masterserver.',
     101 : 'Could not obtain login data.',
     102 : 'Incorrect username/password.',
@@ -80,5 +85,11 @@ _errormap = {
     207 : 'Chat server error, connection lost.',
     208 : 'Could not connect to the chat server.',
     209 : 'Socket was not connected.',
+    210 : 'Chat server did not reply to the request in time.',
+    211 : 'Banned from the channel.',
+    212 : 'The channel requires a password.',
+    213 : 'Whisper failed, the player is not online.',
+    214 : 'Player does not exist.',
+    215 : 'Connection to the chat server was closed before the reply arrived.',
 }
 
@@ -0,0 +1,352 @@
+"""
+HoNCore. Python library providing connectivity and functionality
+with HoN's chat server.
+
+executor.py
+
+Running slow event handlers, such as database writes or HTTP requests, off the
+thread which triggers the events, so that they do not hold up the other handlers.
+
+Futures for the requests sent to the chat server, which are resolved once the
+server's reply arrives.
+"""
+
+import time, threading, traceback, collections
+from exceptions import *
+
+
+class HandlerPool:
+    """ A pool of worker threads which run the event handlers connected with `executor='pool'`.
+
+        Calls are queued by key, such as the channel ID of the event. Calls with the same key
+        are run one at a time in the order they were submitted, while calls with different keys
+        are run in parallel by the workers. A key is only ever taken by one worker at a time, so
+        a slow call holds up the calls for its own key and no others.
+
+        The workers are started when the first call is submitted.
+    """
+    def __init__(self, size=4):
+        self.size = size
+        self.queues = {}                    # Calls waiting by key, for the keys waiting or running.
+        self.ready = collections.deque()    # Keys with calls waiting and none running, in the order they are served.
+        self.condition = threading.Condition()
+        self.workers = []
+        self.stopped = False
+
+    def __repr__(self):
+        return "<HandlerPool with %d workers>" % len(self.workers)
+
+    @property
+    def queue_depth(self):
+        """ The number of calls waiting to be run. """
+        return sum(len(queue) for queue in self.queues.itervalues())
+
+    def submit(self, key, function, data=None):
+        """ Queues a call of `function` for the key, passing the dictionary `data` as keyword
+            arguments, or no arguments if it is None.
+        """
+        with self.condition:
+            if not self.workers:
+                self.__start()
+            queue = self.queues.get(key)
+            if queue is None:
+                self.queues[key] = collections.deque([(function, data)])
+                self.ready.append(key)
+                self.condition.notify()
+            else:
+                # The key is waiting or being run, the call is taken once those before it are done.
+                queue.append((function, data))
+
+    def stop(self):
+        """ Lets the workers finish the calls already queued and then stops them. """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            if worker is not threading.current_thread():
+                worker.join()
+
+    def __start(self):
+        self.stopped = False
+        self.workers = [threading.Thread(target=self.__work, name='HandlerWorker-%d' % i)
+                            for i in range(self.size)]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def __work(self):
+        while True:
+            with self.condition:
+                while not self.ready and not self.stopped:
+                    self.condition.wait()
+                if not self.ready:
+                    break
+                key = self.ready.popleft()
+                function, data = self.queues[key].popleft()
+            try:
+                function(**data) if data is not None else function()
+            except Exception:
+                # Keep the worker alive, the calls for other keys still need running.
+                traceback.print_exc()
+            with self.condition:
+                if self.queues[key]:
+                    self.ready.append(key)
+                    self.condition.notify()
+                else:
+                    del self.queues[key]
+
+class Future:
+    """ The reply to a request sent to the chat server, which is set once the reply arrives.
+
+        A future which gets no reply within `timeout` seconds expires. It then fails with
+        ChatServerError 210, or resolves with `expired_result` when one is given, for the
+        requests which the server only replies to when they fail. A future with no timeout
+        never expires.
+    """
+    __no_result = object()
+
+    def __init__(self, timeout=None, expired_result=__no_result):
+        self.deadline = None
+        self.start(timeout)
+        self.expired_result = expired_result
+        self.condition = threading.Condition()
+        self.callbacks = []
+        self.__done = False
+        self.__result = None
+        self.__exception = None
+
+    def __repr__(self):
+        if not self.__done:
+            return "<Future pending>"
+        if self.__exception is not None:
+            return "<Future failed: %s>" % self.__exception
+        return "<Future: %r>" % (self.__result,)
+
+    def done(self):
+        return self.__done
+
+    def start(self, timeout):
+        """ Sets the future to expire `timeout` seconds from now, such as once its request 
+            has actually been sent. A timeout of None leaves the deadline as it is.
+        """
+        if timeout is not None:
+            self.deadline = time.time() + timeout
+
+    def result(self, timeout=None):
+        """ Waits for the reply, for at most `timeout` seconds if given, and returns it, or
+            raises the exception the request failed with.
+        """
+        self.wait(timeout)
+        if self.__exception is not None:
+            raise self.__exception
+        return self.__result
+
+    def exception(self, timeout=None):
+        """ Waits for the reply like `result`, and returns the exception the request failed with, if any. """
+        self.wait(timeout)
+        return self.__exception
+
+    def wait(self, timeout=None):
+        """ Waits until the reply arrives or the future expires. Raises ChatServerError 210 if 
+            `timeout` seconds pass first.
+        """
+        end = time.time() + timeout if timeout is not None else None
+        if self.deadline is not None and (end is None or self.deadline < end):
+            end = self.deadline
+        with self.condition:
+            while not self.__done:
+                if end is None:
+                    self.condition.wait()
+                    continue
+                now = time.time()
+                if now >= end:
+                    break
+                self.condition.wait(end - now)
+        if not self.expire(time.time()) and not self.__done:
+            raise ChatServerError(210) # Chat server did not reply to the request in time.
+
+    def add_done_callback(self, function):
+        """ Calls `function` with the future once it is resolved, straight away if it already is. """
+        with self.condition:
+            if not self.__done:
+                self.callbacks.append(function)
+                return
+        function(self)
+
+    def set_result(self, result):
+        self.__resolve(result, None)
+
+    def set_exception(self, exception):
+        self.__resolve(None, exception)
+
+    def expire(self, now):
+        """ Resolves the future if it is past its deadline. Returns True if it has been resolved. """
+        if self.__done:
+            return True
+        if self.deadline is None or now < self.deadline:
+            return False
+        if self.expired_result is self.__no_result:
+            self.__resolve(None, ChatServerError(210)) # Chat server did not reply to the request in time.
+        else:
+            self.__resolve(self.expired_result, None)
+        return True
+
+    def __resolve(self, result, exception):
+        with self.condition:
+            if self.__done:
+                return
+            self.__result = result
+            self.__exception = exception
+            self.__done = True
+            callbacks, self.callbacks = self.callbacks, []
+            self.condition.notify_all()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                traceback.print_exc()
+
+class PendingRequests:
+    """ The futures of the requests sent to the chat server which are waiting for their reply.
+
+        The futures are kept by key, such as the packet ID of the request and the channel 
+        name, and the replies with the same key answer the requests in the order they were sent,
+        so any number of requests can be waiting on one connection at once.
+        A future only starts waiting, and its timeout only starts running, once it is added, 
+        so a request which is queued to be sent later is added once it is written.
+
+        A timer thread expires the futures which get no reply, so that their callbacks run
+        even when nobody waits for them.
+    """
+    def __init__(self):
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.timer = None
+        self.timer_deadline = None  # When the timer goes off, None if it is not running.
+        self.cancelled = None       # The last timer cancelled, which may not have finished yet.
+
+    def __repr__(self):
+        return "<PendingRequests: %d waiting>" % len(self)
+
+    def __len__(self):
+        return sum(len(futures) for futures in self.futures.values())
+
+    def add(self, key, timeout, **kwargs):
+        """ Returns a new future for a request with the key, which expires after `timeout` seconds,
+            or never if it is None.
+        """
+        future = Future(**kwargs)
+        self.add_future(key, future, timeout)
+        return future
+
+    def add_future(self, key, future, timeout):
+        """ Adds an existing future for a request with the key, which expires after `timeout` seconds. """
+        self.expire()
+        future.start(timeout)
+        with self.lock:
+            self.futures.setdefault(key, collections.deque()).append(future)
+            if future.deadline is not None and (self.timer_deadline is None or future.deadline < self.timer_deadline):
+                self.__start_timer(future.deadline)
+
+    def remove(self, key, future):
+        """ Forgets the future of a request which could not be sent. """
+        with self.lock:
+            futures = self.futures.get(key)
+            if futures is not None and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self.futures[key]
+
+    def set_result(self, key, result):
+        """ Resolves the oldest future waiting with the key. Returns False if there was none. """
+        future = self.__pop(key)
+        if future is None:
+            return False
+        future.set_result(result)
+        return True
+
+    def set_exception(self, key, exception):
+        """ Fails the oldest future waiting with the key. Returns False if there was none. """
+        future = self.__pop(key)
+        if future is None:
+            return False
+        future.set_exception(exception)
+        return True
+
+    def fail_all(self, exception):
+        """ Fails every waiting future, such as when the connection is closed. """
+        with self.lock:
+            futures, self.futures = self.futures, {}
+            self.__stop_timer()
+            timer = self.cancelled
+        if timer is not None and timer is not threading.current_thread():
+            timer.join()
+        for waiting in futures.itervalues():
+            for future in waiting:
+                future.set_exception(exception)
+
+    def expire(self):
+        """ Resolves the futures which are past their deadline. """
+        now = time.time()
+        expired = []
+        with self.lock:
+            for key, futures in self.futures.items():
+                # The futures of a key are kept in the order they were sent, which is not always
+                # the order they expire in, as their timeouts can differ.
+                waiting = collections.deque()
+                for future in futures:
+                    if future.deadline is None or future.deadline > now:
+                        waiting.append(future)
+                    else:
+                        expired.append(future)
+                if len(waiting) == len(futures):
+                    continue
+                if waiting:
+                    self.futures[key] = waiting
+                else:
+                    del self.futures[key]
+        for future in expired:
+            future.expire(now)
+
+    def __start_timer(self, deadline):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.cancelled = self.timer
+        self.timer_deadline = deadline
+        self.timer = threading.Timer(max(0.0, deadline - time.time()), self.__on_timer)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def __stop_timer(self):
+        """ Stops the timer once nothing is left to expire. """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.cancelled = self.timer
+        self.timer = self.timer_deadline = None
+
+    def __on_timer(self):
+        with self.lock:
+            self.timer = self.timer_deadline = None
+        self.expire()
+        with self.lock:
+            deadlines = [future.deadline for futures in self.futures.itervalues() 
+                            for future in futures if future.deadline is not None]
+            if deadlines and (self.timer_deadline is None or min(deadlines) < self.timer_deadline):
+                self.__start_timer(min(deadlines))
+
+    def __pop(self, key):
+        self.expire()
+        with self.lock:
+            futures = self.futures.get(key)
+            try:
+                while futures:
+                    future = futures.popleft()
+                    if not futures:
+                        del self.futures[key]
+                    if not future.done():
+                        return future
+            finally:
+                if not self.futures:
+                    self.__stop_timer()
+        return None
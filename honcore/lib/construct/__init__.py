@@ -32,6 +32,10 @@ Hands-on example:
     >>> 
     >>> s.build(Container(a = 1, b = 0x0203))
     "\\x01\\x02\\x03"
+
+The formats, protocols and text packages are not imported with construct,
+import them when they are needed:
+    >>> from construct.text import *
 """
 from core import *
 from adapters import *
@@ -75,7 +79,7 @@ __all__ = [
     'AdaptationError', 'Adapter', 'Alias', 'Aligned', 'AlignedStruct', 
     'Anchor', 'Array', 'ArrayError', 'BFloat32', 'BFloat64', 'Bit', 'BitField', 
     'BitIntegerAdapter', 'BitIntegerError', 'BitStruct', 'Bits', 'Bitwise', 
-    'Buffered', 'Byte', 'Bytes', 'CString', 'CStringAdapter', 'Const', 
+    'Buffered', 'Byte', 'Bytes', 'CString', 'CStringAdapter', 'CStringField', 'Const', 
     'ConstAdapter', 'ConstError', 'Construct', 'ConstructError', 'Container', 
     'Debugger', 'Embed', 'Embedded', 'EmbeddedBitStruct', 'Enum', 'ExprAdapter',
     'Field', 'FieldError', 'Flag', 'FlagsAdapter', 'FlagsContainer', 
@@ -89,6 +93,7 @@ __all__ = [
     'OptionalGreedyRepeater', 'PaddedStringAdapter', 'Padding', 
     'PaddingAdapter', 'PaddingError', 'PascalString', 'Pass', 'Peek', 
     'Pointer', 'PrefixedArray', 'Probe', 'Range', 'RangeError', 'Reconfig', 
+    'Record', 
     'Rename', 'RepeatUntil', 'Repeater', 'Restream', 'SBInt16', 'SBInt32', 
     'SBInt64', 'SBInt8', 'SLInt16', 'SLInt32', 'SLInt64', 'SLInt8', 'SNInt16', 
     'SNInt32', 'SNInt64', 'SNInt8', 'Select', 'SelectError', 'Sequence', 
@@ -0,0 +1,309 @@
+"""
+Compiles construct trees into specialized python parsing functions.
+
+The interpreter (Construct._parse) walks the tree for every parse: creating a
+context per nesting level, checking the flags of each subcon and reading the
+stream field by field. The compiler walks the tree once and writes the
+straight-line python source of a function doing the same parse over an in-memory
+string, which is then exec'd:
+
+* runs of FormatFields within a Struct are read with a single struct.unpack_from
+* StaticFields and MetaFields are sliced out of the data
+* CStringFields (and CStrings) are read with a single find of their terminator
+* MetaArrays/Arrays of FormatFields (or of Structs of them) are unpacked with
+  a single struct for the whole array
+* Structs, other MetaArrays/Arrays, Switches (and so If), Values, Renames and Adapters
+  are written inline
+* contexts are only kept when a user function (a count, a predicate, a
+  Value, an Adapter, ...) may look at them
+
+Any other construct falls back to the interpreter: its _parse is called on a
+stream over the same data, positioned where the compiled code has got to.
+
+Example:
+    >>> parse = Struct("foo", UBInt8("a"), CString("b")).compile()
+    >>> parse("\\x01hello\\x00")
+    Container(a = 1, b = 'hello')
+"""
+import struct
+from lib import StringIO, Container, ListContainer, AttrDict
+from core import *
+from core import Reconfig
+from adapters import CStringAdapter
+
+
+def _container(names, attrs, values):
+    obj = Container()
+    obj.__dict__.update(zip(names, values))
+    obj.__attrs__.extend(attrs)
+    return obj
+
+def _as_str(data):
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    return str(data)
+
+def _find_any(data, offset, terminators):
+    ends = [end for end in (data.find(t, offset) for t in terminators) if end >= 0]
+    if not ends:
+        return -1
+    return min(ends)
+
+class ParserCompiler(object):
+    """
+    Writes the source of the parsing function for a construct.
+
+    Parameters:
+    * construct - the root of the tree to compile
+    * contexts - whether contexts are kept for the user functions in the tree
+    """
+    def __init__(self, construct, contexts = True):
+        self.construct = construct
+        self.contexts = contexts
+        self.uses_context = False
+        self.lines = []
+        self.builtins = {
+            "Container" : Container,
+            "ListContainer" : ListContainer,
+            "AttrDict" : AttrDict,
+            "StringIO" : StringIO,
+            "FieldError" : FieldError,
+            "ArrayError" : ArrayError,
+            "SwitchError" : SwitchError,
+            "ConstructError" : ConstructError,
+            "struct_error" : struct.error,
+            "_container" : _container,
+            "_as_str" : _as_str,
+            "_find_any" : _find_any,
+        }
+        self.namespace = {}
+        self.counter = 0
+
+    def var(self, prefix = "v", value = None):
+        self.counter += 1
+        name = "%s%d" % (prefix, self.counter)
+        if value is not None:
+            self.namespace[name] = value
+        return name
+
+    def write(self, indent, line, *args):
+        self.lines.append(indent + (line % args if args else line))
+
+    def source(self):
+        """returns the source of the function `parse_at(data, offset, context)`,
+        which returns the parsed object and the offset following it"""
+        self.lines = []
+        self.namespace = dict(self.builtins)
+        self.counter = 0
+        self.write("", "def parse_at(data, offset, context):")
+        self.write("    ", "if type(data) is not str:")
+        self.write("    ", "    data = _as_str(data)")
+        self.write("    ", "stream = None")
+        self.write("    ", "try:")
+        obj = self.emit(self.construct, "        ", "context")
+        if self.lines[-1] == "    try:":
+            self.write("        ", "pass")
+        self.write("    ", "except struct_error, ex:")
+        self.write("    ", "    raise FieldError(ex)")
+        self.write("    ", "return %s, offset", obj)
+        return "\n".join(self.lines) + "\n"
+
+    def compile(self):
+        """returns the compiled `parse_at` function, with its source in
+        `parse_at.source`"""
+        source = self.source()
+        if self.contexts and not self.uses_context:
+            # nothing looks at the contexts, so they need not be kept
+            self.contexts = False
+            source = self.source()
+        code = compile(source, "<compiled %r>" % (self.construct,), "exec")
+        exec code in self.namespace
+        parse_at = self.namespace["parse_at"]
+        parse_at.source = source
+        return parse_at
+
+    def emit(self, con, indent, ctx):
+        """writes the parsing of `con`, returning the name of the variable
+        holding the parsed object. `ctx` is the name of the context variable"""
+        kind = type(con)
+        if kind is Struct and not any(sc.conflags & con.FLAG_EMBED for sc in con.subcons):
+            return self.emit_struct(con, indent, ctx)
+        if kind is FormatField:
+            return self.emit_format_fields([con], indent, ctx)[0]
+        if kind is StaticField:
+            return self.emit_read(str(con.length), indent)
+        if kind is MetaField:
+            self.uses_context = True
+            length = self.var("n")
+            self.write(indent, "%s = %s(%s)", length, self.var("lengthfunc", con.lengthfunc), ctx)
+            self.write(indent, "if %s < 0:", length)
+            self.write(indent, "    raise ValueError('length must be >= 0', %s)", length)
+            return self.emit_read(length, indent)
+        if kind is MetaArray and not con.subcon.conflags & con.FLAG_COPY_CONTEXT:
+            return self.emit_array(con, indent, ctx)
+        if kind is Reconfig:
+            return self.emit(con.subcon, indent, ctx)
+        if kind is CStringField or (kind is CStringAdapter and self.is_cstring(con)):
+            return self.emit_cstring(con, indent)
+        if kind is Switch:
+            return self.emit_switch(con, indent, ctx)
+        if kind is Value:
+            self.uses_context = True
+            obj = self.var()
+            self.write(indent, "%s = %s(%s)", obj, self.var("func", con.func), ctx)
+            return obj
+        if con is Pass:
+            return "None"
+        if isinstance(con, Adapter) and kind._parse is Adapter._parse:
+            self.uses_context = True
+            obj = self.emit(con.subcon, indent, ctx)
+            adapter = self.var("adapter", con)
+            self.write(indent, "%s = %s._decode(%s, %s)", obj, adapter, obj, ctx)
+            return obj
+        return self.emit_fallback(con, indent, ctx)
+
+    def emit_fallback(self, con, indent, ctx):
+        self.uses_context = True
+        obj = self.var()
+        self.write(indent, "if stream is None:")
+        self.write(indent, "    stream = StringIO(data)")
+        self.write(indent, "stream.seek(offset)")
+        self.write(indent, "%s = %s._parse(stream, %s)", obj, self.var("con", con), ctx)
+        # some constructs, such as Restream, close the stream once they are done
+        self.write(indent, "if not stream.closed:")
+        self.write(indent, "    offset = stream.tell()")
+        return obj
+
+    def emit_read(self, length, indent):
+        obj = self.var()
+        self.write(indent, "%s = data[offset:offset + %s]", obj, length)
+        self.write(indent, "if len(%s) != %s:", obj, length)
+        self.write(indent, "    raise FieldError('expected %%d, found %%d' %% (%s, len(%s)))", length, obj)
+        self.write(indent, "offset += %s", length)
+        return obj
+
+    def emit_format_fields(self, fields, indent, ctx):
+        """reads a run of FormatFields of the same endianity with one struct"""
+        packer = struct.Struct(fields[0].packer.format[0] + "".join(f.packer.format[1:] for f in fields))
+        objs = [self.var() for f in fields]
+        self.write(indent, "%s, = %s.unpack_from(data, offset)", ", ".join(objs), self.var("packer", packer))
+        self.write(indent, "offset += %d", packer.size)
+        return objs
+
+    def emit_struct(self, con, indent, ctx):
+        if self.contexts and con.nested:
+            inner = self.var("ctx")
+            self.write(indent, "%s = AttrDict(_ = %s)", inner, ctx)
+        else:
+            inner = ctx
+        names = []
+        objs = []
+        subcons = list(con.subcons)
+        while subcons:
+            sc = subcons.pop(0)
+            if type(sc) is FormatField:
+                # gather the following FormatFields of the same endianity
+                run = [sc]
+                while subcons and type(subcons[0]) is FormatField and subcons[0].packer.format[0] == sc.packer.format[0]:
+                    run.append(subcons.pop(0))
+                results = zip(run, self.emit_format_fields(run, indent, inner))
+            else:
+                results = [(sc, self.emit(sc, indent, inner))]
+            for sc, obj in results:
+                if sc.name is None:
+                    continue
+                names.append(sc.name)
+                objs.append(obj)
+                if self.contexts:
+                    self.write(indent, "%s[%r] = %s", inner, sc.name, obj)
+        obj = self.var()
+        if con.record is not None:
+            # the last of the fields of the same name wins, as with containers
+            fields = dict(zip(names, objs))
+            self.write(indent, "%s = %s(%s)", obj, self.var("record", con.record),
+                ", ".join(fields[name] for name in con.record.__attrs__))
+            return obj
+        attrs = []
+        for name in names:
+            if name not in attrs:
+                attrs.append(name)
+        self.write(indent, "%s = _container(%r, %r, (%s))", obj, tuple(names), attrs,
+            "".join(o + ", " for o in objs))
+        return obj
+
+    def emit_array(self, con, indent, ctx):
+        obj = self.var()
+        count = self.var("count")
+        index = self.var("i")
+        if con._is_flag(con.FLAG_DYNAMIC):
+            self.uses_context = True
+            self.write(indent, "%s = %s(%s)", count, self.var("countfunc", con.countfunc), ctx)
+        else:
+            self.write(indent, "%s = %d", count, con.countfunc(None))
+        if con.records is not None:
+            # records of FormatFields are unpacked all at once
+            self.write(indent, "%s, offset = %s._unpack(data, offset, %s)", obj, self.var("array", con), count)
+            return obj
+        self.write(indent, "%s = ListContainer()", obj)
+        self.write(indent, "%s = 0", index)
+        self.write(indent, "try:")
+        self.write(indent, "    while %s < %s:", index, count)
+        item = self.emit(con.subcon, indent + "        ", ctx)
+        self.write(indent, "        %s.append(%s)", obj, item)
+        self.write(indent, "        %s += 1", index)
+        self.write(indent, "except (ConstructError, struct_error), ex:")
+        self.write(indent, "    raise ArrayError('expected %%d, found %%d' %% (%s, %s), ex)", count, index)
+        return obj
+
+    def is_cstring(self, con):
+        """a CStringAdapter over a RepeatUntil of single chars, as made by CString"""
+        repeater = con.subcon
+        return (type(repeater) is RepeatUntil and type(repeater.subcon) is StaticField
+            and repeater.subcon.length == 1 and len(con.terminators) > 0)
+
+    def emit_cstring(self, con, indent):
+        obj = self.var()
+        end = self.var("end")
+        if len(con.terminators) == 1:
+            self.write(indent, "%s = data.find(%r, offset)", end, con.terminators)
+        else:
+            self.write(indent, "%s = _find_any(data, offset, %r)", end, con.terminators)
+        self.write(indent, "if %s < 0:", end)
+        self.write(indent, "    raise ArrayError('missing terminator', FieldError('expected 1, found 0'))")
+        self.write(indent, "%s = data[offset:%s]", obj, end)
+        self.write(indent, "offset = %s + 1", end)
+        if con.encoding:
+            self.write(indent, "%s = %s.decode(%r)", obj, obj, con.encoding)
+        return obj
+
+    def emit_switch(self, con, indent, ctx):
+        self.uses_context = True
+        obj = self.var()
+        key = self.var("key")
+        self.write(indent, "%s = %s(%s)", key, self.var("keyfunc", con.keyfunc), ctx)
+        keyword = "if"
+        for case, subcon in con.cases.iteritems():
+            self.write(indent, "%s %s == %s:", keyword, key, self.var("case", case))
+            self.write(indent, "    %s = %s", obj, self.emit(subcon, indent + "    ", ctx))
+            keyword = "elif"
+        if con.cases:
+            self.write(indent, "else:")
+            inner = indent + "    "
+        else:
+            inner = indent
+        if con.default is Switch.NoDefault:
+            self.write(inner, "raise SwitchError('no default case defined')")
+        else:
+            self.write(inner, "%s = %s", obj, self.emit(con.default, inner, ctx))
+        if con.include_key:
+            self.write(indent, "%s = %s, %s", obj, key, obj)
+        return obj
+
+def compile_parser(construct):
+    """returns a function parsing `data` the same way as construct.parse"""
+    parse_at = ParserCompiler(construct).compile()
+    def parse(data):
+        return parse_at(data, 0, AttrDict())[0]
+    parse.parse_at = parse_at
+    parse.source = parse_at.source
+    return parse
@@ -1,5 +1,6 @@
-from lib import StringIO, Packer
+from lib import StringIO, Packer, SeekableStreams
 from lib import Container, ListContainer, AttrDict, LazyContainer
+from lib import Record, record_class
 
 
 #===============================================================================
@@ -34,15 +35,39 @@ class Construct(object):
     User API:
     * parse(buf) - parses an in-memory buffer (usually a string)
     * parse_stream(stream) - parses a stream (in-memory, file, pipe, ...)
+    * parse_from(buffer, offset) - parses a string, bytearray or memoryview 
+      from the offset on, without a stream. returns the object and the offset
+      following it
     * build(obj) - builds the object into an in-memory buffer (a string)
     * build_stream(obj, stream) - builds the object into the given stream
+    * build_into(obj, buffer, offset) - builds the object straight into a 
+      bytearray at the offset, without an intermediate string. returns the
+      offset following it
     * sizeof(context) - calculates the size of the construct, if possible,
       based on the context
+    * static_sizeof() - returns the size of the construct if it does not 
+      depend on the context or the data, or None
+    * static_prefix() - returns the size of the leading part of the construct
+      which does not depend on the context or the data
+    * compile() - returns a function parsing in-memory buffers like parse(),
+      generated for this construct (see compiler.py)
     
     Overriable methods for subclassing:
     * _parse(stream, context) - low-level parse from stream
+    * _parse_from(buffer, offset, context) - low-level parse from a buffer, 
+      returning the object and the new offset. by default it runs _parse on 
+      a stream over the buffer, so constructs overriding _parse but not 
+      _parse_from still work
     * _build(obj, stream, context) - low-level build to stream
+    * _build_into(obj, buffer, offset, context) - low-level build into a 
+      bytearray, returning the new offset. by default it runs _build on a 
+      new stream and copies the data built into the buffer
     * _sizeof(context) - low-level compute size
+    * _static_sizeof() - low-level compute the static size, raising 
+      SizeofError if there is none. by default constructs without
+      FLAG_DYNAMIC are taken to have a static size, given by _sizeof
+    * _static_prefix() - low-level compute the static prefix of a construct
+      which has no static size. 0 by default
     
     Flags API:
     * _set_flag(flag) - sets the given flag/flags
@@ -76,7 +101,7 @@ class Construct(object):
     FLAG_EMBED                 = 0x0004
     FLAG_NESTING               = 0x0008
     
-    __slots__ = ["name", "conflags"]
+    __slots__ = ["name", "conflags", "_static"]
     def __init__(self, name, flags = 0):
         if name is not None:
             if type(name) is not str:
@@ -129,6 +154,26 @@ class Construct(object):
         return self._parse(stream, AttrDict())
     def _parse(self, stream, context):
         raise NotImplementedError()
+    def parse_from(self, buffer, offset = 0):
+        """parses data from a buffer (a string, bytearray or memoryview) 
+        starting at the offset, without wrapping it in a stream. returns the
+        parsed object and the offset following it. a memoryview can not be
+        searched in python 2, so the data following the offset is copied out
+        of it first"""
+        if isinstance(buffer, memoryview):
+            obj, end = self._parse_from(buffer[offset:].tobytes(), 0, AttrDict())
+            return obj, offset + end
+        return self._parse_from(buffer, offset, AttrDict())
+    def _parse_from(self, buffer, offset, context):
+        stream = StringIO(buffer)
+        stream.seek(offset)
+        obj = self._parse(stream, context)
+        return obj, stream.tell()
+    def compile(self):
+        """returns a function which parses data like parse(), written for 
+        this construct. keep the function, as compiling it is slow"""
+        from compiler import compile_parser
+        return compile_parser(self)
     
     def build(self, obj):
         """builds an object in a string (in memory)"""
@@ -140,15 +185,69 @@ class Construct(object):
         self._build(obj, stream, AttrDict())
     def _build(self, obj, stream, context):
         raise NotImplementedError()
+    def build_into(self, obj, buffer, offset = 0):
+        """builds an object into a bytearray starting at the offset, growing
+        the bytearray if it is too short. returns the offset following the 
+        data built"""
+        # make room for as much of the data as is known at once
+        _reserve(buffer, offset + self.static_prefix())
+        context = AttrDict()
+        # anchors and pointers are relative to where the data starts, as with build()
+        context["<base>"] = offset
+        return self._build_into(obj, buffer, offset, context)
+    def _build_into(self, obj, buffer, offset, context):
+        stream = StringIO()
+        self._build(obj, stream, context)
+        data = stream.getvalue()
+        buffer[offset:offset + len(data)] = data
+        # the stream may have been left before the end of the data, or past it
+        end = offset + stream.tell()
+        _reserve(buffer, end)
+        return end
     
     def sizeof(self, context = None):
         """calculates the size of the construct (if possible) using the 
         given context"""
+        size = self._analyze()[0]
+        if size is not None:
+            return size
         if context is None:
             context = AttrDict()
         return self._sizeof(context)
     def _sizeof(self, context):
         raise SizeofError("can't calculate size")
+    
+    def static_sizeof(self):
+        """returns the size of the construct if it is the same whatever the
+        context and the data, or None"""
+        return self._analyze()[0]
+    def static_prefix(self):
+        """returns the size of the leading part of the construct which is 
+        the same whatever the context and the data: its whole size if it is
+        static, or for example the size of the fields of a Struct before its
+        first dynamic one"""
+        return self._analyze()[1]
+    def _analyze(self):
+        """returns the static size (or None) and the static prefix, which are
+        computed once and cached on the construct"""
+        try:
+            return self._static
+        except AttributeError:
+            pass
+        try:
+            size = prefix = self._static_sizeof()
+        except (ConstructError, LookupError, AttributeError, TypeError):
+            # sizeof is left to report whatever is wrong with the context
+            size = None
+            prefix = self._static_prefix()
+        self._static = size, prefix
+        return self._static
+    def _static_sizeof(self):
+        if self.conflags & self.FLAG_DYNAMIC:
+            raise SizeofError("size depends on the context")
+        return self._sizeof(AttrDict())
+    def _static_prefix(self):
+        return 0
 
 class Subconstruct(Construct):
     """
@@ -179,8 +278,17 @@ class Adapter(Subconstruct):
     __slots__ = []
     def _parse(self, stream, context):
         return self._decode(self.subcon._parse(stream, context), context)
+    def _parse_from(self, buffer, offset, context):
+        obj, offset = self.subcon._parse_from(buffer, offset, context)
+        return self._decode(obj, context), offset
     def _build(self, obj, stream, context):
         self.subcon._build(self._encode(obj, context), stream, context)
+    def _build_into(self, obj, buffer, offset, context):
+        return self.subcon._build_into(self._encode(obj, context), buffer, offset, context)
+    def _static_sizeof(self):
+        return _static_sizeof(self.subcon)
+    def _static_prefix(self):
+        return self.subcon.static_prefix()
     def _decode(self, obj, context):
         raise NotImplementedError()
     def _encode(self, obj, context):
@@ -198,6 +306,46 @@ def _read_stream(stream, length):
         raise FieldError("expected %d, found %d" % (length, len(data)))
     return data
 
+def _read_buffer(buffer, offset, length):
+    if length < 0:
+        raise ValueError("length must be >= 0", length)
+    data = buffer[offset:offset + length]
+    if len(data) != length:
+        raise FieldError("expected %d, found %d" % (length, len(data)))
+    if type(data) is not str:
+        data = str(data)
+    return data
+
+def _static_sizeof(construct):
+    """returns the static size of the construct, raising SizeofError if it 
+    has none"""
+    size = construct.static_sizeof()
+    if size is None:
+        raise SizeofError("size depends on the context")
+    return size
+
+def _build_base(context):
+    """returns the offset build_into started building at, from the outermost
+    context"""
+    while "<base>" not in context and "_" in context:
+        context = context["_"]
+    if "<base>" in context:
+        return context["<base>"]
+    return 0
+
+def _reserve(buffer, end):
+    """grows the bytearray to at least `end` bytes"""
+    if len(buffer) < end:
+        buffer.extend("\x00" * (end - len(buffer)))
+
+def _write_buffer(buffer, offset, length, data):
+    if length < 0:
+        raise ValueError("length must be >= 0", length)
+    if len(data) != length:
+        raise FieldError("expected %d, found %d" % (length, len(data)))
+    buffer[offset:offset + length] = data
+    return offset + length
+
 def _write_stream(stream, length, data):
     if length < 0:
         raise ValueError("length must be >= 0", length)
@@ -222,8 +370,12 @@ class StaticField(Construct):
         self.length = length
     def _parse(self, stream, context):
         return _read_stream(stream, self.length)
+    def _parse_from(self, buffer, offset, context):
+        return _read_buffer(buffer, offset, self.length), offset + self.length
     def _build(self, obj, stream, context):
         _write_stream(stream, self.length, obj)
+    def _build_into(self, obj, buffer, offset, context):
+        return _write_buffer(buffer, offset, self.length, obj)
     def _sizeof(self, context):
         return self.length
 
@@ -263,11 +415,23 @@ class FormatField(StaticField):
             return self.packer.unpack(_read_stream(stream, self.length))[0]
         except Exception, ex:
             raise FieldError(ex)
+    def _parse_from(self, buffer, offset, context):
+        try:
+            return self.packer.unpack_from(buffer, offset)[0], offset + self.length
+        except Exception, ex:
+            raise FieldError(ex)
     def _build(self, obj, stream, context):
         try:
             _write_stream(stream, self.length, self.packer.pack(obj))
         except Exception, ex:
             raise FieldError(ex)
+    def _build_into(self, obj, buffer, offset, context):
+        _reserve(buffer, offset + self.length)
+        try:
+            self.packer.pack_into(buffer, offset, obj)
+        except Exception, ex:
+            raise FieldError(ex)
+        return offset + self.length
 
 class MetaField(Construct):
     """
@@ -289,21 +453,148 @@ class MetaField(Construct):
         self._set_flag(self.FLAG_DYNAMIC)
     def _parse(self, stream, context):
         return _read_stream(stream, self.lengthfunc(context))
+    def _parse_from(self, buffer, offset, context):
+        length = self.lengthfunc(context)
+        return _read_buffer(buffer, offset, length), offset + length
     def _build(self, obj, stream, context):
         _write_stream(stream, self.lengthfunc(context), obj)
+    def _build_into(self, obj, buffer, offset, context):
+        return _write_buffer(buffer, offset, self.lengthfunc(context), obj)
     def _sizeof(self, context):
         return self.lengthfunc(context)
 
+class CStringField(Construct):
+    """
+    A string ending in a terminator, found with a single search rather than
+    one read per character. In-memory streams and files are read ahead in 
+    chunks, and then seeked back to just after the terminator; other streams
+    are read a character at a time.
+    See CString.
+    
+    Parameters:
+    * name - the name of the field
+    * terminators - a sequence of terminator chars. default is "\x00".
+    * encoding - the character encoding (e.g., "utf8"), or None to return 
+      raw bytes. the terminators are not affected by the encoding.
+    
+    Example:
+    CStringField("foo", terminators = "\x00\n")
+    """
+    __slots__ = ["terminators", "encoding"]
+    chunk_size = 64
+    def __init__(self, name, terminators = "\x00", encoding = None):
+        if not terminators:
+            raise ValueError("at least one terminator is required")
+        Construct.__init__(self, name)
+        self.terminators = terminators
+        self.encoding = encoding
+        self._set_flag(self.FLAG_DYNAMIC)
+    def _find(self, data, start = 0):
+        if len(self.terminators) == 1:
+            return data.find(self.terminators, start)
+        ends = [end for end in (data.find(t, start) for t in self.terminators) if end >= 0]
+        if not ends:
+            return -1
+        return min(ends)
+    def _parse(self, stream, context):
+        chunks = []
+        if isinstance(stream, SeekableStreams):
+            size = self.chunk_size
+            while True:
+                chunk = stream.read(size)
+                end = self._find(chunk)
+                if end >= 0:
+                    chunks.append(chunk[:end])
+                    stream.seek(end + 1 - len(chunk), 1)
+                    break
+                if len(chunk) < size:
+                    raise ArrayError("missing terminator", 
+                        FieldError("expected 1, found 0"))
+                chunks.append(chunk)
+                size *= 2
+        else:
+            terminators = self.terminators
+            while True:
+                char = stream.read(1)
+                if not char:
+                    raise ArrayError("missing terminator", 
+                        FieldError("expected 1, found 0"))
+                if char in terminators:
+                    break
+                chunks.append(char)
+        obj = "".join(chunks)
+        if self.encoding:
+            obj = obj.decode(self.encoding)
+        return obj
+    def _parse_from(self, buffer, offset, context):
+        end = self._find(buffer, offset)
+        if end < 0:
+            raise ArrayError("missing terminator", 
+                FieldError("expected 1, found 0"))
+        obj = buffer[offset:end]
+        if type(obj) is not str:
+            obj = str(obj)
+        if self.encoding:
+            obj = obj.decode(self.encoding)
+        return obj, end + 1
+    def _build(self, obj, stream, context):
+        if self.encoding:
+            obj = obj.encode(self.encoding)
+        stream.write(obj + self.terminators[0])
+    def _build_into(self, obj, buffer, offset, context):
+        if self.encoding:
+            obj = obj.encode(self.encoding)
+        end = offset + len(obj)
+        buffer[offset:end] = obj
+        buffer[end:end + 1] = self.terminators[0]
+        return end + 1
+    def _sizeof(self, context):
+        raise SizeofError("can't calculate size")
+
 
 #===============================================================================
 # arrays and repeaters
 #===============================================================================
+def _record_format(subcon):
+    """
+    returns the (format, size, names, record) of the records made by subcon, 
+    if it is a FormatField or a nested Struct of uniquely named FormatFields of
+    the same endianity (bytes aside), so that a run of them can be unpacked at
+    once. names is None for a FormatField, and record is the record class of 
+    the Struct, if any. returns None for any other subcon
+    """
+    record = None
+    if type(subcon) is FormatField:
+        fields = [subcon]
+        names = None
+    elif type(subcon) is Struct and subcon.nested and subcon.subcons:
+        fields = subcon.subcons
+        names = tuple(sc.name for sc in fields)
+        if None in names or len(set(names)) != len(names):
+            return None
+        record = subcon.record
+    else:
+        return None
+    if any(type(sc) is not FormatField for sc in fields):
+        return None
+    # the endianity of single bytes does not matter
+    endianities = set(sc.packer.format[0] for sc in fields if sc.packer.size > 1)
+    if len(endianities) > 1:
+        return None
+    endianity = endianities.pop() if endianities else fields[0].packer.format[0]
+    format = "".join(sc.packer.format[1:] for sc in fields)
+    return endianity + format, Packer(endianity + format).size, names, record
+
 class MetaArray(Subconstruct):
     """
     An array (repeater) of a meta-count. The array will iterate exactly 
     `countfunc()` times. Will raise ArrayError if less elements are found.
     See also Array, Range and RepeatUntil.
     
+    Arrays of FormatFields, or of Structs made only of FormatFields, are 
+    unpacked with a single struct for the whole array, rather than element 
+    by element.
+    
     Parameters:
     * countfunc - a function that takes the context as a parameter and returns
       the number of elements of the array (count)
@@ -312,13 +603,44 @@ class MetaArray(Subconstruct):
     Example:
     MetaArray(lambda ctx: 5, UBInt8("foo"))
     """
-    __slots__ = ["countfunc"]
+    __slots__ = ["countfunc", "records"]
     def __init__(self, countfunc, subcon):
         Subconstruct.__init__(self, subcon)
         self.countfunc = countfunc
+        self.records = _record_format(subcon)
         self._clear_flag(self.FLAG_COPY_CONTEXT)
         self._set_flag(self.FLAG_DYNAMIC)
+    def _unpack(self, data, offset, count):
+        """unpacks `count` records from data at the offset, returning the
+        ListContainer of them and the offset following them"""
+        format, size, names, record = self.records
+        if count <= 0:
+            return ListContainer(), offset
+        end = offset + size * count
+        if len(data) < end:
+            found = max(len(data) - offset, 0)
+            raise ArrayError("expected %d, found %d" % (count, found // size),
+                FieldError("expected %d, found %d" % (size, found % size)))
+        values = Packer(format[0] + format[1:] * count).unpack_from(data, offset)
+        if names is None:
+            return ListContainer(values), end
+        obj = ListContainer()
+        width = len(names)
+        if record is not None:
+            for i in xrange(0, len(values), width):
+                obj.append(record(*values[i:i + width]))
+            return obj, end
+        for i in xrange(0, len(values), width):
+            item = Container()
+            item.__dict__.update(zip(names, values[i:i + width]))
+            item.__attrs__.extend(names)
+            obj.append(item)
+        return obj, end
     def _parse(self, stream, context):
+        if self.records is not None:
+            count = self.countfunc(context)
+            data = stream.read(max(count, 0) * self.records[1])
+            return self._unpack(data, 0, count)[0]
         obj = ListContainer()
         c = 0
         count = self.countfunc(context)
@@ -334,6 +656,26 @@ class MetaArray(Subconstruct):
         except ConstructError, ex:
             raise ArrayError("expected %d, found %d" % (count, c), ex)
         return obj
+    def _parse_from(self, buffer, offset, context):
+        if self.records is not None:
+            return self._unpack(buffer, offset, self.countfunc(context))
+        obj = ListContainer()
+        c = 0
+        count = self.countfunc(context)
+        try:
+            if self.subcon.conflags & self.FLAG_COPY_CONTEXT:
+                while c < count:
+                    subobj, offset = self.subcon._parse_from(buffer, offset, context.__copy__())
+                    obj.append(subobj)
+                    c += 1
+            else:
+                while c < count:
+                    subobj, offset = self.subcon._parse_from(buffer, offset, context)
+                    obj.append(subobj)
+                    c += 1
+        except ConstructError, ex:
+            raise ArrayError("expected %d, found %d" % (count, c), ex)
+        return obj, offset
     def _build(self, obj, stream, context):
         count = self.countfunc(context)
         if len(obj) != count:
@@ -344,8 +686,38 @@ class MetaArray(Subconstruct):
         else:
             for subobj in obj:
                 self.subcon._build(subobj, stream, context)
+    def _build_into(self, obj, buffer, offset, context):
+        count = self.countfunc(context)
+        if len(obj) != count:
+            raise ArrayError("expected %d, found %d" % (count, len(obj)))
+        if self.records is not None and count > 0:
+            format, size, names, record = self.records
+            if names is None:
+                values = obj
+            else:
+                values = [getattr(subobj, name) for subobj in obj for name in names]
+            _reserve(buffer, offset + size * count)
+            try:
+                Packer(format[0] + format[1:] * count).pack_into(buffer, offset, *values)
+            except Exception, ex:
+                raise FieldError(ex)
+            return offset + size * count
+        if self.subcon.conflags & self.FLAG_COPY_CONTEXT:
+            for subobj in obj:
+                offset = self.subcon._build_into(subobj, buffer, offset, context.__copy__())
+        else:
+            for subobj in obj:
+                offset = self.subcon._build_into(subobj, buffer, offset, context)
+        return offset
     def _sizeof(self, context):
-        return self.subcon._sizeof(context) * self.countfunc(context)
+        size = self.subcon.static_sizeof()
+        if size is None:
+            size = self.subcon._sizeof(context)
+        return size * self.countfunc(context)
+    def _static_sizeof(self):
+        if self.conflags & self.FLAG_DYNAMIC:
+            raise SizeofError("size depends on the context")
+        return _static_sizeof(self.subcon) * self.countfunc(None)
 
 class Range(Subconstruct):
     """
@@ -405,22 +777,28 @@ class Range(Subconstruct):
     def _parse(self, stream, context):
         obj = ListContainer()
         c = 0
+        size = self.subcon.static_sizeof()
+        if size is not None:
+            # the position of every element is known without asking the stream
+            start = stream.tell()
         try:
             if self.subcon.conflags & self.FLAG_COPY_CONTEXT:
                 while c < self.maxcout:
-                    pos = stream.tell()
+                    if size is None:
+                        pos = stream.tell()
                     obj.append(self.subcon._parse(stream, context.__copy__()))
                     c += 1
             else:
                 while c < self.maxcout:
-                    pos = stream.tell()
+                    if size is None:
+                        pos = stream.tell()
                     obj.append(self.subcon._parse(stream, context))
                     c += 1
         except ConstructError, ex:
             if c < self.mincount:
                 raise RangeError("expected %d to %d, found %d" % 
                     (self.mincount, self.maxcout, c), ex)
-            stream.seek(pos)
+            stream.seek(pos if size is None else start + c * size)
         return obj
     def _build(self, obj, stream, context):
         if len(obj) < self.mincount or len(obj) > self.maxcout:
@@ -507,6 +885,27 @@ class RepeatUntil(Subconstruct):
 #===============================================================================
 # structures and sequences
 #===============================================================================
+def _field_names(subcons):
+    """
+    returns the names of the fields of the objects parsed by a Struct of the 
+    given subcons, in order, including those of embedded Structs
+    """
+    names = []
+    for sc in subcons:
+        if sc.conflags & Construct.FLAG_EMBED:
+            inner = sc
+            while type(inner) is not Struct and hasattr(inner, "subcon"):
+                inner = inner.subcon
+            if type(inner) is not Struct:
+                raise TypeError("only Structs can be embedded in records", sc)
+            fields = _field_names(inner.subcons)
+        elif sc.name is not None:
+            fields = [sc.name]
+        else:
+            fields = []
+        names.extend(name for name in fields if name not in names)
+    return names
+
 class Struct(Construct):
     """
     A sequence of named constructs, similar to structs in C. The elements are
@@ -519,6 +918,12 @@ class Struct(Construct):
     * nested - a keyword-only argument that indicates whether this struct 
       creates a nested context. The default is True. This parameter is 
       considered "advanced usage", and may be removed in the future.
+    * record - a keyword-only argument that indicates whether this struct 
+      parses into instances of a Record class made for it, which keeps the 
+      fields in __slots__, instead of Containers. The default is False. 
+      Records take less memory and are faster to access, but can not be 
+      given attributes other than the fields of the struct (including those 
+      of the Structs embedded in it).
     
     Example:
     Struct("foo",
@@ -528,13 +933,17 @@ class Struct(Construct):
         UBInt8("third_element"),
     )
     """
-    __slots__ = ["subcons", "nested"]
+    __slots__ = ["subcons", "nested", "record"]
     def __init__(self, name, *subcons, **kw):
         self.nested = kw.pop("nested", True)
+        record = kw.pop("record", False)
         if kw:
-            raise TypeError("the only keyword argument accepted is 'nested'", kw)
+            raise TypeError("the only keyword arguments accepted are 'nested' and 'record'", kw)
         Construct.__init__(self, name)
         self.subcons = subcons
+        self.record = None
+        if record:
+            self.record = record_class(name or "Record", _field_names(subcons))
         self._inherit_flags(*subcons)
         self._clear_flag(self.FLAG_EMBED)
     def _parse(self, stream, context):
@@ -542,7 +951,7 @@ class Struct(Construct):
             obj = context["<obj>"]
             del context["<obj>"]
         else:
-            obj = Container()
+            obj = Container() if self.record is None else self.record()
             if self.nested:
                 context = AttrDict(_ = context)
         for sc in self.subcons:
@@ -555,6 +964,24 @@ class Struct(Construct):
                     obj[sc.name] = subobj
                     context[sc.name] = subobj
         return obj
+    def _parse_from(self, buffer, offset, context):
+        if "<obj>" in context:
+            obj = context["<obj>"]
+            del context["<obj>"]
+        else:
+            obj = Container() if self.record is None else self.record()
+            if self.nested:
+                context = AttrDict(_ = context)
+        for sc in self.subcons:
+            if sc.conflags & self.FLAG_EMBED:
+                context["<obj>"] = obj
+                offset = sc._parse_from(buffer, offset, context)[1]
+            else:
+                subobj, offset = sc._parse_from(buffer, offset, context)
+                if sc.name is not None:
+                    obj[sc.name] = subobj
+                    context[sc.name] = subobj
+        return obj, offset
     def _build(self, obj, stream, context):
         if "<unnested>" in context:
             del context["<unnested>"]
@@ -570,10 +997,40 @@ class Struct(Construct):
                 subobj = getattr(obj, sc.name)
                 context[sc.name] = subobj
             sc._build(subobj, stream, context)
+    def _build_into(self, obj, buffer, offset, context):
+        if "<unnested>" in context:
+            del context["<unnested>"]
+        elif self.nested:
+            context = AttrDict(_ = context)
+        for sc in self.subcons:
+            if sc.conflags & self.FLAG_EMBED:
+                context["<unnested>"] = True
+                subobj = obj
+            elif sc.name is None:
+                subobj = None
+            else:
+                subobj = getattr(obj, sc.name)
+                context[sc.name] = subobj
+            offset = sc._build_into(subobj, buffer, offset, context)
+        return offset
     def _sizeof(self, context):
         if self.nested:
             context = AttrDict(_ = context)
-        return sum(sc._sizeof(context) for sc in self.subcons)
+        size = 0
+        for sc in self.subcons:
+            static = sc.static_sizeof()
+            size += static if static is not None else sc._sizeof(context)
+        return size
+    def _static_sizeof(self):
+        return sum(_static_sizeof(sc) for sc in self.subcons)
+    def _static_prefix(self):
+        prefix = 0
+        for sc in self.subcons:
+            size = sc.static_sizeof()
+            if size is None:
+                return prefix + sc.static_prefix()
+            prefix += size
+        return prefix
 
 class Sequence(Struct):
     """
@@ -615,6 +1072,24 @@ class Sequence(Struct):
                     obj.append(subobj)
                     context[sc.name] = subobj
         return obj
+    def _parse_from(self, buffer, offset, context):
+        if "<obj>" in context:
+            obj = context["<obj>"]
+            del context["<obj>"]
+        else:
+            obj = ListContainer()
+            if self.nested:
+                context = AttrDict(_ = context)
+        for sc in self.subcons:
+            if sc.conflags & self.FLAG_EMBED:
+                context["<obj>"] = obj
+                offset = sc._parse_from(buffer, offset, context)[1]
+            else:
+                subobj, offset = sc._parse_from(buffer, offset, context)
+                if sc.name is not None:
+                    obj.append(subobj)
+                    context[sc.name] = subobj
+        return obj, offset
     def _build(self, obj, stream, context):
         if "<unnested>" in context:
             del context["<unnested>"]
@@ -631,6 +1106,23 @@ class Sequence(Struct):
                 subobj = objiter.next()
                 context[sc.name] = subobj
             sc._build(subobj, stream, context)
+    def _build_into(self, obj, buffer, offset, context):
+        if "<unnested>" in context:
+            del context["<unnested>"]
+        elif self.nested:
+            context = AttrDict(_ = context)
+        objiter = iter(obj)
+        for sc in self.subcons:
+            if sc.conflags & self.FLAG_EMBED:
+                context["<unnested>"] = True
+                subobj = objiter
+            elif sc.name is None:
+                subobj = None
+            else:
+                subobj = objiter.next()
+                context[sc.name] = subobj
+            offset = sc._build_into(subobj, buffer, offset, context)
+        return offset
 
 class Union(Construct):
     """
@@ -733,6 +1225,13 @@ class Switch(Construct):
             return key, obj
         else:
             return obj
+    def _parse_from(self, buffer, offset, context):
+        key = self.keyfunc(context)
+        obj, offset = self.cases.get(key, self.default)._parse_from(buffer, offset, context)
+        if self.include_key:
+            return (key, obj), offset
+        else:
+            return obj, offset
     def _build(self, obj, stream, context):
         if self.include_key:
             key, obj = obj
@@ -740,6 +1239,13 @@ class Switch(Construct):
             key = self.keyfunc(context)
         case = self.cases.get(key, self.default)
         case._build(obj, stream, context)
+    def _build_into(self, obj, buffer, offset, context):
+        if self.include_key:
+            key, obj = obj
+        else:
+            key = self.keyfunc(context)
+        case = self.cases.get(key, self.default)
+        return case._build_into(obj, buffer, offset, context)
     def _sizeof(self, context):
         case = self.cases.get(self.keyfunc(context), self.default)
         return case._sizeof(context)
@@ -831,7 +1337,8 @@ class Pointer(Subconstruct):
     
     Parameters:
     * offsetfunc: a function that takes the context and returns an absolute 
-      stream position, where the construction would take place
+      stream position, where the construction would take place. with 
+      build_into it is counted from the offset the building started at
     * subcon - the subcon to use at `offsetfunc()`
     
     Example:
@@ -859,6 +1366,11 @@ class Pointer(Subconstruct):
         stream.seek(newpos)
         self.subcon._build(obj, stream, context)
         stream.seek(origpos)
+    def _build_into(self, obj, buffer, offset, context):
+        newpos = _build_base(context) + self.offsetfunc(context)
+        _reserve(buffer, newpos)
+        self.subcon._build_into(obj, buffer, newpos, context)
+        return offset
     def _sizeof(self, context):
         return 0
 
@@ -1025,6 +1537,15 @@ class Restream(Subconstruct):
         obj = self.subcon._parse(stream2, context)
         stream2.close()
         return obj
+    def _parse_from(self, buffer, offset, context):
+        stream = StringIO(buffer)
+        stream.seek(offset)
+        stream2 = self.stream_reader(stream)
+        obj = self.subcon._parse(stream2, context)
+        # the reader may close the stream along with itself
+        offset = stream.tell()
+        stream2.close()
+        return obj, offset
     def _build(self, obj, stream, context):
         stream2 = self.stream_writer(stream)
         self.subcon._build(obj, stream2, context)
@@ -1056,6 +1577,14 @@ class Reconfig(Subconstruct):
         self.subcon = subcon
         self._set_flag(setflags)
         self._clear_flag(clearflags)
+    def _parse_from(self, buffer, offset, context):
+        return self.subcon._parse_from(buffer, offset, context)
+    def _build_into(self, obj, buffer, offset, context):
+        return self.subcon._build_into(obj, buffer, offset, context)
+    def _static_sizeof(self):
+        return _static_sizeof(self.subcon)
+    def _static_prefix(self):
+        return self.subcon.static_prefix()
 
 class Anchor(Construct):
     """
@@ -1084,8 +1613,13 @@ class Anchor(Construct):
     __slots__ = []
     def _parse(self, stream, context):
         return stream.tell()
+    def _parse_from(self, buffer, offset, context):
+        return offset, offset
     def _build(self, obj, stream, context):
         context[self.name] = stream.tell()
+    def _build_into(self, obj, buffer, offset, context):
+        context[self.name] = offset - _build_base(context)
+        return offset
     def _sizeof(self, context):
         return 0
 
@@ -1111,8 +1645,13 @@ class Value(Construct):
         self._set_flag(self.FLAG_DYNAMIC)
     def _parse(self, stream, context):
         return self.func(context)
+    def _parse_from(self, buffer, offset, context):
+        return self.func(context), offset
     def _build(self, obj, stream, context):
         context[self.name] = self.func(context)
+    def _build_into(self, obj, buffer, offset, context):
+        context[self.name] = self.func(context)
+        return offset
     def _sizeof(self, context):
         return 0
 
@@ -1178,6 +1717,13 @@ class LazyBound(Construct):
         if self.bound is None:
             self.bound = self.bindfunc()
         self.bound._build(obj, stream, context)
+    def _build_into(self, obj, buffer, offset, context):
+        if self.bound is None:
+            self.bound = self.bindfunc()
+        return self.bound._build_into(obj, buffer, offset, context)
+    def _static_sizeof(self):
+        # the bound construct may contain this one
+        raise SizeofError("can't calculate size")
     def _sizeof(self, context):
         if self.bound is None:
             self.bound = self.bindfunc()
@@ -1199,8 +1745,13 @@ class Pass(Construct):
     __slots__ = []
     def _parse(self, stream, context):
         pass
+    def _parse_from(self, buffer, offset, context):
+        return None, offset
     def _build(self, obj, stream, context):
         assert obj is None
+    def _build_into(self, obj, buffer, offset, context):
+        assert obj is None
+        return offset
     def _sizeof(self, context):
         return 0
 Pass = Pass(None)
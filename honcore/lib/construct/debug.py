@@ -3,8 +3,7 @@ Debugging utilities for constructs
 """
 import sys
 import traceback
-import pdb
-import inspect
+# pdb and inspect are slow to import, so they are only imported when used
 from core import Construct, Subconstruct
 from lib import HexString, Container, ListContainer, AttrDict
 
@@ -75,6 +74,7 @@ class Probe(Construct):
             obj.context = context
         
         if self.show_stack:
+            import inspect
             obj.stack = ListContainer()
             frames = [s[0] for s in inspect.stack()][1:-1]
             frames.reverse()
@@ -128,6 +128,7 @@ class Debugger(Subconstruct):
         print "".join(traceback.format_exception(*sys.exc_info())[1:])
         if msg:
             print msg
+        import pdb
         pdb.post_mortem(sys.exc_info()[2])
         print "=" * 80
 
@@ -1,9 +1,9 @@
 from binary import int_to_bin, bin_to_int, swap_bytes, encode_bin, decode_bin
 from bitstream import BitStreamReader, BitStreamWriter
 from container import (Container, AttrDict, FlagsContainer, 
-    ListContainer, LazyContainer)
+    ListContainer, LazyContainer, Record, record_class)
 from hex import HexString, hexdump
-from utils import Packer, StringIO
+from utils import Packer, StringIO, SeekableStreams
 from path import drill
 
 
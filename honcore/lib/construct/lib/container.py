@@ -112,6 +112,70 @@ class FlagsContainer(Container):
         attrs.insert(0, self.__class__.__name__+ ":")
         return "\n".join(attrs)
 
+class Record(object):
+    """
+    The base of the record classes made by Structs with record = True: a 
+    container with a fixed set of attributes, kept in __slots__ rather than 
+    in a dict. Records support the same attribute and item access, iteration
+    and comparison as Container. See record_class.
+    """
+    __slots__ = ["__recursion_lock__"]
+    __attrs__ = ()
+    def __init__(self, *values, **kw):
+        for name, value in zip(self.__attrs__, values):
+            object.__setattr__(self, name, value)
+        for name, value in kw.iteritems():
+            setattr(self, name, value)
+    
+    @property
+    def __dict__(self):
+        return dict(self)
+    
+    def __eq__(self, other):
+        try:
+            return self.__dict__ == other.__dict__
+        except AttributeError:
+            return False
+    def __ne__(self, other):
+        return not (self == other)
+    
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+    def __setitem__(self, name, value):
+        try:
+            setattr(self, name, value)
+        except AttributeError:
+            raise KeyError(name)
+    def __update__(self, obj):
+        for name in obj.__attrs__:
+            self[name] = obj[name]
+    def __copy__(self):
+        new = self.__class__.__new__(self.__class__)
+        for name, value in self:
+            object.__setattr__(new, name, value)
+        return new
+    def __iter__(self):
+        for name in self.__attrs__:
+            try:
+                yield name, getattr(self, name)
+            except AttributeError:
+                pass
+    
+    __repr__ = Container.__repr__.im_func
+    __str__ = Container.__str__.im_func
+    __pretty_str__ = Container.__pretty_str__.im_func
+    __introspect__ = Container.__introspect__.im_func
+
+def record_class(name, attrs):
+    """
+    returns a new Record class, with the given attributes in the given order
+    """
+    attrs = tuple(attrs)
+    return type(name, (Record,), {"__slots__" : attrs, "__attrs__" : attrs})
+
 class ListContainer(list):
     """
     A container for lists
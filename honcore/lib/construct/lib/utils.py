@@ -1,7 +1,11 @@
+import StringIO as _StringIO
 try:
-    from cStringIO import StringIO
+    from cStringIO import StringIO, InputType, OutputType
+    # streams which can be read ahead of a field and seeked back
+    SeekableStreams = (InputType, OutputType, _StringIO.StringIO, file)
 except ImportError:
     from StringIO import StringIO
+    SeekableStreams = (_StringIO.StringIO, file)
 
 
 try:
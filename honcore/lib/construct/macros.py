@@ -519,6 +519,9 @@ def CString(name, terminators="\x00", encoding=None,
     :param str encoding: encoding (e.g. "utf8") or None for no encoding
     :param ``Construct`` char_field: construct representing a single character
 
+    With the default `char_field` this is a ``CStringField``, which finds the
+    terminator in one search rather than reading a character at a time.
+
     >>> foo = CString("foo")
     >>>
     >>> foo.parse("hello\\x00")
@@ -537,6 +540,8 @@ def CString(name, terminators="\x00", encoding=None,
     >>> foo.build("hello")
     'helloX'
     """
+    if type(char_field) is StaticField and char_field.length == 1:
+        return CStringField(name, terminators, encoding)
     return Rename(name,
         CStringAdapter(
             RepeatUntil(lambda obj, ctx: obj in terminators,
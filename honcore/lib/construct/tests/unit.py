@@ -8,6 +8,13 @@ import warnings
 warnings.filterwarnings("ignore", category = DeprecationWarning)
 
 
+def build_into(construct, obj):
+    """builds into a buffer after a byte, returning the buffer and the offset"""
+    buffer = bytearray("\x00")
+    offset = construct.build_into(obj, buffer, 1)
+    return str(buffer), offset
+
+
 # declarative to the bitter end!
 tests = [
     #
@@ -43,6 +50,13 @@ tests = [
     [MetaArray(lambda ctx: 3, UBInt8("metaarray")).parse, "\x01\x02", None, ArrayError],
     [MetaArray(lambda ctx: 3, UBInt8("metaarray")).build, [1,2,3], "\x01\x02\x03", None],
     [MetaArray(lambda ctx: 3, UBInt8("metaarray")).build, [1,2], None, ArrayError],
+    [MetaArray(lambda ctx: 0, UBInt8("metaarray")).parse, "", [], None],
+    [MetaArray(lambda ctx: 2, Struct("metaarray", ULInt32("a"), UBInt8("b"))).parse, "\x01\x00\x00\x00\x02\x03\x00\x00\x00\x04", [Container(a=1,b=2), Container(a=3,b=4)], None],
+    [MetaArray(lambda ctx: 2, Struct("metaarray", ULInt32("a"), UBInt8("b"))).parse, "\x01\x00\x00\x00\x02\x03\x00", None, ArrayError],
+    [MetaArray(lambda ctx: 2, Struct("metaarray", ULInt32("a"), UBInt8("b"))).parse_from, ("x\x01\x00\x00\x00\x02\x03\x00\x00\x00\x04", 1), ([Container(a=1,b=2), Container(a=3,b=4)], 11), None],
+    [MetaArray(lambda ctx: 2, Struct("metaarray", ULInt32("a"), UBInt8("b"))).parse_from, ("x\x01\x00\x00\x00\x02", 1), None, ArrayError],
+    [MetaArray(lambda ctx: 2, Struct("metaarray", UBInt8("a"), ULInt16("b"))).parse, "\x01\x02\x00\x03\x04\x00", [Container(a=1,b=2), Container(a=3,b=4)], None],
+    [MetaArray(lambda ctx: 2, Struct("metaarray", UBInt16("a"), ULInt16("b"))).parse, "\x00\x01\x02\x00\x00\x03\x04\x00", [Container(a=1,b=2), Container(a=3,b=4)], None],
     
     [Range(3, 5, UBInt8("range")).parse, "\x01\x02\x03", [1,2,3], None],
     [Range(3, 5, UBInt8("range")).parse, "\x01\x02\x03\x04", [1,2,3,4], None],
@@ -65,6 +79,18 @@ tests = [
     [Struct("struct", UBInt8("a"), UBInt16("b")).build, Container(a=1,b=2), "\x01\x00\x02", None],
     [Struct("struct", UBInt8("a"), UBInt16("b"), Struct("foo", UBInt8("c"), UBInt8("d"))).build, Container(a=1,b=2,foo=Container(c=3,d=4)), "\x01\x00\x02\x03\x04", None],
     [Struct("struct", UBInt8("a"), UBInt16("b"), Embedded(Struct("foo", UBInt8("c"), UBInt8("d")))).build, Container(a=1,b=2,c=3,d=4), "\x01\x00\x02\x03\x04", None],
+    [Struct("struct", UBInt8("a"), UBInt16("b"), record = True).parse, "\x01\x00\x02", Container(a=1,b=2), None],
+    [lambda data: isinstance(Struct("struct", UBInt8("a"), record = True).parse(data), Record), "\x01", True, None],
+    [lambda data: Struct("struct", UBInt8("a"), UBInt16("b"), record = True).parse(data)["b"], "\x01\x00\x02", 2, None],
+    [lambda data: list(Struct("struct", UBInt8("b"), UBInt8("a"), record = True).parse(data)), "\x01\x02", [("b", 1), ("a", 2)], None],
+    [Struct("struct", UBInt8("a"), Embedded(Struct("foo", UBInt8("c"), UBInt8("d"))), record = True).parse, "\x01\x02\x03", Container(a=1,c=2,d=3), None],
+    [Struct("struct", UBInt8("a"), UBInt16("b"), record = True).build, Container(a=1,b=2), "\x01\x00\x02", None],
+    [Struct("struct", UBInt8("a"), UBInt16("b"), record = True).build, Struct("struct", UBInt8("a"), UBInt16("b"), record = True).parse("\x01\x00\x02"), "\x01\x00\x02", None],
+    [lambda name: Struct(name, UBInt8("a"), Embedded(Array(1, UBInt8("b"))), record = True), "struct", None, TypeError],
+    [lambda data: Struct("struct", UBInt8("a"), record = True).parse(data).b, "\x01", None, AttributeError],
+    [lambda data: isinstance(Array(2, Struct("struct", UBInt8("a"), record = True)).parse(data)[1], Record), "\x01\x02", True, None],
+    [lambda data: isinstance(Struct("struct", UBInt8("a"), CString("b"), record = True).compile()(data), Record), "\x01x\x00", True, None],
+    [Struct("struct", UBInt8("a"), CString("b"), record = True).compile(), "\x01x\x00", Container(a=1,b="x"), None],
     
     [Sequence("sequence", UBInt8("a"), UBInt16("b")).parse, "\x01\x00\x02", [1,2], None],
     [Sequence("sequence", UBInt8("a"), UBInt16("b"), Sequence("foo", UBInt8("c"), UBInt8("d"))).parse, "\x01\x00\x02\x03\x04", [1,2,[3,4]], None],
@@ -351,6 +377,14 @@ tests = [
     
     [CString("cstring").parse, "hello\x00", "hello", None],
     [CString("cstring").build, "hello", "hello\x00", None],
+    [CString("cstring").parse, "hello", None, ArrayError],
+    [CString("cstring", terminators = "XYZ").parse, "helloYabc", "hello", None],
+    [CString("cstring", encoding = "utf8").parse, "hello\xe1\x88\xb4\x00", u"hello\u1234", None],
+    [CString("cstring", encoding = "utf8").build, u"hello\u1234", "hello\xe1\x88\xb4\x00", None],
+    [CString("cstring", char_field = Field(None, 1)).parse, "hello\x00", "hello", None],
+    [Struct("struct", CString("a"), UBInt8("b")).parse, "x" * 200 + "\x00\x01", Container(a="x" * 200,b=1), None],
+    [CStringField("cstringfield", terminators = "\n\x00").parse, "hello\n", "hello", None],
+    [CStringField("cstringfield", terminators = "\n\x00").build, "hello", "hello\n", None],
     
     [PrefixedArray(UBInt8("array"), UBInt8("count")).parse, "\x03\x01\x01\x01", [1,1,1], None],
     [PrefixedArray(UBInt8("array"), UBInt8("count")).parse, "\x03\x01\x01", None, ArrayError],
@@ -368,6 +402,88 @@ tests = [
     [Magic("MZ").parse, "MZ", "MZ", None],
     [Magic("MZ").parse, "ELF", None, ConstError],
     [Magic("MZ").build, None, "MZ", None],
+    
+    #
+    # parse_from
+    #
+    [StaticField("staticfield", 2).parse_from, ("xxab", 2), ("ab", 4), None],
+    [StaticField("staticfield", 2).parse_from, ("xxa", 2), None, FieldError],
+    [FormatField("formatfield", "<", "L").parse_from, (bytearray("xx\x12\x34\x56\x78"), 2), (0x78563412, 6), None],
+    [FormatField("formatfield", "<", "L").parse_from, ("xx\x12\x34\x56", 2), None, FieldError],
+    [CString("cstring").parse_from, (memoryview("xxhello\x00yy"), 2), ("hello", 8), None],
+    [CString("cstring").parse_from, ("xxhello", 2), None, ArrayError],
+    [Struct("struct", UBInt8("a"), UBInt16("b")).parse_from, ("xx\x01\x00\x02", 2), (Container(a=1,b=2), 5), None],
+    [Struct("struct", UBInt8("a"), Embedded(Struct("foo", UBInt8("c"), UBInt8("d")))).parse_from, ("\x01\x02\x03", 0), (Container(a=1,c=2,d=3), 3), None],
+    [Sequence("sequence", UBInt8("a"), UBInt16("b")).parse_from, ("x\x01\x00\x02", 1), ([1,2], 4), None],
+    [Struct("struct", UBInt8("count"), MetaArray(lambda ctx: ctx.count, UBInt8("a"))).parse_from, ("x\x02\x01\x02", 1), (Container(count=2,a=[1,2]), 4), None],
+    [Struct("struct", UBInt8("count"), MetaArray(lambda ctx: ctx.count, UBInt8("a"))).parse_from, ("\x03\x01\x02", 0), None, ArrayError],
+    [Struct("struct", UBInt8("a"), If(lambda ctx: ctx.a == 1, UBInt8("b")), Anchor("end")).parse_from, ("x\x01\x02", 1), (Container(a=1,b=2,end=3), 3), None],
+    [Struct("struct", UBInt8("a"), Peek(UBInt8("b")), UBInt8("c")).parse_from, ("x\x01\x02", 1), (Container(a=1,b=2,c=2), 3), None],
+    [Struct("struct", Enum(UBInt8("a"), x = 1, y = 2)).parse_from, ("x\x02", 1), (Container(a="y"), 2), None],
+    
+    #
+    # build_into
+    #
+    [lambda obj: build_into(UBInt16("formatfield"), obj), 0x1234, ("\x00\x12\x34", 3), None],
+    [lambda obj: build_into(UBInt16("formatfield"), obj), "x", None, FieldError],
+    [lambda obj: build_into(StaticField("staticfield", 2), obj), "ab", ("\x00ab", 3), None],
+    [lambda obj: build_into(StaticField("staticfield", 2), obj), "abc", None, FieldError],
+    [lambda obj: build_into(CString("cstring"), obj), "hello", ("\x00hello\x00", 7), None],
+    [lambda obj: build_into(CString("cstring", encoding = "utf8"), obj), u"\u1234", ("\x00\xe1\x88\xb4\x00", 5), None],
+    [lambda obj: build_into(Struct("struct", UBInt8("a"), CString("b"), ULInt16("c")), obj), Container(a=1,b="x",c=2), ("\x00\x01x\x00\x02\x00", 6), None],
+    [lambda obj: build_into(Struct("struct", UBInt8("a"), Embedded(Struct("foo", UBInt8("c"), UBInt8("d")))), obj), Container(a=1,c=2,d=3), ("\x00\x01\x02\x03", 4), None],
+    [lambda obj: build_into(Sequence("sequence", UBInt8("a"), UBInt16("b")), obj), [1,2], ("\x00\x01\x00\x02", 4), None],
+    [lambda obj: build_into(Array(2, Struct("struct", ULInt16("a"), UBInt8("b"))), obj), [Container(a=1,b=2), Container(a=3,b=4)], ("\x00\x01\x00\x02\x03\x00\x04", 7), None],
+    [lambda obj: build_into(Array(2, Struct("struct", ULInt16("a"), UBInt8("b"))), obj), [Container(a=1,b=2)], None, ArrayError],
+    [lambda obj: build_into(Struct("struct", UBInt8("n"), MetaArray(lambda ctx: ctx.n, CString("a"))), obj), Container(n=2,a=["x","y"]), ("\x00\x02x\x00y\x00", 6), None],
+    [lambda obj: build_into(Struct("struct", UBInt8("a"), If(lambda ctx: ctx.a == 1, UBInt8("b"))), obj), Container(a=1,b=2), ("\x00\x01\x02", 3), None],
+    [lambda obj: build_into(Struct("struct", UBInt8("a"), Anchor("b"), Value("c", lambda ctx: ctx.b)), obj), Container(a=1,b=None,c=None), ("\x00\x01", 2), None],
+    [lambda obj: build_into(Struct("struct", Enum(UBInt8("a"), x = 1, y = 2)), obj), Container(a="y"), ("\x00\x02", 2), None],
+    [lambda obj: build_into(Pointer(lambda ctx: 2, UBInt8("pointer")), obj), 7, ("\x00\x00\x00\x07", 1), None],
+    [lambda obj: build_into(Struct("struct", UBInt8("a"), Anchor("b"), Pointer(lambda ctx: ctx.b + 1, UBInt8("c"))), obj), Container(a=1,b=None,c=5), ("\x00\x01\x00\x05", 2), None],
+    [lambda obj: build_into(Struct("struct", UBInt8("a"), Range(1, 3, UBInt8("b"))), obj), Container(a=1,b=[2,3]), ("\x00\x01\x02\x03", 4), None],
+    
+    #
+    # static sizes
+    #
+    [UBInt32("formatfield").static_sizeof, (), 4, None],
+    [CString("cstring").static_sizeof, (), None, None],
+    [Struct("struct", UBInt8("a"), Array(3, UBInt16("b")), Padding(2)).static_sizeof, (), 9, None],
+    [Struct("struct", UBInt8("a"), Array(3, UBInt16("b")), Padding(2)).static_prefix, (), 9, None],
+    [Struct("struct", UBInt8("a"), CString("b"), UBInt8("c")).static_sizeof, (), None, None],
+    [Struct("struct", UBInt8("a"), CString("b"), UBInt8("c")).static_prefix, (), 1, None],
+    [Struct("struct", UBInt8("a"), Struct("foo", UBInt16("b"), CString("c"))).static_prefix, (), 3, None],
+    [Struct("struct", UBInt8("a"), Embedded(Struct("foo", UBInt16("b"))), UBInt8("c")).static_sizeof, (), 4, None],
+    [Struct("struct", UBInt8("n"), MetaArray(lambda ctx: ctx.n, UBInt16("a"))).static_sizeof, (), None, None],
+    [MetaArray(lambda ctx: ctx.n, UBInt16("metaarray")).sizeof, AttrDict(n = 3), 6, None],
+    [Struct("struct", UBInt8("a"), CString("b")).sizeof, (), None, SizeofError],
+    [Enum(UBInt8("enum"), x = 1).static_sizeof, (), 1, None],
+    [LazyBound("lazybound", lambda: UBInt8("foo")).static_sizeof, (), None, None],
+    [Range(1, 3, Struct("range", UBInt8("a"), OneOf(UBInt8("b"), [1]))).parse, "\x01\x01\x02\x01\x03\x02", [Container(a=1,b=1), Container(a=2,b=1)], None],
+    [Struct("struct", Range(1, 3, OneOf(UBInt16("a"), [1])), UBInt16("b")).parse, "\x00\x01\x00\x02", Container(a=[1],b=2), None],
+    
+    #
+    # compiler
+    #
+    [Struct("struct", UBInt8("a"), UBInt16("b"), ULInt32("c")).compile(), "\x01\x00\x02\x03\x00\x00\x00", Container(a=1,b=2,c=3), None],
+    [Struct("struct", UBInt8("a"), UBInt16("b")).compile(), "\x01\x00", None, FieldError],
+    [Struct("struct", UBInt8("a"), Struct("foo", UBInt8("c"), UBInt8("d"))).compile(), "\x01\x02\x03", Container(a=1,foo=Container(c=2,d=3)), None],
+    [Struct("struct", UBInt8("a"), Embedded(Struct("foo", UBInt8("c"), UBInt8("d")))).compile(), "\x01\x02\x03", Container(a=1,c=2,d=3), None],
+    [Struct("struct", StaticField("a", 2), CString("b"), UBInt8("c")).compile(), "abhello\x00\x01", Container(a="ab",b="hello",c=1), None],
+    [Struct("struct", CString("b", terminators = "XY"), UBInt8("c")).compile(), "helloY\x01", Container(b="hello",c=1), None],
+    [CString("cstring", encoding = "utf8").compile(), "hello\xe1\x88\xb4\x00", u"hello\u1234", None],
+    [CString("cstring").compile(), "hello", None, ArrayError],
+    [Struct("struct", UBInt8("count"), MetaArray(lambda ctx: ctx.count, UBInt8("a"))).compile(), "\x02\x01\x02", Container(count=2,a=[1,2]), None],
+    [Struct("struct", UBInt8("count"), MetaArray(lambda ctx: ctx.count, UBInt8("a"))).compile(), "\x03\x01\x02", None, ArrayError],
+    [Array(2, Struct("item", ULInt32("a"), UBInt8("b"))).compile(), "\x01\x00\x00\x00\x02\x03\x00\x00\x00\x04", [Container(a=1,b=2), Container(a=3,b=4)], None],
+    [Array(2, Struct("item", ULInt32("a"), UBInt8("b"))).compile(), "\x01\x00\x00\x00\x02", None, ArrayError],
+    [Array(2, Struct("item", UBInt8("a"), CString("b"))).compile(), "\x01x\x00\x02y\x00", [Container(a=1,b="x"), Container(a=2,b="y")], None],
+    [Struct("struct", UBInt8("a"), If(lambda ctx: ctx.a == 1, UBInt8("b"))).compile(), "\x01\x02", Container(a=1,b=2), None],
+    [Struct("struct", UBInt8("a"), If(lambda ctx: ctx.a == 1, UBInt8("b"))).compile(), "\x00", Container(a=0,b=None), None],
+    [Switch("switch", lambda ctx: 5, {1 : UBInt8("x")}).compile(), "\x07", None, SwitchError],
+    [Struct("struct", UBInt8("a"), Value("b", lambda ctx: ctx.a * 2)).compile(), "\x03", Container(a=3,b=6), None],
+    [Struct("struct", UBInt8("a"), Peek(UBInt8("b")), UBInt8("c")).compile(), "\x01\x02", Container(a=1,b=2,c=2), None],
+    [Struct("struct", Enum(UBInt8("a"), x = 1, y = 2)).compile(), "\x02", Container(a="y"), None],
 ]
 
 
@@ -3,11 +3,14 @@ HoNCore. Python library providing connectivity and functionality
 with HoN's chat server.
 """
 
-import struct, time, threading, thread, socket
+import struct, time, threading, thread, socket, traceback, Queue, asyncore, errno, select, collections
 from exceptions import *
 from constants import *
 from common import User
-from lib.construct import *
+from encoders import *
+from decoders import decoders
+from schema import client_packets
+from lib.construct import Struct, Byte, ULInt8, ULInt32, CString, If, MetaRepeater
 
 
 class SocketListener(threading.Thread):
@@ -27,20 +30,350 @@ class SocketListener(threading.Thread):
     def run(self):
         while not self.stopped:
             try:
-                packet = self.chat_socket.recv()
-                if not packet:
+                packets = self.chat_socket.recv()
+                if packets is None:
                     #print "Empty packet received, socket terminated."
                     self.stopped = True
                     break
-                #print "Packet 0x%x on socket %s" % (struct.unpack('H', packet[2:4])[0], self.chat_socket.socket)
-                threading.Thread(target=self.chat_socket.parse_packet, name='PacketParser', args=(packet,)).start()
-                #self.chat_socket.parse_packet(packet)
+                for packet in packets:
+                    #print "Packet 0x%x on socket %s" % (struct.unpack_from('H', packet, 2)[0], self.chat_socket.socket)
+                    self.chat_socket.dispatch(packet)
             except socket.timeout, e:
                 #print "Socket.timeout: %s" % e
                 continue
             except socket.error, e:
                 #print "Socket.error: %s" % e
                 break
+            except AttributeError:
+                # The socket has been removed by a disconnect.
+                break
+        # Let is_connected see that the connection is gone.
+        self.stopped = True
+
+class PacketFramer:
+    """ Splits the data received from the chat server into packets.
+
+        Data is read with a single `recv_into` call into a reusable bytearray, and every
+        complete packet in the buffer is returned as a memoryview slice of it. A burst of
+        small packets costs one system call, and framing them copies nothing. The packets
+        which are decoded are still copied once, by `PacketParser.parse_data`, as the 
+        decoders need a string to search for the end of each string field.
+
+        The slices are only valid until the next call to `fill`, as the buffer is then reused.
+        Anything holding on to a packet past that point must copy it with `tobytes()`.
+        Before each read any partial packet is moved to the front of the buffer, and the 
+        buffer is replaced with a larger one if the partial packet would not fit.
+    """
+    def __init__(self, size=65536):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # Offset of the first byte not yet returned in a packet.
+        self.end = 0    # Offset following the last byte received.
+
+    def fill(self, sock):
+        """ Reads from the socket and returns a list of the complete packets received, which 
+            may be empty if only part of a packet arrived. Returns None if the socket was closed.
+        """
+        self.compact()
+        received = sock.recv_into(self.view[self.end:])
+        if not received:
+            return None
+        self.end += received
+        return self.frames()
+
+    def frames(self):
+        """ Returns a list of the complete packets in the buffer and consumes them. """
+        frames = []
+        start, end = self.start, self.end
+        while end - start >= 2:
+            # Packet length is packed into 2 bytes at the start.
+            frame_end = start + 2 + struct.unpack_from('>H', self.buffer, start)[0]
+            if frame_end > end:
+                break
+            frames.append(self.view[start:frame_end])
+            start = frame_end
+        self.start = start
+        return frames
+
+    def compact(self):
+        """ Moves the partial packet left in the buffer to the front, growing the buffer if needed. """
+        pending = self.end - self.start
+        if pending >= 2:
+            needed = 2 + struct.unpack_from('>H', self.buffer, self.start)[0]
+            if needed > len(self.buffer):
+                buffer = bytearray(max(needed, 2 * len(self.buffer)))
+                buffer[:pending] = self.buffer[self.start:self.end]
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+                self.start, self.end = 0, pending
+                return
+        if self.start > 0:
+            if pending:
+                self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+
+class PacketDispatcher:
+    """ A fixed pool of worker threads which trigger the event handlers for received
+        packets, used instead of starting a new thread for every packet.
+
+        Packets are parsed on the listener thread and handed to a worker chosen by the
+        packet's key, which is either the channel ID or the account ID the packet refers to.
+        Packets sharing a key always go to the same worker, so their handlers are run in
+        the order the packets arrived on the wire. Packets without a key go to the first worker.
+
+        Each worker has a bounded queue. When a queue is full the listener blocks until the
+        worker catches up, which in turn stops the socket from being read.
+    """
+    def __init__(self, chat_socket, workers=4, queue_size=1000, key="channel"):
+        if key not in ("channel", "account") or workers < 1:
+            raise HoNConfigError(15) # Invalid configuration value.
+        self.chat_socket = chat_socket
+        self.key = key
+        self.queues = [Queue.Queue(queue_size) for i in range(workers)]
+        self.workers = [threading.Thread(target=self.__work, name='PacketWorker-%d' % i, args=(q,))
+                            for i, q in enumerate(self.queues)]
+
+    def __repr__(self):
+        return "<PacketDispatcher with %d workers on socket %s>" % (len(self.workers), self.chat_socket.socket)
+
+    def start(self):
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def stop(self):
+        """ Lets each worker finish the packets already queued and then stops it. """
+        for queue in self.queues:
+            queue.put(None)
+        for worker in self.workers:
+            if worker is not threading.current_thread():
+                worker.join()
+
+    def dispatch(self, packet):
+        """ Parses the packet and queues it on the worker responsible for its key. """
+        try:
+            packet_id, packet_data = self.chat_socket.decode_packet(packet)
+        except Exception:
+            # A malformed packet should not stop the listener reading the ones after it.
+            traceback.print_exc()
+            return
+        # The packet is still a view of the receive buffer, which is reused before the worker runs.
+        packet = self.chat_socket.raw_packet(packet)
+        key = self.packet_key(packet_data)
+        if key is None:
+            queue = self.queues[0]
+        else:
+            queue = self.queues[hash(key) % len(self.queues)]
+        queue.put((packet_id, packet, packet_data))
+
+    def packet_key(self, packet_data):
+        """ Returns the channel or account ID which the packet's handlers must be ordered by. """
+        if packet_data is None:
+            return None
+        if self.key == "channel":
+            return packet_data.get('channel_id')
+        if 'account_id' in packet_data:
+            return packet_data['account_id']
+        if 'user' in packet_data:
+            return packet_data['user'].account_id
+        return None
+
+    def __work(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            try:
+                self.chat_socket.trigger_events(*item)
+            except Exception:
+                # Keep the worker alive, a dead worker would stall every packet with its key.
+                traceback.print_exc()
+
+class PacketWriter(threading.Thread):
+    """ A threaded writer which sends queued packets to the chat server, so that
+        sending never blocks the caller.
+
+        Packets are queued in one of two lanes. The priority lane is for pongs and the
+        authentication request, and is always emptied first so they are not held up behind
+        a burst of messages. Everything waiting is coalesced into a single `sendall`, of 
+        up to `max_write` bytes, each time the writer wakes.
+
+        `queue_depth` is the number of packets waiting and `bytes_in_flight` the number
+        of bytes queued or being written. Once a write fails, the packets waiting are 
+        dropped and the error is raised by the next `put`.
+    """
+    def __init__(self, chat_socket, max_write=65536):
+        threading.Thread.__init__(self, name='PacketWriter')
+        self.daemon = True
+        self.chat_socket = chat_socket
+        self.max_write = max_write
+        self.priority = collections.deque()
+        self.normal = collections.deque()
+        self.condition = threading.Condition()
+        self.bytes_in_flight = 0
+        self.stopped = False
+        self.error = None
+
+    def __repr__(self):
+        return "<PacketWriter on socket %s>" % self.chat_socket.socket
+
+    @property
+    def queue_depth(self):
+        return len(self.priority) + len(self.normal)
+
+    def put(self, data, priority=False):
+        """ Queues the data to be written, raising the error which stopped the writer if it failed. """
+        with self.condition:
+            if self.error is not None:
+                raise self.error
+            if priority:
+                self.priority.append(data)
+            else:
+                self.normal.append(data)
+            self.bytes_in_flight += len(data)
+            self.condition.notify()
+
+    def stop(self):
+        """ Stops the writer once the current write is done, anything still queued is dropped. """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.priority and not self.normal and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    break
+                batch = []
+                size = 0
+                for lane in (self.priority, self.normal):
+                    while lane and (not batch or size + len(lane[0]) <= self.max_write):
+                        data = lane.popleft()
+                        batch.append(data)
+                        size += len(data)
+            try:
+                self.chat_socket.socket.sendall(''.join(batch))
+            except (socket.error, AttributeError), e:
+                # The socket has been closed, or has been removed by a disconnect.
+                with self.condition:
+                    self.error = e if isinstance(e, socket.error) else socket.error(errno.EPIPE, 'Broken pipe')
+                    # Nothing still queued will be written now.
+                    self.priority.clear()
+                    self.normal.clear()
+                    self.bytes_in_flight = 0
+                break
+            with self.condition:
+                self.bytes_in_flight -= size
+
+class SessionMultiplexer(threading.Thread):
+    """ Runs the chat sockets of many clients from a single thread, in place of a
+        SocketListener for each of them.
+
+        A client is added with `add`, and its chat socket is then registered with the
+        multiplexer whenever it connects. The sockets are watched with epoll, or poll where
+        epoll is not available, and any packets received are framed, parsed and have their
+        events triggered on the multiplexer's thread, so handlers should not block.
+
+        `stats` reports the rate of packets received by each client and by all of them.
+    """
+    def __init__(self, poll_timeout=1.0):
+        threading.Thread.__init__(self, name='SessionMultiplexer')
+        self.daemon = True
+        self.stopped = False
+        self.poll_timeout = poll_timeout
+        if hasattr(select, 'epoll'):
+            self.poller = select.epoll()
+            self.events = select.EPOLLIN
+            self.timeout = poll_timeout
+        else:
+            self.poller = select.poll()
+            self.events = select.POLLIN
+            self.timeout = int(poll_timeout * 1000) # Milliseconds for poll.
+        self.sockets = {}       # Registered chat sockets by file descriptor.
+        self.clients = []
+        self.counts = {}        # The packets received by each client at the last call to stats.
+        self.sampled = time.time()
+
+    def __repr__(self):
+        return "<SessionMultiplexer with %d sockets>" % len(self.sockets)
+
+    def add(self, client):
+        """ Configures the client to use this multiplexer for its chat socket. """
+        client._configure(multiplexer=self)
+        self.clients.append(client)
+        self.counts[client] = client.packets_received
+
+    def remove(self, client):
+        """ Stops the client from using this multiplexer from its next connection. """
+        client._configure(multiplexer=None)
+        self.clients.remove(client)
+        del self.counts[client]
+
+    def register(self, chat_socket):
+        """ Starts watching a connected chat socket. """
+        fileno = chat_socket.socket.fileno()
+        self.sockets[fileno] = chat_socket
+        self.poller.register(fileno, self.events)
+
+    def unregister(self, chat_socket):
+        """ Stops watching a chat socket. Must be called before the socket is closed. """
+        for fileno, registered in self.sockets.items():
+            if registered is chat_socket:
+                del self.sockets[fileno]
+                try:
+                    self.poller.unregister(fileno)
+                except (IOError, KeyError):
+                    pass
+
+    def stop(self):
+        self.stopped = True
+        if self is not threading.current_thread():
+            self.join()
+
+    def stats(self):
+        """ Returns the packets received per second since the last call, as a dict with
+            the rate for each client under `sessions` and the combined rate under `total`.
+        """
+        now = time.time()
+        elapsed = max(now - self.sampled, 1e-6)
+        self.sampled = now
+        rates = {}
+        for client in self.clients:
+            count = client.packets_received
+            rates[client] = (count - self.counts[client]) / elapsed
+            self.counts[client] = count
+        return {'sessions': rates, 'total': sum(rates.values())}
+
+    def run(self):
+        while not self.stopped:
+            try:
+                ready = self.poller.poll(self.timeout)
+            except (IOError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fileno, event in ready:
+                chat_socket = self.sockets.get(fileno)
+                if chat_socket is None:
+                    continue
+                try:
+                    packets = chat_socket.recv()
+                except socket.error:
+                    packets = None
+                if packets is None:
+                    # The socket has been broken early.
+                    self.unregister(chat_socket)
+                    chat_socket.connected = False
+                    chat_socket.authenticated = False
+                    continue
+                for packet in packets:
+                    try:
+                        chat_socket.parse_packet(packet)
+                    except Exception:
+                        # A failing handler should not stop the other sessions.
+                        traceback.print_exc()
 
 class ChatSocket:
     """ Represents the socket connected to the chat server.
@@ -53,14 +386,30 @@ class ChatSocket:
             `authenticated` Represents the state of the chat server, and if it 
                             is happy to communicate.
         Both states are used to consider if the connection is available.
+
+        Received packets are read by a SocketListener, or by the SessionMultiplexer given
+        in the `multiplexer` setting of the client's configuration.
+        They are handled according to the `dispatcher` setting of the configuration.
+        If `send_queue` is set, packets are sent by a PacketWriter rather than by the
+        thread sending them.
+            `thread`    Each packet is parsed and handled in a new thread.
+            `pool`      Packets are handled by a PacketDispatcher, configured with 
+                        `dispatch_workers`, `dispatch_queue_size` and `dispatch_key`.
     """
-    def __init__(self, client_events):
+    def __init__(self, client_events, config=None):
         self.socket = None
         self.connected = False
         self.authenticated = False
         self.listener = None
-        self.packet_parser = PacketParser()
+        self.dispatcher = None
+        self.writer = None
+        self.framer = None
+        self.packets_received = 0
+        self.packet_counts = collections.defaultdict(int)   # Packets received by packet ID, decoded or not.
+        self.packets_skipped = 0
         self.events = client_events
+        self.config = config if config is not None else {}
+        self.packet_parser = PacketParser(self.config)
 
         # Transparently connect the ping event to the pong sender.
         self.events[HON_SC_PING].connect(self.send_pong, priority=1)
@@ -95,7 +444,7 @@ class ChatSocket:
             clients every 30 seconds. Each client would hold the connection for 30 seconds.
         """
         # The socket has been broken early.
-        if self.listener.stopped is True and self.connected is True:
+        if self.listener is not None and self.listener.stopped is True and self.connected is True:
             self.connected = False
             self.authenticated = False
         return self.connected
@@ -106,6 +455,41 @@ class ChatSocket:
             of connecting to the socket, otherwise it will simply hang up.
             But this is done anyway, in the client's connect event.
         """
+        dispatcher = self.config.get('dispatcher', 'thread')
+        if dispatcher not in ('thread', 'pool'):
+            raise HoNConfigError(15) # Invalid configuration value.
+
+        # The socket and threads of an earlier connection are done with.
+        if self.socket is not None:
+            try:
+                self.disconnect()
+            except HoNCoreError:
+                pass
+        self.stop_threads()
+
+        self.open(address, port)
+
+        if self.config.get('send_queue', False):
+            self.writer = PacketWriter(self)
+            self.writer.start()
+
+        multiplexer = self.config.get('multiplexer')
+        if multiplexer is not None:
+            multiplexer.register(self)
+            return
+
+        if dispatcher == 'pool':
+            self.dispatcher = PacketDispatcher(self, self.config.get('dispatch_workers', 4),
+                                               self.config.get('dispatch_queue_size', 1000),
+                                               self.config.get('dispatch_key', 'channel'))
+            self.dispatcher.start()
+
+        # Set up a listener as the socket can send data now.
+        self.listener = SocketListener(self)
+        self.listener.start()
+
+    def open(self, address, port):
+        """ Opens the connection to the chat server, without anything to read from it. """
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             #self.socket.bind(("", 0))
@@ -119,10 +503,7 @@ class ChatSocket:
         
         # The socket is now actually connected.
         self.connected = True
-
-        # Set up a listener as the socket can send data now.
-        self.listener = SocketListener(self)
-        self.listener.start()
+        self.framer = PacketFramer()
 
     def disconnect(self):
         """ Disconnecting should not fail, it's a pretty forced procedure.
@@ -134,67 +515,146 @@ class ChatSocket:
         self.connected = False
         self.authenticated = False
 
+        multiplexer = self.config.get('multiplexer')
+        if multiplexer is not None:
+            multiplexer.unregister(self)
+
+        if self.writer is not None:
+            self.writer.stop()
+
+        if self.listener is not None:
+            self.listener.stopped = True
+
         try:
-            self.socket.shutdown(socket.SHUT_RDWR)
-            self.socket.close()
+            if self.socket is not None:
+                self.socket.shutdown(socket.SHUT_RDWR)
+                self.socket.close()
         except socket.error, e:
             raise HoNCoreError(10) # Socket Error
         finally:
             self.socket = None
-
-        self.listener.stopped = True
-        self.listener.join()
-        self.listener = None
+            self.stop_threads()
+
+    def stop_threads(self):
+        """ Stops and waits for the writer, listener and dispatcher of the connection. """
+        if self.writer is not None:
+            self.writer.stop()
+            if self.writer is not threading.current_thread():
+                self.writer.join()
+            self.writer = None
+
+        if self.listener is not None:
+            self.listener.stopped = True
+            if self.listener is not threading.current_thread():
+                self.listener.join()
+            self.listener = None
+
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+            self.dispatcher = None
     
-    def send(self, data):
+    @property
+    def queue_depth(self):
+        """ The number of packets waiting in the send queue. """
+        return self.writer.queue_depth if self.writer is not None else 0
+
+    @property
+    def bytes_in_flight(self):
+        """ The number of bytes in the send queue or being written. """
+        return self.writer.bytes_in_flight if self.writer is not None else 0
+
+    def send(self, data, priority=False):
         """ Wrapper send method. 
-            TODO: Capture failed sends.
+            Queues the data on the PacketWriter when there is one, with `priority` placing
+            it ahead of anything already queued. Otherwise sends all of the data straight away.
             TODO: Possibly check for the authentication first, and authenticate if required.
         """
         #print "Sending on socket %s from thread %s" % (self.socket, threading.currentThread().getName())
         try:
-            self.socket.send(data)
+            if self.writer is not None:
+                self.writer.put(data, priority)
+            else:
+                self.socket.sendall(data)
         except socket.error, e:
             #print "Socket error %s while sending." % e
             raise
         return True
 
     def recv(self):
-        # Packet length is packed into 2 bytes at the start.
-        packet_len = self.socket.recv(2)
-        if not packet_len:
+        """ Receives whatever data is available on the socket and returns a list of the
+            complete packets received so far, as memoryviews of the PacketFramer's buffer.
+            Returns None once the socket has been closed.
+        """
+        packets = self.framer.fill(self.socket)
+        if packets:
+            self.packets_received += len(packets)
+        return packets
+
+    def dispatch(self, packet):
+        """ Hands a received packet over to be parsed and have its events triggered. """
+        if self.dispatcher is not None:
+            self.dispatcher.dispatch(packet)
             return
-        # Add the first two bytes to the packet
-        packet = packet_len
-        # Extract the packet length.
-        packet_len = struct.unpack('>H', packet_len)[0]
-
-        # Receive until the entire packet has been received.
-        received_len = to_get = 0
-        while received_len < packet_len:
-            to_get = packet_len - received_len
-            packet += self.socket.recv(to_get)
-            received_len = len(packet) - 2
-        
+        try:
+            handled = self.is_handled(HON_SC_PACKET_RECV) or self.is_handled(self.packet_parser.parse_id(packet))
+            if not handled:
+                # Nothing listens for the packet, so all that is left is to count it.
+                self.parse_packet(packet)
+        except Exception:
+            # A malformed packet should not stop the listener reading the ones after it.
+            traceback.print_exc()
+            return
+        if handled:
+            # The receive buffer is reused before the thread runs, so it gets its own copy.
+            threading.Thread(target=self.parse_packet, name='PacketParser', args=(packet.tobytes(),)).start()
+
+    def is_handled(self, packet_id):
+        """ Returns True if any handlers are connected to the event for the packet ID. """
+        event = self.events.get(packet_id)
+        return event is not None and len(event.handlers) > 0
+
+    def raw_packet(self, packet):
+        """ Returns a copy of a received packet for the `HON_SC_PACKET_RECV` handlers 
+            to keep, or None when there are no handlers connected.
+        """
+        if not self.is_handled(HON_SC_PACKET_RECV):
+            return None
+        if isinstance(packet, memoryview):
+            return packet.tobytes()
         return packet
-    
+
     def parse_packet(self, packet):
         """ Core function to tie together all of the packet parsing. """
+        packet_id, packet_data = self.decode_packet(packet)
+        self.trigger_events(packet_id, self.raw_packet(packet), packet_data)
+
+    def decode_packet(self, packet):
+        """ Returns the packet's ID along with the data parsed from the packet.
+            The data is None if the packet is unknown or holds nothing useful, or if nothing 
+            is connected to its event, in which case the packet is not decoded at all.
+        """
         packet_id = self.packet_parser.parse_id(packet)
-        
+        self.packet_counts[packet_id] += 1
+        if not self.is_handled(packet_id):
+            self.packets_skipped += 1
+            return packet_id, None
+
+        # Parse the data following the length and packet id.
+        try:
+            packet_data = self.packet_parser.parse_data(packet_id, packet, 4)
+        except HoNCoreError, e:
+            if e.code != 12: # Unknown packet received.
+                raise
+            packet_data = None
+        return packet_id, packet_data
+
+    def trigger_events(self, packet_id, packet, packet_data):
+        """ Triggers the general packet event followed by the event for the packet itself. """
         # Trigger a general event on all packets. Passes the raw packet.
         try:
             self.events[HON_SC_PACKET_RECV].trigger(**{'packet_id': packet_id, 'packet': packet})
         except KeyError:
             pass
-        
-        # Trim the length and packet id from the packet
-        packet = packet[4:]
-        try:
-            packet_data = self.packet_parser.parse_data(packet_id, packet)
-        except HoNCoreError, e:
-            if e.code == 12: # Unknown packet received.    
-                return False
 
         if packet_data is None:
             return
@@ -207,8 +667,18 @@ class ChatSocket:
         """ Set the authenticated state to True"""
         self.authenticated = True
 
+    def send_packet(self, packet_id, *args, **kwargs):
+        """ Sends a packet encoded from its layout in schema.py, taking the values of its fields.
+            Useful for the packets which have no send method of their own.
+        """
+        try:
+            layout = client_packets[packet_id]
+        except KeyError:
+            raise HoNCoreError(17) # Packet layout is not known.
+        self.send(layout.encode(*args, **kwargs))
+
     def send_pong(self):
-        self.send(struct.pack('H', HON_CS_PONG))
+        self.send(encode_pong(), priority=True)
     
     def send_channel_message(self, message, channel_id):
         """ Sends the messae to the channel specified by the id.
@@ -217,13 +687,7 @@ class ChatSocket:
                 `channel_id`    An integer containing the id of the channel.
             Packet ID is 0x03 or HON_CS_CHANNEL_MSG.
         """
-        c = Struct("message",
-                ULInt16("id"),
-                String("message", len(message)+1, encoding="utf8", padchar="\x00"),
-                ULInt32("channel_id")
-            )
-        packet = c.build(Container(id=HON_CS_CHANNEL_MSG, message=unicode(message), channel_id=channel_id))
-        self.send(packet)
+        self.send(encode_channel_message(message, channel_id))
     
     def send_whisper(self, player, message):
         """ Sends the message to the player in the form of a whisper.
@@ -232,14 +696,7 @@ class ChatSocket:
                 `message`   A string containing the message.
             Packet ID is 0x08 or HON_CS_WHISPER.
         """
-
-        c = Struct("whisper",
-               ULInt16("id"),
-               String("player", len(player)+1, encoding="utf8", padchar="\x00"),
-               String("message", len(message)+1, encoding="utf8", padchar="\x00")
-        )
-        packet = c.build(Container(id=HON_CS_WHISPER, player=unicode(player), message=unicode(message)))
-        self.send(packet)
+        self.send(encode_whisper(player, message))
 
     def send_auth_info(self, account_id, cookie, ip, auth_hash, protocol, invis):
         """ Sends the chat server authentication request.
@@ -251,23 +708,11 @@ class ChatSocket:
                 `protocol`      An integer containing the protocol version to be used.
                 `invis`         A boolean value, determening if invisible mode is used.
         """
-        c = Struct("login",
-                ULInt16("id"),
-                ULInt32("aid"),
-                String("cookie", len(cookie)+1, encoding="utf8", padchar = "\x00"),
-                String("ip", len(ip)+1, encoding="utf8", padchar = "\x00"),
-                String("auth", len(auth_hash)+1, encoding="utf8", padchar = "\x00"),
-                ULInt32("proto"),
-                ULInt8("unknown"),
-                ULInt32("mode")
-        )
-
-        packet = c.build(Container(id=HON_CS_AUTH_INFO, aid=account_id, cookie=unicode(cookie), ip=unicode(ip), 
-                                auth=unicode(auth_hash), proto=protocol, unknown=0x01, mode=0x03 if invis else 0x00))
+        packet = encode_auth_info(account_id, cookie, ip, auth_hash, protocol, invis)
         
         # print "Sending packet - 0x%x:%s:%s:%s:%s:0x%x:0x%x:0x%x" % (HON_CS_AUTH_INFO, account_id, cookie, ip, auth_hash, protocol, 0x01, 0x00)
         try:
-            self.send(packet)
+            self.send(packet, priority=True)
         except socket.error, e:
             if e.errno == 32:
                 raise ChatServerError(206)
@@ -285,25 +730,14 @@ class ChatSocket:
         """ Sends the message to the player in the form of a private message.
             Packet ID: 0x1C
         """
-        c = Struct("private_message",
-               ULInt16("id"),
-               String("player", len(player)+1, encoding="utf8", padchar="\x00"),
-               String("message", len(message)+1, encoding="utf8", padchar="\x00")
-            )
-        packet = c.build(Container(id=HON_CS_PM, player=unicode(player), message=unicode(message)))
-        self.send(packet)
+        self.send(encode_private_message(player, message))
 
 
     def send_join_channel(self, channel):
         """ Sends a request to join the channel.
             Packet ID: 0x1E
         """
-        c = Struct("join_channel",
-                ULInt16("id"),
-                String("channel", len(channel)+1, encoding="utf8", padchar="\x00")
-            )
-        packet = c.build(Container(id=HON_CS_JOIN_CHANNEL, channel=unicode(channel)))
-        self.send(packet)
+        self.send(encode_join_channel(channel))
 
     def send_whisper_buddies(self):
         pass
@@ -312,15 +746,13 @@ class ChatSocket:
         """ Leaves the channel `channel`.
             Packet ID: 0x22 
         """
-        c = Struct("leave_channel",
-               ULInt16("id"),
-               String("channel", len(channel)+1, encoding="utf8", padchar="\x00")
-            )
-        packet = c.build(Container(id=HON_CS_LEAVE_CHANNEL, channel=unicode(channel)))
-        self.send(packet)
+        self.send(encode_leave_channel(channel))
 
-    def send_user_info(self):
-        pass
+    def send_user_info(self, nickname):
+        """ Requests the status of the player `nickname`.
+            Packet ID: 0x2A
+        """
+        self.send(encode_user_info(nickname))
 
     def send_update_topic(self):
         pass
@@ -359,7 +791,10 @@ class ChatSocket:
         pass
 
     def send_join_channel_password(self, channel, password):
-        pass
+        """ Sends a request to join the channel `channel` which is protected by `password`.
+            Packet ID: 0x46
+        """
+        self.send(encode_join_channel_password(channel, password))
 
     def send_clan_add_member(self):
         pass
@@ -369,12 +804,188 @@ class ChatSocket:
 
     def send_buddy_accept(self):
         pass
+
+class AsyncChatSocket(ChatSocket):
+    """ A ChatSocket driven by an asyncore loop rather than a SocketListener thread.
+
+        Packets are framed as they are read and their events are triggered straight away
+        on the loop's thread, so handlers should not block. Any number of AsyncChatSockets
+        can share a socket map and be run by one call to `asyncore.loop(map=socket_map)`.
+
+        The `send_*` methods are the same as the ChatSocket's, but never block. Data is
+        written immediately when the socket can take it, and whatever is left over is 
+        written by the loop once the socket becomes writable again.
+    """
+
+    class Channel(asyncore.dispatcher):
+        """ The asyncore dispatcher for the socket, which passes its events to the AsyncChatSocket. """
+        def __init__(self, chat_socket, sock, socket_map):
+            asyncore.dispatcher.__init__(self, sock, socket_map)
+            self.chat_socket = chat_socket
+
+        def handle_read(self):
+            self.chat_socket.handle_read()
+
+        def writable(self):
+            return bool(self.chat_socket.outbound)
+
+        def handle_write(self):
+            self.chat_socket.handle_write()
+
+        def handle_close(self):
+            self.chat_socket.handle_close()
+
+    def __init__(self, client_events, config=None, socket_map=None):
+        ChatSocket.__init__(self, client_events, config)
+        self.socket_map = socket_map if socket_map is not None else asyncore.socket_map
+        self.channel = None
+        self.outbound = ''
+        self.send_lock = threading.Lock()
+
+    @property
+    def is_connected(self):
+        return self.connected
+
+    def connect(self, address, port):
+        """ Connects to the chat server and adds the socket to the socket map.
+            The connection itself is made before returning, so failures are raised
+            the same way as with a ChatSocket.
+        """
+        self.open(address, port)
+        self.socket.setblocking(0)
+        self.outbound = ''
+        self.channel = self.Channel(self, self.socket, self.socket_map)
+
+    def disconnect(self):
+        """ Removes the socket from the socket map and closes it. """
+        self.connected = False
+        self.authenticated = False
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+        self.socket = None
+
+    def send(self, data, priority=False):
+        """ Writes as much of the data as the socket will take, buffering the rest
+            for the loop to write. As nothing waits to be written while the socket can take
+            more, `priority` makes no difference.
+        """
+        with self.send_lock:
+            if self.socket is None:
+                raise socket.error(32, 'Broken pipe')
+            if not self.outbound:
+                try:
+                    data = data[self.socket.send(data):]
+                except socket.error, e:
+                    if e.errno != errno.EWOULDBLOCK:
+                        raise
+            self.outbound += data
+        return True
+
+    def handle_read(self):
+        packets = self.recv()
+        if packets is None:
+            self.handle_close()
+            return
+        for packet in packets:
+            try:
+                self.parse_packet(packet)
+            except Exception:
+                # A failing handler should not take the connection down with it.
+                traceback.print_exc()
+
+    def handle_write(self):
+        with self.send_lock:
+            sent = self.channel.send(self.outbound)
+            self.outbound = self.outbound[sent:]
+
+    def handle_close(self):
+        self.disconnect()
     
+class LazyList(object):
+    """ A list which is only decoded the first time it is used.
+        `decode` is called with no arguments and returns the items. Only reading is
+        supported, use list() to get an ordinary list.
+    """
+    def __init__(self, decode):
+        self.__decode = decode
+        self.__items = None
+
+    def __repr__(self):
+        if self.__items is None:
+            return "<LazyList not decoded>"
+        return repr(self.__items)
+
+    @property
+    def is_decoded(self):
+        return self.__items is not None
+
+    @property
+    def items(self):
+        if self.__items is None:
+            self.__items = self.__decode()
+            self.__decode = None
+        return self.__items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __eq__(self, other):
+        if isinstance(other, LazyList):
+            other = other.items
+        return self.items == other
+
+    def __ne__(self, other):
+        return not self == other
+
+# The operators of a channel are read as records, the class of which is made when the Struct
+# is, so it is made once here rather than for every packet.
+_op_users = MetaRepeater(lambda ctx: ctx['op_count'],
+        Struct('op_users',
+            ULInt32('op_aid'),
+            Byte('op_type'),
+            record=True
+        )
+    )
+_operators = Struct('operators', ULInt32('op_count'), _op_users)
+
 class PacketParser:
-    """ A class to handle raw packet parsing. """
-    def __init__(self):
+    """ A class to handle raw packet parsing. 
+        If `lazy_payloads` is set in the config, the parsers which support it return
+        their lists, such as the users in a channel, as LazyLists which are decoded from
+        a copy of the packet when a handler first uses them.
+
+        The most frequent packets can also be read by the fast decoders in decoders.py.
+        `fast_decoders` in the config selects them, either True for every packet which has
+        one, or a list of the packet IDs to use them for. The parsers here remain the
+        reference for the packet layouts.
+    """
+    def __init__(self, config=None):
         self.__packet_parsers = {}
         self.__setup_parsers()
+        self.config = config if config is not None else {}
+
+    @property
+    def lazy(self):
+        return self.config.get('lazy_payloads', False)
+
+    def decoder(self, packet_id):
+        """ Returns the fast decoder selected for the packet ID, or None if the packet
+            is parsed by its construct parser.
+        """
+        selected = self.config.get('fast_decoders', True)
+        if selected is True or (selected and packet_id in selected):
+            return decoders.get(packet_id)
+        return None
 
     def __setup_parsers(self):
         """ Add every known packet parser to the list of availble parsers. """
@@ -437,36 +1048,46 @@ class PacketParser:
             The ID is an unsigned short, or a 2 byte integer, which is located at bytes 3 and 4 
             within the packet.
         """
-        return struct.unpack('H', packet[2:4])[0]
+        return struct.unpack_from('H', packet, 2)[0]
 
-    def parse_data(self, packet_id, packet):
+    def parse_data(self, packet_id, packet, offset=0):
         """ Pushes the packet through to a matching registered packet parser, which extracts any useful data 
             into a dict of kwargs which can then be handed to any matching registered event handler.
 
             Passes the packet to a packet parser so it can be parsed for data. The returned data
             is then passed to each event handler that requests it as a list of named keywords which
             are taken as arguments.
+
+            The data is parsed from `offset` on, so the packet can be a whole frame from the
+            receive buffer. A memoryview has no `find` in Python 2, so the data following the
+            offset is copied out of it first, once, and is then parsed in place.
         """
+        if isinstance(packet, memoryview):
+            packet = packet[offset:].tobytes()
+            offset = 0
+        decoder = self.decoder(packet_id)
+        if decoder is not None and not (self.lazy and packet_id in (HON_SC_JOINED_CHANNEL, HON_SC_INITIAL_STATUS)):
+            return decoder(packet, offset)
         if packet_id in self.__packet_parsers:
             parser = self.__packet_parsers[packet_id]
-            data = parser(packet)
+            data = parser(packet, offset)
             return data
         else:
             raise HoNCoreError(12) # Unknown packet received.
     
-    def parse_auth_accepted(self, packet):
+    def parse_auth_accepted(self, packet, offset=0):
         """ The initial response from the chat server to verify that the authentication was accepted.
             Packet ID: 0x1C00
         """
         return {}
 
-    def parse_ping(self, packet):
+    def parse_ping(self, packet, offset=0):
         """ Pings sent every minute. Respond with pong. 
             Packet ID: 0x2A00
         """
         return {}
 
-    def parse_channel_message(self, packet):
+    def parse_channel_message(self, packet, offset=0):
         """ Triggered when a message is sent to a channel that the user is currently in.
             Returns the following:
                 `account_id`    The ID of player account who sent the message.
@@ -479,14 +1100,14 @@ class PacketParser:
                    ULInt32('channel_id'),
                    CString('message')
                   )
-        r = c.parse(packet)
+        r = c.parse_from(packet, offset)[0]
         return {
             'account_id': r.account_id,
             'channel_id': r.channel_id,
             'message'   : r.message
         }
     
-    def parse_joined_channel(self, packet):
+    def parse_joined_channel(self, packet, offset=0):
         """ Triggered when `the user` joins a channel.
             Returns the following:
                 `channel`       Name of the channel joined.
@@ -496,18 +1117,15 @@ class PacketParser:
                 `users`         A list of users in the channel and data regarding them.
             Packet ID: 0x04
         """
+        if self.lazy:
+            return self.__parse_joined_channel_lazy(packet, offset)
         c = Struct('changed_channel', 
                 CString('channel_name'), 
                 ULInt32('channel_id'), 
                 ULInt8('unknown'), 
                 CString('channel_topic'), 
                 ULInt32('op_count'),
-                MetaRepeater(lambda ctx: ctx['op_count'],
-                    Struct('op_users',
-                        ULInt32('op_aid'),
-                        Byte('op_type')
-                    )
-                ),
+                _op_users,
                 ULInt32('user_count'),
                 MetaRepeater(lambda ctx: ctx['user_count'],
                     Struct('users',
@@ -521,7 +1139,7 @@ class PacketParser:
                     )
                 )
             )
-        r = c.parse(packet)
+        r = c.parse_from(packet, offset)[0]
          
         return {
             'channel': r.channel_name,
@@ -532,7 +1150,52 @@ class PacketParser:
                            u.nick_colour, u.account_icon) for u in r.users],
         }
 
-    def parse_entered_channel(self, packet):
+    def __parse_joined_channel_lazy(self, packet, offset):
+        """ Parses the channel details of the joined channel packet, leaving the operators
+            and users to be decoded when they are used.
+        """
+        c = Struct('changed_channel',
+                CString('channel_name'),
+                ULInt32('channel_id'),
+                ULInt8('unknown'),
+                CString('channel_topic'),
+                ULInt32('op_count')
+            )
+        r, ops_offset = c.parse_from(packet, offset)
+        # Each operator is an account ID followed by its type.
+        users_offset = ops_offset + r.op_count * 5
+
+        def operators():
+            # Read from the count of the operators on.
+            return [op for op in _operators.parse_from(packet, ops_offset - 4)[0].op_users]
+
+        def users():
+            c = Struct('users',
+                    ULInt32('user_count'),
+                    MetaRepeater(lambda ctx: ctx['user_count'],
+                        Struct('users',
+                            CString('nickname'),
+                            ULInt32('id'),
+                            Byte('status'),
+                            Byte('flags'),
+                            CString('chat_icon'),
+                            CString('nick_colour'),
+                            CString('account_icon')
+                        )
+                    )
+                )
+            return [User(u.id, u.nickname, u.status, u.flags, u.chat_icon,
+                         u.nick_colour, u.account_icon) for u in c.parse_from(packet, users_offset)[0].users]
+
+        return {
+            'channel': r.channel_name,
+            'channel_id': r.channel_id,
+            'topic': r.channel_topic,
+            'operators': LazyList(operators),
+            'users': LazyList(users),
+        }
+
+    def parse_entered_channel(self, packet, offset=0):
         """ When another user joins a channel.
             Returns the following:
                 `channel_id`    The ID of the channel that the user joined.
@@ -549,15 +1212,15 @@ class PacketParser:
                 CString('u_nick_colour'),
                 CString('u_account_icon')
             )
-        r = c.parse(packet)
+        r = c.parse_from(packet, offset)[0]
         u = User(r.u_id, r.u_nickname, r.u_status, r.u_flags, r.u_chat_icon,
                       r.u_nick_colour, r.u_account_icon)
         return {'channel_id': r.channel_id, 'user': u}
 
-    def parse_left_channel(self, packet):
+    def parse_left_channel(self, packet, offset=0):
         pass
 
-    def parse_whisper(self, packet):
+    def parse_whisper(self, packet, offset=0):
         """ A normal whisper from anyone.
             Returns two variables.
                 `player`    The name of the player who sent the whisper.
@@ -565,13 +1228,17 @@ class PacketParser:
             Packet ID: 0x08
         """
         c = Struct("packet", CString("name"), CString("message"))
-        r = c.parse(packet)
+        r = c.parse_from(packet, offset)[0]
         return {"player" : r.name, "message" : r.message }
 
-    def parse_whisper_failed(self, packet):
-        pass
+    def parse_whisper_failed(self, packet, offset=0):
+        """ A whisper could not be delivered, as the player is not online.
+            The packet does not say which player it was for.
+            Packet ID: 0x09
+        """
+        return {}
 
-    def parse_initial_status(self, packet):
+    def parse_initial_status(self, packet, offset=0):
         """ The initial status packet contains information for all available buddy and clan members.
             Returns a list of dictonaries containing the user id and a dictonary with their status
             and flags.
@@ -583,6 +1250,14 @@ class PacketParser:
             }
             Packet ID: 0x0B
         """
+        if self.lazy:
+            return {'users': LazyList(lambda: self.__parse_initial_status_users(packet, offset))}
+        return {'users': self.__parse_initial_status_users(packet, offset)}
+
+    def __parse_initial_status_users(self, packet, offset=0):
+        decoder = self.decoder(HON_SC_INITIAL_STATUS)
+        if decoder is not None:
+            return decoder(packet, offset)['users']
         c = Struct('initial_status',
                 ULInt32('user_count'),
                 MetaRepeater(lambda ctx: ctx['user_count'],
@@ -599,20 +1274,19 @@ class PacketParser:
                     )
                 )
             )
-        r = c.parse(packet)
-        users = [{u.id: {'status': u.status, 'flags': u.flags}} for u in r.users]
-        return {'users': users}
+        r = c.parse_from(packet, offset)[0]
+        return [{u.id: {'status': u.status, 'flags': u.flags}} for u in r.users]
 
-    def parse_update_status(self, packet):
+    def parse_update_status(self, packet, offset=0):
         pass
 
-    def parse_clan_message(self, packet):
+    def parse_clan_message(self, packet, offset=0):
         pass
 
-    def parse_looking_for_clan(self, packet):
+    def parse_looking_for_clan(self, packet, offset=0):
         pass
 
-    def parse_private_message(self, packet):
+    def parse_private_message(self, packet, offset=0):
         """ A private message from anyone.
             Returns two variables.
                 `player`    The name of the player who sent the whisper.
@@ -620,97 +1294,130 @@ class PacketParser:
             Packet ID: 0x1C
         """
         c = Struct("packet", CString("name"), CString("message"))
-        r = c.parse(packet)
+        r = c.parse_from(packet, offset)[0]
         return {"player" : r.name, "message" : r.message }
 
-    def parse_private_message_failed(self, packet):
+    def parse_private_message_failed(self, packet, offset=0):
         pass
 
-    def parse_whisper_buddies(self, packet):
+    def parse_whisper_buddies(self, packet, offset=0):
         pass
 
-    def parse_max_channels(self, packet):
+    def parse_max_channels(self, packet, offset=0):
         pass
 
-    def parse_user_info_no_exist(self, packet):
-        pass
+    def parse_user_info(self, packet, offset=0):
+        """ The replies to a user info request all start with the nickname of the player.
+            Returns the following:
+                `nickname`  The nickname of the player.
+        """
+        c = Struct('user_info',
+                CString('nickname')
+            )
+        r = c.parse_from(packet, offset)[0]
+        return {'nickname': r.nickname}
 
-    def parse_user_info_offline(self, packet):
-        pass
+    def parse_user_info_no_exist(self, packet, offset=0):
+        """ Packet ID: 0x2B """
+        return self.parse_user_info(packet, offset)
 
-    def parse_user_info_online(self, packet):
-        pass
+    def parse_user_info_offline(self, packet, offset=0):
+        """ Packet ID: 0x2C """
+        return self.parse_user_info(packet, offset)
 
-    def parse_user_info_ingame(self, packet):
-        pass
+    def parse_user_info_online(self, packet, offset=0):
+        """ Packet ID: 0x2D """
+        return self.parse_user_info(packet, offset)
 
-    def parse_channel_update(self, packet):
-        pass
+    def parse_user_info_ingame(self, packet, offset=0):
+        """ Packet ID: 0x2E """
+        return self.parse_user_info(packet, offset)
 
-    def parse_channel_update_topic(self, packet):
+    def parse_channel_update(self, packet, offset=0):
         pass
 
-    def parse_channel_kick(self, packet):
+    def parse_channel_update_topic(self, packet, offset=0):
         pass
 
-    def parse_channel_ban(self, packet):
+    def parse_channel_kick(self, packet, offset=0):
         pass
 
-    def parse_channel_unban(self, packet):
+    def parse_channel_ban(self, packet, offset=0):
         pass
 
-    def parse_channel_banned(self, packet):
+    def parse_channel_unban(self, packet, offset=0):
         pass
 
-    def parse_channel_silenced(self, packet):
-        pass
+    def parse_channel_banned(self, packet, offset=0):
+        """ The channel could not be joined as the user is banned from it.
+            Returns the following:
+                `channel`   The name of the channel.
+            Packet ID: 0x34
+        """
+        c = Struct('channel_banned',
+                CString('channel')
+            )
+        r = c.parse_from(packet, offset)[0]
+        return {'channel': r.channel}
 
-    def parse_channel_silence_lifted(self, packet):
+    def parse_channel_silenced(self, packet, offset=0):
         pass
 
-    def parse_channel_silence_placed(self, packet):
+    def parse_channel_silence_lifted(self, packet, offset=0):
         pass
 
-    def parse_message_all(self, packet):
+    def parse_channel_silence_placed(self, packet, offset=0):
         pass
 
-    def parse_channel_promote(self, packet):
+    def parse_message_all(self, packet, offset=0):
         pass
 
-    def parse_channel_demote(self, packet):
+    def parse_channel_promote(self, packet, offset=0):
         pass
 
-    def parse_channel_auth_enable(self, packet):
+    def parse_channel_demote(self, packet, offset=0):
         pass
 
-    def parse_channel_auth_disable(self, packet):
+    def parse_channel_auth_enable(self, packet, offset=0):
         pass
 
-    def parse_channel_auth_add(self, packet):
+    def parse_channel_auth_disable(self, packet, offset=0):
         pass
 
-    def parse_channel_auth_delete(self, packet):
+    def parse_channel_auth_add(self, packet, offset=0):
         pass
 
-    def parse_channel_auth_list(self, packet):
+    def parse_channel_auth_delete(self, packet, offset=0):
         pass
 
-    def parse_channel_password_changed(self, packet):
+    def parse_channel_auth_list(self, packet, offset=0):
         pass
 
-    def parse_channel_auth_add_fail(self, packet):
+    def parse_channel_password_changed(self, packet, offset=0):
         pass
 
-    def parse_channel_auth_del_fail(self, packet):
+    def parse_channel_auth_add_fail(self, packet, offset=0):
         pass
 
-    def parse_join_channel_password(self, packet):
+    def parse_channel_auth_del_fail(self, packet, offset=0):
         pass
 
-    def parse_channel_emote(self, packet):
+    def parse_join_channel_password(self, packet, offset=0):
+        """ The channel could not be joined as it requires a password.
+            Returns the following:
+                `channel`   The name of the channel.
+            Packet ID: 0x46
+        """
+        c = Struct('join_channel_password',
+                CString('channel')
+            )
+        r = c.parse_from(packet, offset)[0]
+        return {'channel': r.channel}
+
+    def parse_channel_emote(self, packet, offset=0):
         pass
     
-    def parse_total_online(self, packet):
+    def parse_total_online(self, packet, offset=0):
         """ Gets the number of players online
             Packet ID: 0x68
         """
@@ -718,12 +1425,12 @@ class PacketParser:
                ULInt32('count'),
                CString('regions')
             )
-        r = c.parse(packet)
+        r = c.parse_from(packet, offset)[0]
         return {'count': r.count, 'region_data': r.regions} 
     
-    def parse_request_notification(self, packet):
+    def parse_request_notification(self, packet, offset=0):
         pass
 
-    def parse_notification(self, packet):
+    def parse_notification(self, packet, offset=0):
         pass
 
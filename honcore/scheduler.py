@@ -0,0 +1,221 @@
+"""
+HoNCore. Python library providing connectivity and functionality
+with HoN's chat server.
+
+scheduler.py
+
+Throttling of the messages sent to the chat server, so that bursts of messages
+do not get the client kicked for flooding.
+"""
+
+import time, threading, logging, collections
+from exceptions import *
+
+log = logging.getLogger('honcore.scheduler')
+log.addHandler(logging.NullHandler())
+
+
+class TokenBucket:
+    """ A token bucket which refills at `rate` tokens a second, holding at most `burst` tokens.
+        Each message sent takes one token.
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.time()
+
+    def __repr__(self):
+        return "<TokenBucket %.2f/%d>" % (self.tokens, self.burst)
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready(self, now):
+        """ Returns True if a token can be taken. """
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def configure(self, rate, burst, now):
+        """ Changes the rate and the burst, keeping the tokens collected so far up to the new burst. """
+        self.refill(now)
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = min(self.tokens, float(burst))
+
+    def delay(self, now):
+        """ Returns the number of seconds until a token can be taken. """
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    @property
+    def is_full(self):
+        return self.tokens >= self.burst
+
+class MessageScheduler(threading.Thread):
+    """ Sends queued messages while keeping within the rates the chat server allows.
+
+        Each destination, such as a channel or a player, has its own token bucket, and
+        all destinations share a global bucket. A message is sent once both have a token.
+        Destinations are served in turn, one message each, so a burst to one channel
+        does not hold up the others. All the messages released together are passed to
+        `send` joined as one write.
+
+        When `merge` is set, a message queued for a destination which already has one
+        waiting is appended to it, separated by `separator`, as long as the result fits
+        in `max_length`.
+
+        A message can be given a `sent` callback, which is called with None as the message is
+        released, just before it is written, and again with the exception if the write fails.
+        If the scheduler is stopped before the message is released, it is only called with 
+        ChatServerError 215. Messages with a callback are never merged. Failed writes are also
+        logged to the `honcore.scheduler` logger.
+    """
+    def __init__(self, send, rate=1.0, burst=3, global_rate=5.0, global_burst=10,
+                 merge=False, separator=" | ", max_length=250):
+        threading.Thread.__init__(self, name='MessageScheduler')
+        self.daemon = True
+        self.send = send
+        self.rate = rate
+        self.burst = burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.merge = merge
+        self.separator = separator
+        self.max_length = max_length
+        self.buckets = {}                   # Token buckets by destination.
+        self.queues = {}                    # Queued messages by destination.
+        self.active = collections.deque()   # Destinations with messages queued, in the order they are served.
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def __repr__(self):
+        return "<MessageScheduler with %d destinations waiting>" % len(self.active)
+
+    @property
+    def queue_depth(self):
+        """ The number of messages waiting to be sent. """
+        return sum(len(queue) for queue in self.queues.itervalues())
+
+    def submit(self, key, message, encode, sent=None):
+        """ Queues a message for the destination `key`.
+            `encode` is called with the message once it is released, and returns the packet to send.
+        """
+        with self.condition:
+            queue = self.__queue(key)
+            if self.merge and sent is None and queue and queue[-1][0] is not None and queue[-1][2] is None:
+                last = queue[-1]
+                merged = last[0] + self.separator + message
+                if len(merged) <= self.max_length:
+                    last[0] = merged
+                    return
+            queue.append([message, encode, sent])
+            self.condition.notify()
+
+    def submit_packet(self, key, packet, sent=None):
+        """ Queues an already encoded packet for the destination `key`. It is never merged. """
+        with self.condition:
+            self.__queue(key).append([None, packet, sent])
+            self.condition.notify()
+
+    def configure(self, rate, burst, global_rate, global_burst, merge):
+        """ Changes the rates in place, so that the messages already queued are kept. """
+        with self.condition:
+            now = time.time()
+            self.rate = rate
+            self.burst = burst
+            for bucket in self.buckets.itervalues():
+                bucket.configure(rate, burst, now)
+            self.global_bucket.configure(global_rate, global_burst, now)
+            self.merge = merge
+            # Wake the scheduler, which may be waiting at the old rate.
+            self.condition.notify()
+
+    def clear(self):
+        """ Drops every queued message. """
+        with self.condition:
+            queues = self.queues.values()
+            self.queues.clear()
+            self.active.clear()
+        self.__notify([sent for queue in queues for message, encode, sent in queue if sent is not None], 
+                      ChatServerError(215)) # Connection was closed before the reply arrived.
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def __queue(self, key):
+        if key not in self.queues:
+            self.queues[key] = collections.deque()
+            self.active.append(key)
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(self.rate, self.burst)
+        return self.queues[key]
+
+    def __notify(self, callbacks, error):
+        for sent in callbacks:
+            try:
+                sent(error)
+            except Exception:
+                log.exception("A sent callback of a queued message failed")
+
+    def __release(self, now):
+        """ Takes one message from each destination that has a token, in turn, until the
+            global bucket runs out. Returns the packets released, their `sent` callbacks and, 
+            if nothing could be released, how long to wait until something can be.
+        """
+        released = []
+        callbacks = []
+        for key in list(self.active):
+            if not self.global_bucket.ready(now):
+                break
+            bucket = self.buckets[key]
+            if not bucket.ready(now):
+                continue
+            self.global_bucket.take()
+            bucket.take()
+            queue = self.queues[key]
+            message, encode, sent = queue.popleft()
+            released.append(encode if message is None else encode(message))
+            if sent is not None:
+                callbacks.append(sent)
+            # Move the destination to the back of the line.
+            self.active.remove(key)
+            if queue:
+                self.active.append(key)
+            else:
+                del self.queues[key]
+        if released or not self.active:
+            return released, callbacks, None
+        wait = min(self.buckets[key].delay(now) for key in self.active)
+        return released, callbacks, max(wait, self.global_bucket.delay(now))
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.active and not self.stopped:
+                    # Forget the destinations that have been idle long enough to refill.
+                    now = time.time()
+                    for key in [key for key, bucket in self.buckets.iteritems() if key not in self.queues]:
+                        if self.buckets[key].ready(now) and self.buckets[key].is_full:
+                            del self.buckets[key]
+                    self.condition.wait()
+                if self.stopped:
+                    break
+                released, callbacks, wait = self.__release(time.time())
+                if not released:
+                    self.condition.wait(wait)
+                    continue
+            # Called before the write, so they have run by the time a reply can arrive.
+            self.__notify(callbacks, None)
+            try:
+                self.send(''.join(released))
+            except Exception, e:
+                log.exception("Could not send %d queued messages", len(released))
+                self.__notify(callbacks, e)
+        # The messages still queued are never sent.
+        self.clear()
@@ -0,0 +1,425 @@
+"""
+HoNCore. Python library providing connectivity and functionality
+with HoN's chat server.
+
+schema.py
+
+The registry of packet layouts.
+
+Every known packet is declared once here, as a list of fields, and each layout is
+compiled when the module is imported into a decode and an encode function built
+from precompiled structs, so nothing is constructed per packet.
+
+    layout.decode(packet, offset=0)     Returns a dict of the fields, taking the packet
+                                        data without its length and ID.
+    layout.encode(*fields, **fields)    Returns the packet, with its ID, ready to send.
+    layout.encode_into(buffer, offset, *fields, **fields)
+                                        Writes the packet, with its ID, straight into a 
+                                        bytearray at the offset, growing it if needed, and
+                                        returns the offset following the packet.
+
+Field names starting with an underscore, such as unknown bytes and the counts of
+repeated fields, are left out of the decoded data, and are filled in when encoding
+from their default or from the length of the list they count.
+
+The layouts are kept by packet ID in `server_packets` and `client_packets`, and
+`unimplemented()` lists the packet IDs in constants.py with no layout yet. They are
+the only description of the packets which the encoders in encoders.py and the fast
+decoders in decoders.py are taken from.
+"""
+
+import struct
+import constants
+from constants import *
+from exceptions import *
+from common import User
+from lib.construct import Container
+
+def encode_string(string):
+    """ Returns the string as null terminated UTF-8. """
+    if isinstance(string, unicode):
+        string = string.encode('utf8')
+    return string + '\x00'
+
+def encode_string_into(buffer, offset, string):
+    """ Writes the string as null terminated UTF-8 into the bytearray at the offset,
+        growing it if needed, and returns the offset following it.
+    """
+    if isinstance(string, unicode):
+        string = string.encode('utf8')
+    if len(buffer) < offset:
+        # Assigning past the end of a bytearray would append at its end rather than at the offset.
+        buffer.extend('\x00' * (offset - len(buffer)))
+    end = offset + len(string)
+    buffer[offset:end] = string
+    buffer[end:end + 1] = '\x00'
+    return end + 1
+
+class Field(object):
+    """ A field of a packet. `default` is the value encoded for unnamed fields. """
+    fmt = None
+
+    def __init__(self, name, default=0):
+        self.name = name
+        self.default = default
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
+
+class UInt8(Field):
+    fmt = 'B'
+
+class UInt16(Field):
+    fmt = 'H'
+
+class UInt32(Field):
+    fmt = 'L'
+
+class String(Field):
+    """ A null terminated string. """
+    pass
+
+class Repeat(Field):
+    """ A list of records made of `fields`, the length of which is given by the earlier field `count`. """
+    def __init__(self, name, count, *fields):
+        Field.__init__(self, name)
+        self.count = count
+        self.fields = fields
+
+class If(object):
+    """ Fields which are only present when the earlier field `field` is one of `values`.
+        When they are missing they are decoded as None.
+    """
+    def __init__(self, field, values, *fields):
+        self.field = field
+        self.values = values
+        self.fields = fields
+
+class Layout:
+    """ The layout of a packet, along with the functions compiled from it.
+        `convert` is called with the decoded dict and returns the data to give to
+        the event handlers, if they expect something other than the fields.
+    """
+    def __init__(self, packet_id, name, fields, convert=None):
+        self.packet_id = packet_id
+        self.name = name
+        self.fields = fields
+        self.convert = convert
+        self.decode = _Compiler(self).decoder()
+        self.encode = _Compiler(self).encoder()
+        self.encode_into = _Compiler(self, into=True).encoder()
+
+    def __repr__(self):
+        return "<Layout 0x%02X: %s>" % (self.packet_id, self.name)
+
+class _Compiler:
+    """ Writes the source of the decode and encode functions for a layout.
+        Runs of fixed size fields are read and written with a single struct.
+        When `into` is set the encode function writes into a buffer rather than
+        returning a string.
+    """
+    def __init__(self, layout, into=False):
+        self.layout = layout
+        self.into = into
+        self.lines = []
+        self.namespace = {'HoNCoreError': HoNCoreError, 'encode_string': encode_string,
+                          'encode_string_into': encode_string_into}
+        self.count = 0
+
+    def name(self, prefix, value=None):
+        self.count += 1
+        name = "%s%d" % (prefix, self.count)
+        if value is not None:
+            self.namespace[name] = value
+        return name
+
+    def compile(self, function):
+        source = "\n".join(self.lines) + "\n"
+        exec compile(source, "<layout %s>" % self.layout.name, "exec") in self.namespace
+        return self.namespace[function]
+
+    def decoder(self):
+        self.lines.append("def decode(packet, offset=0):")
+        record = self.decode_fields(self.layout.fields, "    ", {})
+        result = "{%s}" % ", ".join("%r: %s" % (name, var) for name, var in record if not name.startswith("_"))
+        if self.layout.convert is not None:
+            result = "%s(%s)" % (self.name("_convert", self.layout.convert), result)
+        self.lines.append("    return %s" % result)
+        return self.compile("decode")
+
+    def decode_fields(self, fields, indent, scope):
+        """ Writes the reads of the fields, returning the (name, variable) pairs read.
+            `scope` maps the names of the fields read so far to their variables.
+        """
+        record = []
+        fixed = []
+
+        def flush():
+            if not fixed:
+                return
+            s = struct.Struct("<" + "".join(f.fmt for f in fixed))
+            names = [scope[f.name] for f in fixed]
+            self.lines.append("%s%s, = %s.unpack_from(packet, offset)" % (indent, ", ".join(names), self.name("_struct", s)))
+            self.lines.append("%soffset += %d" % (indent, s.size))
+            del fixed[:]
+
+        for field in fields:
+            if isinstance(field, If):
+                flush()
+                values = self.name("_values", frozenset(field.values))
+                self.lines.append("%sif %s in %s:" % (indent, scope[field.field], values))
+                inner = self.decode_fields(field.fields, indent + "    ", scope)
+                self.lines.append("%selse:" % indent)
+                for name, var in inner:
+                    self.lines.append("%s    %s = None" % (indent, var))
+                record.extend(inner)
+                continue
+            var = scope[field.name] = self.name("v")
+            record.append((field.name, var))
+            if field.fmt is not None:
+                fixed.append(field)
+                continue
+            flush()
+            if isinstance(field, String):
+                self.lines.append("%send = packet.find('\\x00', offset)" % indent)
+                self.lines.append("%sif end < 0:" % indent)
+                self.lines.append("%s    raise HoNCoreError(16) # Malformed packet received." % indent)
+                self.lines.append("%s%s = packet[offset:end]" % (indent, var))
+                self.lines.append("%soffset = end + 1" % indent)
+            elif isinstance(field, Repeat):
+                self.lines.append("%s%s = []" % (indent, var))
+                self.lines.append("%sfor %s in xrange(%s):" % (indent, self.name("i"), scope[field.count]))
+                inner = self.decode_fields(field.fields, indent + "    ", dict(scope))
+                self.lines.append("%s    %s.append({%s})" % (indent, var, ", ".join("%r: %s" % pair for pair in inner)))
+        flush()
+        return record
+
+    def encoder(self):
+        names = [f.name for f in self.layout.fields if isinstance(f, Field) and not f.name.startswith("_")]
+        packet_id = self.name("_packet_id", struct.pack("<H", self.layout.packet_id))
+        if self.into:
+            self.lines.append("def encode_into(%s):" % ", ".join(["buffer", "offset"] + names))
+            self.lines.append("    end = offset + 2")
+            self.lines.append("    if len(buffer) < end:")
+            self.lines.append("        buffer.extend('\\x00' * (end - len(buffer)))")
+            self.lines.append("    buffer[offset:end] = %s" % packet_id)
+            self.lines.append("    offset = end")
+        else:
+            self.lines.append("def encode(%s):" % ", ".join(names))
+            self.lines.append("    parts = [%s]" % packet_id)
+        self.encode_fields(self.layout.fields, "    ", dict((name, name) for name in names))
+        if self.into:
+            self.lines.append("    return offset")
+            return self.compile("encode_into")
+        appends = self.lines[2:]
+        if all(line.startswith("    parts.append(") for line in appends):
+            # Without repeats or conditions the parts are joined straight away, without the list.
+            parts = [packet_id] + [line[len("    parts.append("):-1] for line in appends]
+            del self.lines[1:]
+            self.lines.append("    return ''.join((%s,))" % ", ".join(parts))
+        else:
+            self.lines.append("    return ''.join(parts)")
+        return self.compile("encode")
+
+    def encode_fields(self, fields, indent, scope):
+        """ Writes the packing of the fields. `scope` maps the names of the fields to
+            the expressions holding their values.
+        """
+        counts = dict((f.count, f.name) for f in fields if isinstance(f, Repeat))
+        fixed = []
+
+        def value(field):
+            if field.name in counts:
+                return "len(%s)" % scope[counts[field.name]]
+            if field.name.startswith("_"):
+                return repr(field.default)
+            return scope[field.name]
+
+        def flush():
+            if not fixed:
+                return
+            s = struct.Struct("<" + "".join(f.fmt for f in fixed))
+            values = ", ".join(value(f) for f in fixed)
+            if self.into:
+                self.lines.append("%send = offset + %d" % (indent, s.size))
+                self.lines.append("%sif len(buffer) < end:" % indent)
+                self.lines.append("%s    buffer.extend('\\x00' * (end - len(buffer)))" % indent)
+                self.lines.append("%s%s.pack_into(buffer, offset, %s)" % (indent, self.name("_struct", s), values))
+                self.lines.append("%soffset = end" % indent)
+            else:
+                self.lines.append("%sparts.append(%s.pack(%s))" % (indent, self.name("_struct", s), values))
+            del fixed[:]
+
+        for field in fields:
+            if isinstance(field, If):
+                flush()
+                values = self.name("_values", frozenset(field.values))
+                self.lines.append("%sif %s in %s:" % (indent, value(Field(field.field)), values))
+                self.encode_fields(field.fields, indent + "    ", scope)
+                continue
+            if field.fmt is not None:
+                fixed.append(field)
+                continue
+            flush()
+            if isinstance(field, String):
+                if self.into:
+                    self.lines.append("%soffset = encode_string_into(buffer, offset, %s)" % (indent, value(field)))
+                else:
+                    self.lines.append("%sparts.append(encode_string(%s))" % (indent, value(field)))
+            elif isinstance(field, Repeat):
+                record = self.name("r")
+                self.lines.append("%sfor %s in %s:" % (indent, record, value(field)))
+                inner = dict(scope)
+                inner.update((f.name, "%s[%r]" % (record, f.name)) for f in _flatten(field.fields))
+                self.encode_fields(field.fields, indent + "    ", inner)
+        flush()
+
+def _flatten(fields):
+    """ Returns the fields, including those within Ifs. """
+    for field in fields:
+        if isinstance(field, If):
+            for f in _flatten(field.fields):
+                yield f
+        else:
+            yield field
+
+def _joined_channel(data):
+    data['operators'] = [Container(**op) for op in data['operators']]
+    data['users'] = [User(u['id'], u['nickname'], u['status'], u['flags'], u['chat_icon'],
+                          u['nick_colour'], u['account_icon']) for u in data['users']]
+    return data
+
+def _entered_channel(data):
+    user = User(data['account_id'], data['nickname'], data['status'], data['flags'], data['chat_icon'],
+                data['nick_colour'], data['account_icon'])
+    return {'channel_id': data['channel_id'], 'user': user}
+
+def _initial_status(data):
+    return {'users': [{u['id']: {'status': u['status'], 'flags': u['flags']}} for u in data['users']]}
+
+server_packets = {}
+client_packets = {}
+
+def server(packet_id, name, *fields, **kwargs):
+    """ Declares the layout of a packet sent by the chat server. """
+    server_packets[packet_id] = Layout(packet_id, name, fields, **kwargs)
+
+def client(packet_id, name, *fields, **kwargs):
+    """ Declares the layout of a packet sent to the chat server. """
+    client_packets[packet_id] = Layout(packet_id, name, fields, **kwargs)
+
+""" Server -> Client """
+server(HON_SC_AUTH_ACCEPTED, "Auth Accepted")
+server(HON_SC_PING, "Ping")
+server(HON_SC_CHANNEL_MSG, "Channel Message",
+       UInt32('account_id'),
+       UInt32('channel_id'),
+       String('message'))
+server(HON_SC_JOINED_CHANNEL, "Joined Channel",
+       String('channel'),
+       UInt32('channel_id'),
+       UInt8('_unknown'),
+       String('topic'),
+       UInt32('_op_count'),
+       Repeat('operators', '_op_count',
+           UInt32('op_aid'),
+           UInt8('op_type')),
+       UInt32('_user_count'),
+       Repeat('users', '_user_count',
+           String('nickname'),
+           UInt32('id'),
+           UInt8('status'),
+           UInt8('flags'),
+           String('chat_icon'),
+           String('nick_colour'),
+           String('account_icon')),
+       convert=_joined_channel)
+server(HON_SC_ENTERED_CHANNEL, "Entered Channel",
+       String('nickname'),
+       UInt32('account_id'),
+       UInt32('channel_id'),
+       UInt8('status'),
+       UInt8('flags'),
+       String('chat_icon'),
+       String('nick_colour'),
+       String('account_icon'),
+       convert=_entered_channel)
+server(HON_SC_WHISPER, "Whisper",
+       String('player'),
+       String('message'))
+server(HON_SC_WHISPER_FAILED, "Whisper Failed")
+server(HON_SC_INITIAL_STATUS, "Initial Status",
+       UInt32('_user_count'),
+       Repeat('users', '_user_count',
+           UInt32('id'),
+           UInt8('status'),
+           UInt8('flags'),
+           If('status', (HON_STATUS_INGAME, HON_STATUS_INLOBBY),
+               String('server'),
+               String('game_name'))),
+       convert=_initial_status)
+server(HON_SC_PM, "Private Message",
+       String('player'),
+       String('message'))
+# Only the nickname leads every user info reply, the rest of their layouts are not known yet.
+server(HON_SC_USER_INFO_NO_EXIST, "User Info No Exist",
+       String('nickname'))
+server(HON_SC_USER_INFO_OFFLINE, "User Info Offline",
+       String('nickname'))
+server(HON_SC_USER_INFO_ONLINE, "User Info Online",
+       String('nickname'))
+server(HON_SC_USER_INFO_IN_GAME, "User Info In Game",
+       String('nickname'))
+server(HON_SC_CHANNEL_BANNED, "Channel Banned",
+       String('channel'))
+server(HON_SC_JOIN_CHANNEL_PASSWORD, "Join Channel Password",
+       String('channel'))
+server(HON_SC_TOTAL_ONLINE, "Total Online",
+       UInt32('count'),
+       String('region_data'))
+
+""" Client -> Server """
+client(HON_CS_PONG, "Pong")
+client(HON_CS_CHANNEL_MSG, "Channel Message",
+       String('message'),
+       UInt32('channel_id'))
+client(HON_CS_WHISPER, "Whisper",
+       String('player'),
+       String('message'))
+client(HON_CS_AUTH_INFO, "Auth Info",
+       UInt32('account_id'),
+       String('cookie'),
+       String('ip'),
+       String('auth_hash'),
+       UInt32('protocol'),
+       UInt8('_unknown', default=0x01),
+       UInt32('mode'))
+client(HON_CS_PM, "Private Message",
+       String('player'),
+       String('message'))
+client(HON_CS_JOIN_CHANNEL, "Join Channel",
+       String('channel'))
+client(HON_CS_LEAVE_CHANNEL, "Leave Channel",
+       String('channel'))
+client(HON_CS_USER_INFO, "User Info",
+       String('nickname'))
+client(HON_CS_JOIN_CHANNEL_PASSWORD, "Join Channel Password",
+       String('channel'),
+       String('password'))
+
+def unimplemented():
+    """ Returns the names of the packet IDs defined in constants.py which have no layout
+        declared yet, as a dict of two lists, `server` and `client`, ordered by ID.
+    """
+    report = {'server': [], 'client': []}
+    for name in dir(constants):
+        packet_id = getattr(constants, name)
+        if not isinstance(packet_id, int):
+            continue
+        if name.startswith("HON_SC_") and packet_id not in server_packets:
+            report['server'].append((packet_id, name))
+        elif name.startswith("HON_CS_") and packet_id not in client_packets:
+            report['client'].append((packet_id, name))
+    for direction in report:
+        report[direction] = [name for packet_id, name in sorted(report[direction])]
+    return report
@@ -0,0 +1,58 @@
+import asyncore, socket, unittest
+
+from honcore.client import AsyncHoNClient
+from honcore.constants import *
+from honcore.tests.test_networking import channel_message, chat_socket
+
+class TestAsyncHoNClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        port = self.server.getsockname()[1]
+        self.socket_map = {}
+        self.clients = [AsyncHoNClient(self.socket_map) for i in range(2)]
+        self.connections = []
+        for client in self.clients:
+            chat_socket(client).connect('127.0.0.1', port)
+            self.connections.append(self.server.accept()[0])
+
+    def tearDown(self):
+        for client in self.clients:
+            client._chat_disconnect()
+        for connection in self.connections:
+            connection.close()
+        self.server.close()
+
+    def loop_until(self, condition):
+        for i in range(50):
+            if condition():
+                break
+            asyncore.loop(timeout=0.1, use_poll=True, map=self.socket_map, count=1)
+
+    def test_disconnect_one_client(self):
+        received = []
+        self.clients[1].connect_event(HON_SC_CHANNEL_MSG, lambda account_id, channel_id, message: received.append(message))
+        self.clients[0]._chat_disconnect()
+        self.assertEqual(len(self.socket_map), 1)
+        self.connections[1].sendall(channel_message(1, 2, 'hello'))
+        self.loop_until(lambda: received)
+        self.assertEqual(received, ['hello'])
+        self.assertFalse(chat_socket(self.clients[0]).is_connected)
+        self.assertTrue(chat_socket(self.clients[1]).is_connected)
+
+    def test_closed_by_server(self):
+        received = []
+        self.clients[1].connect_event(HON_SC_CHANNEL_MSG, lambda account_id, channel_id, message: received.append(message))
+        self.connections[0].close()
+        self.loop_until(lambda: len(self.socket_map) == 1)
+        self.assertEqual(len(self.socket_map), 1)
+        self.connections[1].sendall(channel_message(1, 2, 'hello'))
+        self.loop_until(lambda: received)
+        self.assertEqual(received, ['hello'])
+        self.assertFalse(chat_socket(self.clients[0]).is_connected)
+        self.assertTrue(chat_socket(self.clients[1]).is_connected)
+
+if __name__ == '__main__':
+    unittest.main()
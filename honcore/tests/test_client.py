@@ -0,0 +1,161 @@
+import socket, struct, time, unittest
+
+from honcore.client import HoNClient, Event
+from honcore.constants import *
+from honcore.exceptions import *
+from honcore.schema import server_packets
+from honcore.tests.test_networking import chat_socket, frame
+
+class TestEvent(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def handler(self, name):
+        def handler(channel_id=None, player=None, **data):
+            self.calls.append((name, channel_id if player is None else player))
+        return handler
+
+    def test_keyed_handler(self):
+        for key in ('channel_id', 'player'):
+            self.calls = []
+            self.event = Event("Keyed", 0x03, key=key)
+            self.event.connect(self.handler('first'), key=1)
+            self.event.connect(self.handler('second'), key=2)
+            for value in (1, 2, 3):
+                self.event.trigger(**{key: value, 'message': 'hello'})
+            self.assertEqual(self.calls, [('first', 1), ('second', 2)])
+
+    def test_priority(self):
+        self.event = Event("Channel Message", 0x03, key='channel_id')
+        self.event.connect(self.handler('keyed late'), priority=9, key=1)
+        self.event.connect(self.handler('unkeyed'), priority=5)
+        self.event.connect(self.handler('keyed early'), priority=1, key=1)
+        self.event.connect(self.handler('other key'), priority=0, key=2)
+        self.event.trigger(channel_id=1)
+        self.event.trigger(channel_id=3)
+        self.assertEqual(self.calls, [('keyed early', 1), ('unkeyed', 1), ('keyed late', 1), ('unkeyed', 3)])
+
+    def test_disconnect(self):
+        self.event = Event("Channel Message", 0x03, key='channel_id')
+        handler = self.handler('handler')
+        self.event.connect(handler, key=1)
+        self.event.connect(handler, key=2)
+        self.event.connect(handler)
+        self.event.disconnect(handler, 1)
+        self.event.trigger(channel_id=1)
+        self.event.trigger(channel_id=2)
+        self.assertEqual(self.calls, [('handler', 1), ('handler', 2), ('handler', 2)])
+        self.assertRaises(HoNCoreError, self.event.disconnect, handler, 1)
+
+        client = HoNClient()
+        client.connect_event(HON_SC_CHANNEL_MSG, handler, key=1)
+        client.disconnect_event(HON_SC_CHANNEL_MSG, handler, 1)
+        try:
+            client.disconnect_event(HON_SC_CHANNEL_MSG, handler, 1)
+        except HoNCoreError, e:
+            self.assertEqual(e.code, 14)
+        else:
+            self.fail("The handler was still connected.")
+
+    def test_no_key(self):
+        self.event = Event("Total Online", HON_SC_TOTAL_ONLINE)
+        for connect in (lambda: self.event.connect(self.handler('handler'), key=1),
+                        lambda: HoNClient().connect_event(HON_SC_TOTAL_ONLINE, self.handler('handler'), key=1)):
+            try:
+                connect()
+            except HoNCoreError, e:
+                self.assertEqual(e.code, 18)
+            else:
+                self.fail("The handler was connected by key.")
+
+class TestRosters(unittest.TestCase):
+
+    def setUp(self):
+        self.client = HoNClient()
+        self.client._configure(lazy_payloads=True)
+
+    def joined(self, channel_id, *users):
+        users = [{'nickname': nickname, 'id': account_id, 'status': 3, 'flags': 0, 'chat_icon': '', 
+                  'nick_colour': '', 'account_icon': ''} for account_id, nickname in users]
+        body = server_packets[HON_SC_JOINED_CHANNEL].encode('channel%d' % channel_id, channel_id, '', [], users)
+        chat_socket(self.client).parse_packet(struct.pack('>H', len(body)) + body)
+
+    def test_latest_roster(self):
+        self.joined(1, (1, 'old'))
+        self.joined(1, (2, 'new'))
+        self.joined(2, (3, 'other'), (2, 'new'))
+        self.assertEqual(len(self.client._HoNClient__rosters), 2)
+        self.assertEqual(self.client.id_to_nick(2), 'new')
+        self.assertEqual(self.client.id_to_nick(3), 'other')
+        self.assertEqual(self.client.id_to_nick(1), None)
+        self.assertEqual(len(self.client._HoNClient__rosters), 0)
+
+class ClientTestCase(unittest.TestCase):
+    """ Connects a client to a local server, configured with `config`. """
+    config = {}
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.client = HoNClient()
+        self.client._configure(**self.config)
+        chat_socket(self.client).connect('127.0.0.1', self.server.getsockname()[1])
+        self.connection = self.server.accept()[0]
+
+    def tearDown(self):
+        self.client._chat_disconnect()
+        self.connection.close()
+        self.server.close()
+
+class TestJoinChannels(ClientTestCase):
+
+    def received(self):
+        """ Returns everything the client sent until it closed the connection. """
+        data = []
+        self.connection.settimeout(5)
+        while True:
+            chunk = self.connection.recv(4096)
+            if not chunk:
+                return ''.join(data)
+            data.append(chunk)
+
+    def test_disconnect(self):
+        channels = ['channel%d' % i for i in range(5)]
+        future = self.client.join_channels(channels, max_in_flight=2)
+        self.client._chat_disconnect()
+        results = future.result(5)
+        self.assertEqual(results['joined'], {})
+        self.assertEqual(sorted(results['failed']), channels)
+        for exception in results['failed'].itervalues():
+            self.assertTrue(isinstance(exception, ChatServerError))
+            self.assertEqual(exception.code, 215)
+        # Only the first requests were sent, none once the connection was closed.
+        data = self.received()
+        self.assertEqual([channel for channel in channels if channel in data], channels[:2])
+
+class TestThrottledWhispers(ClientTestCase):
+    config = {'throttle': True, 'throttle_rate': 1.0, 'throttle_burst': 1, 'whisper_timeout': 0.5}
+
+    def test_timeout_starts_when_sent(self):
+        first = self.client.send_whisper('player', 'first')
+        second = self.client.send_whisper('player', 'second')
+        # The second whisper is queued for a second, longer than the whisper timeout.
+        self.assertEqual(first.result(1), True)
+        time.sleep(0.1)
+        self.assertFalse(second.done())
+        self.connection.settimeout(1)
+        while 'second' not in self.connection.recv(4096):
+            pass
+        self.connection.sendall(frame(HON_SC_WHISPER_FAILED))
+        self.assertEqual(second.exception(1).code, 213)
+
+    def test_disconnect(self):
+        self.client.send_whisper('player', 'first')
+        second = self.client.send_whisper('player', 'second')
+        self.client._chat_disconnect()
+        self.assertEqual(second.exception(1).code, 215)
+
+if __name__ == '__main__':
+    unittest.main()
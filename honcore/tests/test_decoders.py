@@ -0,0 +1,93 @@
+import os, struct, unittest
+
+from honcore import constants
+from honcore.constants import *
+from honcore.decoders import decoders
+from honcore.networking import LazyList, PacketParser
+from honcore.schema import client_packets, server_packets, unimplemented
+
+def load_packets():
+    """ Returns the frames in packets.txt, with the comment before each. """
+    packets = []
+    comment = None
+    for line in open(os.path.join(os.path.dirname(__file__), 'packets.txt')):
+        line = line.strip()
+        if line.startswith('#'):
+            comment = line[1:].strip()
+        elif line:
+            packets.append((comment, ''.join(line.split()).decode('hex')))
+    return packets
+
+def plain(value):
+    """ Returns the decoded data as plain dicts and lists, so that it can be compared. """
+    if isinstance(value, dict):
+        return dict((key, plain(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple, LazyList)):
+        return [plain(item) for item in value]
+    if hasattr(value, '__dict__'):
+        return plain(vars(value))
+    return value
+
+class TestDecoders(unittest.TestCase):
+    """ The fast decoders return the same data as the construct parsers for every packet in the corpus. """
+
+    def setUp(self):
+        self.packets = load_packets()
+        self.construct = PacketParser({'fast_decoders': False})
+        self.fast = PacketParser()
+
+    def test_corpus(self):
+        for comment, frame in self.packets:
+            length, = struct.unpack_from('>H', frame)
+            packet_id, = struct.unpack_from('<H', frame, 2)
+            self.assertEqual(length, len(frame) - 2, comment)
+            self.assertTrue(packet_id in decoders, comment)
+            expected = plain(self.construct.parse_data(packet_id, frame[4:]))
+            self.assertEqual(plain(self.fast.parse_data(packet_id, frame[4:])), expected, comment)
+            # As read from the receive buffer, with the data following the ID.
+            self.assertEqual(plain(self.fast.parse_data(packet_id, memoryview(frame), 4)), expected, comment)
+            self.assertEqual(plain(self.construct.parse_data(packet_id, memoryview(frame), 4)), expected, comment)
+
+    def test_lazy_payloads(self):
+        lazy = PacketParser({'lazy_payloads': True})
+        for comment, frame in self.packets:
+            packet_id, = struct.unpack_from('<H', frame, 2)
+            if packet_id in (HON_SC_JOINED_CHANNEL, HON_SC_INITIAL_STATUS):
+                expected = plain(self.construct.parse_data(packet_id, frame[4:]))
+                self.assertEqual(plain(lazy.parse_data(packet_id, frame[4:])), expected, comment)
+
+    def test_operator_records(self):
+        # The records of the operators share one class, rather than one made for each packet.
+        operators = [self.construct.parse_data(HON_SC_JOINED_CHANNEL, frame[4:])['operators'] 
+                     for comment, frame in self.packets[:1] * 2]
+        self.assertTrue(type(operators[0][0]) is type(operators[1][0]))
+
+    def test_every_decoder(self):
+        packet_ids = set(struct.unpack_from('<H', frame, 2)[0] for comment, frame in self.packets)
+        self.assertEqual(packet_ids, set(decoders))
+
+    def test_documented_examples(self):
+        joined = self.fast.parse_data(HON_SC_JOINED_CHANNEL, self.packets[0][1][4:])
+        self.assertEqual(joined['channel'], 'Febelhouse')
+        self.assertEqual([op.op_aid for op in joined['operators']], [5102082])
+        self.assertEqual([(user.nickname, user.account_id) for user in joined['users']], [('[Fem]SmallBot', 5102082)])
+        entered = self.fast.parse_data(HON_SC_ENTERED_CHANNEL, self.packets[1][1][4:])
+        self.assertEqual(entered['channel_id'], 17435)
+        self.assertEqual((entered['user'].nickname, entered['user'].nick_colour, entered['user'].account_icon),
+                         ('[Fem]SmallBot', 'white', 'Default Icon'))
+
+class TestUnimplemented(unittest.TestCase):
+
+    def test_unimplemented(self):
+        report = unimplemented()
+        self.assertTrue('HON_SC_LEFT_CHANNEL' in report['server'])
+        self.assertTrue('HON_CS_JOIN_GAME' in report['client'])
+        self.assertFalse('HON_SC_CHANNEL_MSG' in report['server'])
+        self.assertFalse('HON_CS_WHISPER' in report['client'])
+        for direction, packets in (('server', server_packets), ('client', client_packets)):
+            ids = [getattr(constants, name) for name in report[direction]]
+            self.assertEqual(ids, sorted(ids))
+            self.assertFalse(set(ids) & set(packets))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+
+from honcore.constants import *
+from honcore.encoders import *
+from honcore.schema import client_packets
+from honcore.lib.construct import Struct, Container, String, ULInt8, ULInt16, ULInt32
+
+def string(name, value):
+    return String(name, len(value) + 1, encoding="utf8", padchar="\x00")
+
+def build(name, fields, **values):
+    """ Builds a packet with a construct Struct, the way the chat socket used to. """
+    values = dict((key, unicode(value) if isinstance(value, basestring) else value) 
+                  for key, value in values.iteritems())
+    return Struct(name, ULInt16("id"), *fields).build(Container(**values))
+
+def channel_message(message, channel_id):
+    return build("message", [string("message", message), ULInt32("channel_id")], 
+                 id=HON_CS_CHANNEL_MSG, message=message, channel_id=channel_id)
+
+def whisper(player, message):
+    return build("whisper", [string("player", player), string("message", message)], 
+                 id=HON_CS_WHISPER, player=player, message=message)
+
+def auth_info(account_id, cookie, ip, auth_hash, protocol, invis):
+    return build("login", [ULInt32("aid"), string("cookie", cookie), string("ip", ip), string("auth", auth_hash),
+                           ULInt32("proto"), ULInt8("unknown"), ULInt32("mode")],
+                 id=HON_CS_AUTH_INFO, aid=account_id, cookie=cookie, ip=ip, auth=auth_hash, proto=protocol,
+                 unknown=0x01, mode=0x03 if invis else 0x00)
+
+def private_message(player, message):
+    return build("private_message", [string("player", player), string("message", message)], 
+                 id=HON_CS_PM, player=player, message=message)
+
+def channel(name, packet_id, channel):
+    return build(name, [string("channel", channel)], id=packet_id, channel=channel)
+
+def user_info(nickname):
+    return build("user_info", [string("nickname", nickname)], id=HON_CS_USER_INFO, nickname=nickname)
+
+def join_channel_password(channel, password):
+    return build("join_channel_password", [string("channel", channel), string("password", password)],
+                 id=HON_CS_JOIN_CHANNEL_PASSWORD, channel=channel, password=password)
+
+class TestEncoders(unittest.TestCase):
+    """ The encoders write the same packets as the construct Structs they replace. """
+    strings = ['', 'hello', 'x' * 300, u'unicode', 'Player[Clan]']
+
+    def test_pong(self):
+        self.assertEqual(encode_pong(), build("pong", [], id=HON_CS_PONG))
+
+    def test_channel_message(self):
+        for message in self.strings:
+            for channel_id in (0, 5, 0xFFFFFFFF):
+                self.assertEqual(encode_channel_message(message, channel_id), channel_message(message, channel_id))
+
+    def test_whisper(self):
+        for message in self.strings:
+            self.assertEqual(encode_whisper('Player', message), whisper('Player', message))
+            self.assertEqual(encode_whisper(message, 'hi'), whisper(message, 'hi'))
+
+    def test_auth_info(self):
+        for invis in (True, False):
+            self.assertEqual(encode_auth_info(5102082, 'c' * 32, '1.2.3.4', 'abcdef', 21, invis),
+                             auth_info(5102082, 'c' * 32, '1.2.3.4', 'abcdef', 21, invis))
+
+    def test_private_message(self):
+        for message in self.strings:
+            self.assertEqual(encode_private_message('Player', message), private_message('Player', message))
+
+    def test_join_channel(self):
+        for name in self.strings:
+            self.assertEqual(encode_join_channel(name), channel("join_channel", HON_CS_JOIN_CHANNEL, name))
+
+    def test_leave_channel(self):
+        for name in self.strings:
+            self.assertEqual(encode_leave_channel(name), channel("leave_channel", HON_CS_LEAVE_CHANNEL, name))
+
+    def test_user_info(self):
+        for nickname in self.strings:
+            self.assertEqual(encode_user_info(nickname), user_info(nickname))
+
+    def test_join_channel_password(self):
+        for password in self.strings:
+            self.assertEqual(encode_join_channel_password('channel', password), join_channel_password('channel', password))
+
+    def test_every_encoder(self):
+        self.assertEqual(sorted(encoders), sorted([HON_CS_PONG, HON_CS_CHANNEL_MSG, HON_CS_WHISPER, HON_CS_AUTH_INFO,
+                                                   HON_CS_PM, HON_CS_JOIN_CHANNEL, HON_CS_LEAVE_CHANNEL, 
+                                                   HON_CS_USER_INFO, HON_CS_JOIN_CHANNEL_PASSWORD]))
+
+    def test_channel_broadcast(self):
+        for message in self.strings:
+            self.assertEqual(encode_channel_broadcast(message, [1, 2, 3]), 
+                             [channel_message(message, channel_id) for channel_id in [1, 2, 3]])
+
+    def test_whisper_broadcast(self):
+        players = ['a', 'Player', 'x' * 20]
+        for message in self.strings:
+            self.assertEqual(encode_whisper_broadcast(message, players), 
+                             [whisper(player, message) for player in players])
+
+class TestEncodeInto(unittest.TestCase):
+    """ Layout.encode_into writes the same bytes as Layout.encode, wherever they go in the buffer. """
+    packets = [(HON_CS_CHANNEL_MSG, ('hello', 5)), (HON_CS_WHISPER, (u'Player', 'x' * 300)),
+               (HON_CS_AUTH_INFO, (5102082, 'c' * 32, '1.2.3.4', 'abcdef', 21, 3)), (HON_CS_PONG, ())]
+
+    def check(self, buffer, offset):
+        for packet_id, fields in self.packets:
+            layout = client_packets[packet_id]
+            packet = layout.encode(*fields)
+            written = bytearray(buffer)
+            end = layout.encode_into(written, offset, *fields)
+            self.assertEqual(end, offset + len(packet))
+            self.assertEqual(str(written[offset:end]), packet)
+            self.assertEqual(str(written[:offset]), str(buffer[:offset]).ljust(offset, '\x00'))
+            self.assertEqual(str(written[end:]), str(buffer[end:]))
+
+    def test_start(self):
+        self.check(bytearray(), 0)
+        self.check(bytearray('y' * 1000), 0)
+
+    def test_middle(self):
+        self.check(bytearray('y' * 1000), 10)
+        self.check(bytearray('y' * 20), 10)
+
+    def test_past_end(self):
+        self.check(bytearray(), 4)
+        self.check(bytearray('y' * 10), 30)
+
+if __name__ == '__main__':
+    unittest.main()
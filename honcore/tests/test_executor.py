@@ -0,0 +1,76 @@
+import time, threading, unittest
+
+from honcore.executor import HandlerPool, Future, PendingRequests
+from honcore.exceptions import *
+
+class TestPendingRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = PendingRequests()
+
+    def tearDown(self):
+        self.requests.fail_all(ChatServerError(215))
+
+    def test_no_timeout(self):
+        future = self.requests.add('key', None)
+        self.assertEqual(future.deadline, None)
+        self.assertEqual(self.requests.timer, None)
+        self.requests.expire()
+        self.assertFalse(future.done())
+        self.assertTrue(self.requests.set_result('key', 1))
+        self.assertEqual(future.result(), 1)
+
+    def test_expire_out_of_order(self):
+        slow = self.requests.add('key', 5)
+        fast = self.requests.add('key', 0.05)
+        self.assertEqual(fast.exception(1).code, 210)
+        self.assertFalse(slow.done())
+        self.requests.expire()
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(self.requests.set_result('key', 1))
+        self.assertEqual(slow.result(), 1)
+
+    def test_add_future(self):
+        future = Future(expired_result=True)
+        self.assertEqual(future.deadline, None)
+        time.sleep(0.1)
+        self.requests.add_future('key', future, 0.1)
+        self.assertFalse(future.done())
+        self.assertEqual(future.result(1), True)
+
+class TestHandlerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = HandlerPool(4)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.running = {}
+        self.overlapping = 0    # The most calls run at once for one key.
+        self.parallel = 0       # The most calls run at once in total.
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def handler(self, key, i):
+        with self.lock:
+            self.running[key] = self.running.get(key, 0) + 1
+            self.overlapping = max(self.overlapping, self.running[key])
+            self.parallel = max(self.parallel, sum(self.running.values()))
+        time.sleep(0.02)
+        with self.lock:
+            self.running[key] -= 1
+            self.calls.setdefault(key, []).append(i)
+
+    def test_keys(self):
+        keys = ['a', 'b', 'c']
+        for i in range(5):
+            for key in keys:
+                self.pool.submit(key, self.handler, {'key': key, 'i': i})
+        self.pool.stop()
+        self.assertEqual(self.calls, dict((key, range(5)) for key in keys))
+        self.assertEqual(self.overlapping, 1)
+        self.assertTrue(self.parallel > 1)
+        self.assertEqual(self.pool.queue_depth, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+import errno, socket, struct, threading, time, unittest
+
+from honcore.client import HoNClient
+from honcore.constants import *
+from honcore.exceptions import *
+from honcore.networking import PacketDispatcher, PacketFramer, PacketWriter, SessionMultiplexer, SocketListener
+
+def frame(packet_id, payload=''):
+    """ Returns a packet as received from the chat server, with its length and ID. """
+    body = struct.pack('<H', packet_id) + payload
+    return struct.pack('>H', len(body)) + body
+
+def channel_message(account_id, channel_id, message):
+    return frame(HON_SC_CHANNEL_MSG, struct.pack('<LL', account_id, channel_id) + message + '\x00')
+
+def chat_socket(client):
+    return client._HoNClient__chat_socket
+
+class TestDecodePacket(unittest.TestCase):
+
+    def setUp(self):
+        self.client = HoNClient()
+        self.chat_socket = chat_socket(self.client)
+
+    def test_skipped(self):
+        # Too short for the account and channel IDs, so it fails if it is decoded.
+        malformed = frame(HON_SC_CHANNEL_MSG, '\x01\x00')
+        self.assertEqual(self.chat_socket.decode_packet(malformed), (HON_SC_CHANNEL_MSG, None))
+        self.assertEqual(self.chat_socket.packet_counts[HON_SC_CHANNEL_MSG], 1)
+        self.assertEqual(self.chat_socket.packets_skipped, 1)
+
+        self.client.connect_event(HON_SC_CHANNEL_MSG, lambda account_id, channel_id, message: None)
+        self.assertRaises((HoNCoreError, struct.error), self.chat_socket.decode_packet, malformed)
+        packet_id, data = self.chat_socket.decode_packet(channel_message(1, 2, 'hello'))
+        self.assertEqual(data['message'], 'hello')
+        self.assertEqual(self.chat_socket.packet_counts[HON_SC_CHANNEL_MSG], 3)
+        self.assertEqual(self.chat_socket.packets_skipped, 1)
+
+class TestPacketDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.client = HoNClient()
+        self.client._configure(dispatcher='pool')
+        self.received = []
+        self.done = threading.Event()
+        def on_message(account_id, channel_id, message):
+            self.received.append(message)
+            self.done.set()
+        self.client.connect_event(HON_SC_CHANNEL_MSG, on_message)
+        self.chat_socket = chat_socket(self.client)
+        self.server, self.chat_socket.socket = socket.socketpair()
+        self.chat_socket.framer = PacketFramer()
+        self.chat_socket.connected = True
+        self.chat_socket.dispatcher = PacketDispatcher(self.chat_socket, 2, 10)
+        self.chat_socket.dispatcher.start()
+        self.chat_socket.listener = SocketListener(self.chat_socket)
+        self.chat_socket.listener.start()
+
+    def tearDown(self):
+        self.chat_socket.disconnect()
+        self.server.close()
+
+    def test_malformed_packet(self):
+        # The payload is too short for the account and channel IDs.
+        self.server.sendall(frame(HON_SC_CHANNEL_MSG, '\x01\x00') + channel_message(1, 2, 'hello'))
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.received, ['hello'])
+        self.assertTrue(self.chat_socket.listener.is_alive())
+        self.assertTrue(self.chat_socket.is_connected)
+
+    def test_closed_by_server(self):
+        self.server.close()
+        self.chat_socket.listener.join(5)
+        self.assertFalse(self.chat_socket.is_connected)
+
+class TestPacketWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.writes = []
+        self.socket = self     # The writer only needs sendall from the chat socket's socket.
+        self.error = None
+        self.writer = PacketWriter(self)
+
+    def tearDown(self):
+        self.writer.stop()
+        self.writer.join()
+
+    def sendall(self, data):
+        if self.error is not None:
+            raise self.error
+        self.writes.append(data)
+
+    def wait_for(self, count):
+        end = time.time() + 5
+        while len(self.writes) < count and time.time() < end:
+            time.sleep(0.01)
+
+    def test_priority_and_coalescing(self):
+        messages = [channel_message(1, 2, 'x' * 1000) for i in range(100)]
+        for message in messages:
+            self.writer.put(message)
+        pong = frame(HON_CS_PONG)
+        self.writer.put(pong, priority=True)
+        self.assertEqual(self.writer.queue_depth, 101)
+        self.writer.start()
+        self.wait_for(2)
+        self.assertEqual(len(self.writes), 2)
+        self.assertTrue(self.writes[0].startswith(pong))
+        self.assertTrue(len(self.writes[0]) <= 65536)
+        self.assertTrue(len(self.writes[0]) + len(messages[0]) > 65536)
+        self.assertEqual(''.join(self.writes), pong + ''.join(messages))
+        self.assertEqual(self.writer.queue_depth, 0)
+        self.assertEqual(self.writer.bytes_in_flight, 0)
+
+    def test_error(self):
+        self.error = socket.error(errno.EPIPE, 'Broken pipe')
+        self.writer.max_write = 10
+        for i in range(5):
+            self.writer.put(channel_message(1, 2, 'hello'))
+        self.writer.start()
+        self.writer.join(5)
+        self.assertFalse(self.writer.is_alive())
+        self.assertEqual(self.writer.queue_depth, 0)
+        self.assertEqual(self.writer.bytes_in_flight, 0)
+        self.assertRaises(socket.error, self.writer.put, channel_message(1, 2, 'hello'))
+
+class TestSessionMultiplexer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.multiplexer = SessionMultiplexer(poll_timeout=0.05)
+        self.lock = threading.Lock()
+        self.received = []
+        self.clients = []
+        self.connections = []
+        for i in range(3):
+            client = HoNClient()
+            self.multiplexer.add(client)
+            client.connect_event(HON_SC_CHANNEL_MSG, self.on_message)
+            chat_socket(client).connect('127.0.0.1', self.server.getsockname()[1])
+            self.clients.append(client)
+            self.connections.append(self.server.accept()[0])
+        self.multiplexer.start()
+
+    def tearDown(self):
+        self.multiplexer.stop()
+        for client in self.clients:
+            client._chat_disconnect()
+        for connection in self.connections:
+            connection.close()
+        self.server.close()
+
+    def on_message(self, account_id, channel_id, message):
+        with self.lock:
+            self.received.append((channel_id, message))
+
+    def wait_for(self, count):
+        end = time.time() + 5
+        while len(self.received) < count and time.time() < end:
+            time.sleep(0.01)
+
+    def test_sessions(self):
+        self.assertEqual(len(self.multiplexer.sockets), 3)
+        start = time.time()
+        self.multiplexer.stats()
+        for i, connection in enumerate(self.connections):
+            connection.sendall(''.join(channel_message(1, i, 'm%d' % n) for n in range(i + 1)))
+        self.wait_for(6)
+        stats = self.multiplexer.stats()
+        elapsed = time.time() - start
+        self.assertEqual(sorted(self.received), [(0, 'm0'), (1, 'm0'), (1, 'm1'), (2, 'm0'), (2, 'm1'), (2, 'm2')])
+        for i, client in enumerate(self.clients):
+            self.assertEqual(client.packets_received, i + 1)
+            self.assertTrue(stats['sessions'][client] >= (i + 1) / elapsed)
+        self.assertAlmostEqual(stats['total'], sum(stats['sessions'].values()))
+        self.assertEqual(self.multiplexer.stats()['sessions'][self.clients[0]], 0)
+
+    def test_closed_by_server(self):
+        self.connections[1].close()
+        end = time.time() + 5
+        while len(self.multiplexer.sockets) > 2 and time.time() < end:
+            time.sleep(0.01)
+        self.assertEqual(len(self.multiplexer.sockets), 2)
+        self.assertFalse(chat_socket(self.clients[1]).is_connected)
+        self.connections[0].sendall(channel_message(1, 0, 'hello'))
+        self.wait_for(1)
+        self.assertEqual(self.received, [(0, 'hello')])
+
+class TestReconnect(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.client = HoNClient()
+        self.client._configure(dispatcher='pool', dispatch_workers=4, send_queue=True)
+
+    def tearDown(self):
+        self.client._chat_disconnect()
+        self.server.close()
+
+    def test_disconnect_stops_threads(self):
+        threads = threading.active_count()
+        for i in range(3):
+            chat_socket(self.client).connect('127.0.0.1', self.port)
+            self.assertEqual(threading.active_count(), threads + 6)
+            self.client._chat_disconnect()
+            self.assertEqual(threading.active_count(), threads)
+
+    def test_connect_stops_earlier_threads(self):
+        threads = threading.active_count()
+        for i in range(3):
+            chat_socket(self.client).connect('127.0.0.1', self.port)
+            self.assertEqual(threading.active_count(), threads + 6)
+
+    def test_unknown_dispatcher(self):
+        threads = threading.active_count()
+        for dispatcher in ('bogus', 'pool ', None):
+            self.client._configure(dispatcher=dispatcher)
+            try:
+                chat_socket(self.client).connect('127.0.0.1', self.port)
+            except HoNConfigError, e:
+                self.assertEqual(e.code, 15)
+            else:
+                self.fail("Connected with the dispatcher %r." % dispatcher)
+            self.assertFalse(chat_socket(self.client).is_connected)
+        self.assertEqual(threading.active_count(), threads)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import time, threading, unittest
+
+from honcore.scheduler import MessageScheduler
+from honcore.exceptions import *
+
+class TestMessageScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.lock = threading.Lock()
+        self.scheduler = None
+
+    def tearDown(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler.join()
+
+    def start(self, send=None, **kwargs):
+        self.scheduler = MessageScheduler(send or self.send, **kwargs)
+        self.scheduler.start()
+        return self.scheduler
+
+    def send(self, data):
+        with self.lock:
+            self.sent.append(data)
+
+    def wait_for(self, count, timeout=2.0):
+        end = time.time() + timeout
+        while len(self.sent) < count and time.time() < end:
+            time.sleep(0.01)
+        return len(self.sent)
+
+    def test_configure_keeps_queue(self):
+        scheduler = self.start(rate=0.1, burst=1)
+        for i in range(3):
+            scheduler.submit('key', 'm%d' % i, lambda message: message)
+        self.assertEqual(self.wait_for(1), 1)
+        time.sleep(0.1)
+        self.assertEqual(len(self.sent), 1)
+        scheduler.configure(50.0, 1, 50.0, 10, False)
+        self.assertEqual(self.wait_for(3), 3)
+        self.assertEqual(self.sent, ['m0', 'm1', 'm2'])
+
+    def test_send_failure(self):
+        def send(data):
+            raise IOError("closed")
+        scheduler = self.start(send)
+        errors = []
+        done = threading.Event()
+        def sent(error):
+            errors.append(error)
+            if error is not None:
+                done.set()
+        scheduler.submit('key', 'message', lambda message: message, sent)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(errors[0], None)
+        self.assertTrue(isinstance(errors[1], IOError))
+
+if __name__ == '__main__':
+    unittest.main()